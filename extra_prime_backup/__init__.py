@@ -1,12 +1,20 @@
+import itertools
+import hashlib
 import json
 import os
 import re
+import shutil
+import sqlite3
+import sys
 import threading
 from copy import deepcopy, copy
-from queue import Queue, Empty
+from concurrent.futures import Executor, ThreadPoolExecutor
+from collections import deque
+from contextlib import contextmanager
+from queue import Queue, Empty, PriorityQueue
 from threading import RLock
 from types import MethodType
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 import functools, inspect
 from mcdreforged.api.all import *
 from mcdreforged.plugin.type.plugin import AbstractPlugin
@@ -15,6 +23,12 @@ import time
 # noinspection PyUnresolvedReferences
 import minecraft_data_api as api
 
+from . import region, snbt
+from .backup_reader import BackupReader, BackupReadError, read_blocks
+from .history import CheckHistory, KIND_GATE, KIND_BACKUP
+from .rcon import RconPool
+from .store import CheckpointStore, thaw_tree
+
 # ---------- Config ---------
 PBCHECKPOINT = os.path.join('check_point.json')
 
@@ -27,7 +41,8 @@ class PermissionConfig(Serializable):
     """权限配置类"""
     permissions: dict = {
         'list': 1, 'status': 1, 'del': 3, 'update': 2, 'add': 2,
-        'add_group': 3, 'add_to_group': 2, 'ignore': 4, 'help': 0, 'helpc': 0
+        'add_group': 3, 'add_to_group': 2, 'ignore': 4, 'help': 0, 'helpc': 0, 'inspect': 1, 'history': 1, 'trace': 2,
+        'watch': 1
     }
 
 
@@ -53,6 +68,11 @@ class ParseConfig(Serializable):
     block_info_command: str = 'info block get {x} {y} {z}'
     block_info_regex: re.Pattern = re.compile(r"Block info for (?P<block>minecraft:[\w_]+),")
     block_value_regex: re.Pattern = re.compile(r"(\w+)=([A-Z_]+|\w+)")
+    test_result_regex: re.Pattern = re.compile(r"Test (?P<result>passed|failed)")
+    unloaded_regex: re.Pattern = re.compile(r"(That|This) position is not loaded")
+    block_data_error_regex: re.Pattern = re.compile(r"The target block is not a block entity")
+    score_error_regex: re.Pattern = re.compile(r"Can't get value of|Unknown scoreboard objective|none is set")
+    save_done_regex: re.Pattern = re.compile(r"Saved the game")
 
 
 class PbCheckPoint(Serializable):
@@ -65,6 +85,47 @@ class PbCheckPoint(Serializable):
     tree: dict = {}
     override_mode: str = "event"
 
+    # 未加载区块中检查点的处理方式：fail=直接判定失败，forceload=临时强制加载，region=读取区域文件
+    unloaded_policy: str = "fail"
+
+    # 方块查询方式：info=Carpet 的 info block，execute=原版 execute if block（仅在不匹配时才用 info block 获取详情）
+    query_backend: str = "info"
+
+    # 备份检查方式：query=逐个查询检查点，datapack=生成数据包函数一次检查所有检查点
+    gate_mode: str = "query"
+    # 生成数据包时使用的 pack_format
+    datapack_format: int = 48
+
+    # 增量检查：save-all 后跳过自上次确认关闭以来区块未被保存过的检查点
+    incremental_check: bool = False
+
+    # MCDR 启用 RCON 时使用的并发连接数，0 表示不使用 RCON
+    rcon_pool_size: int = 2
+
+    # 日志匹配查询超时后的重试次数，以及响应慢于 p95 时是否再发送一次查询
+    query_retries: int = 2
+    query_hedge: bool = True
+
+    # 追踪记录缓冲区大小，以及是否在日志中输出每次查询的详情
+    trace_size: int = 500
+    debug_log: bool = False
+
+    # 指令工作线程数与排队上限（备份任务不受上限限制）
+    worker_count: int = 2
+    queue_size: int = 16
+
+    # 备份完成后从 PrimeBackup 的备份文件中读取检查点状态进行复核
+    post_backup_verify: bool = False
+    # 等待备份完成的最长时间（秒）
+    backup_wait_timeout: int = 600
+
+    # !!pb cp watch 的最长监视时间与最大轮询间隔（秒）
+    watch_timeout: int = 600
+    watch_max_interval: float = 10
+
+    # 检查点的存储方式：json=保存在本配置文件的 tree 中，sqlite=保存在数据目录的 checkpoints.db 中（按需读取，修改时只写入变化的行）
+    storage: str = "json"
+
     # 兼容旧数据的属性
     check_point: dict = {}
     groups: dict = {}
@@ -75,6 +136,421 @@ CP_CONFIG: PbCheckPoint
 
 def save_config(path: str = PBCHECKPOINT):
     PlServer.save_config_simple(CP_CONFIG, path)
+    rebuild_index()
+
+
+# ---------- CheckPoint Index ---------
+# 规范化后的方块属性 -> 唯一的元组实例
+_STATE_POOL: Dict[tuple, tuple] = {}
+
+
+def intern_block(block: str) -> str:
+    return sys.intern(str(block))
+
+
+def _state_value(value) -> str:
+    # JSON 中的 true/false 与方块属性中的字符串保持一致
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return sys.intern(str(value))
+
+
+def intern_state(data: dict) -> tuple:
+    """将方块属性转换为排序后的 (键, 值) 元组，相同内容始终返回同一个对象"""
+    state = tuple(sorted((sys.intern(str(k)), _state_value(v)) for k, v in data.items()))
+    return _STATE_POOL.setdefault(state, state)
+
+
+class MatchRule:
+    """
+    检查点的匹配规则，加载时编译，检查时只做集合查找
+    检查点的 match 字段（均为可选）：
+      blocks: 额外允许的方块 id 列表
+      properties: 只比较这些属性（白名单）
+      ignore: 不比较的属性
+      allow: {属性: [允许的取值...]}，未列出的属性须等于 data 中的值
+    """
+    __slots__ = ('blocks', 'allowed', '_cache')
+
+    def __init__(self, block: str, state: tuple, config: dict):
+        expected = dict(state)
+        allow = config.get('allow', {})
+        self.blocks = frozenset(intern_block(b) for b in [block, *config.get('blocks', [])])
+        if 'properties' in config:
+            keys = set(config['properties'])
+        else:
+            keys = set(expected) | set(allow)
+        keys -= set(config.get('ignore', []))
+
+        # 属性 -> 允许的取值，None 表示该属性不应存在
+        self.allowed: Dict[str, frozenset] = {}
+        for key in keys:
+            if key in allow:
+                values = frozenset(_state_value(v) for v in allow[key])
+            else:
+                values = frozenset([expected.get(key)])
+            self.allowed[sys.intern(str(key))] = values
+        self._cache: Dict[tuple, bool] = {}
+
+    def block_matches(self, block: str) -> bool:
+        return block in self.blocks
+
+    def state_matches(self, state: tuple) -> bool:
+        verdict = self._cache.get(state)
+        if verdict is None:
+            actual = dict(state)
+            verdict = all(actual.get(key) in values for key, values in self.allowed.items())
+            self._cache[state] = verdict
+        return verdict
+
+    def describe(self, block: str) -> list:
+        """用于状态显示的规则说明"""
+        lines = []
+        extra_blocks = sorted(self.blocks - {block})
+        if extra_blocks:
+            lines.append(f'§b允许方块§7: §e{", ".join(extra_blocks)}')
+        for key, values in sorted(self.allowed.items()):
+            shown = '/'.join(sorted('§8无§e' if v is None else v for v in values))
+            lines.append(f'§b{key}§7: §e{shown}')
+        if not self.allowed:
+            lines.append('§7不比较方块属性')
+        return lines
+
+
+def compile_nbt_assertions(config: dict) -> Optional[tuple]:
+    """
+    编译检查点的 nbt 字段：{NBT 路径: 期望值}
+    返回: ((路径文本, 路径, 期望值), ...)，没有断言时返回 None
+    """
+    if not isinstance(config, dict) or not config:
+        return None
+    return tuple((str(path), snbt.parse_path(str(path)), expected) for path, expected in sorted(config.items()))
+
+
+def nbt_matches(value, expected) -> bool:
+    """
+    比较方块实体数据中的值，value 为 snbt.MISSING 表示路径不存在
+    期望值为 null 时要求路径不存在，为 [] 时路径不存在或为空列表均可
+    数字按数值比较（忽略 b/s/l/f/d 后缀），true/false 与 1/0 等价
+    """
+    if expected is None:
+        return value is snbt.MISSING
+    if expected == [] and not isinstance(expected, bool):
+        return value is snbt.MISSING or value == []
+    if value is snbt.MISSING:
+        return False
+    if isinstance(expected, (bool, int, float)):
+        return isinstance(value, (bool, int, float)) and value == expected
+    return value == expected
+
+
+# 单个检查点最多生成的 execute if block 谓词数量
+MAX_PREDICATES = 8
+
+
+def build_predicates(block: str, state: tuple, rule: Optional[MatchRule]) -> Optional[tuple]:
+    """
+    生成 execute if block 使用的方块谓词，任意一个通过即视为匹配
+    规则无法用谓词准确表达或组合过多时返回 None，此时回退到 info block
+    额外允许的方块可能没有这些属性，带属性的谓词会被服务端判定为语法错误，因此只在不比较属性时使用
+    """
+    if rule is None:
+        blocks = [block]
+        choices = [[(k, v)] for k, v in state]
+    else:
+        if any(None in values for values in rule.allowed.values()):
+            return None
+        if rule.allowed and len(rule.blocks) > 1:
+            return None
+        blocks = sorted(rule.blocks)
+        choices = [[(k, v) for v in sorted(values)] for k, values in sorted(rule.allowed.items())]
+    count = len(blocks)
+    for values in choices:
+        count *= len(values)
+    if count == 0 or count > MAX_PREDICATES:
+        return None
+    predicates = []
+    for b in blocks:
+        for combo in itertools.product(*choices):
+            props = ','.join(f'{k}={v}' for k, v in combo)
+            predicates.append(f'{b}[{props}]' if props else b)
+    return tuple(predicates)
+
+
+class CheckPoint:
+    """检查点在内存中的紧凑表示，方块名与属性均已驻留，可直接按身份比较"""
+    __slots__ = ('path', 'x', 'y', 'z', 'world', 'block', 'state', 'rule', 'predicates', 'nbt')
+
+    def __init__(self, path: str, item: dict):
+        self.path: str = path
+        self.x: int = item['x']
+        self.y: int = item['y']
+        self.z: int = item['z']
+        self.world: str = sys.intern(str(item.get('world', 'overworld')).lower())
+        self.block: str = intern_block(item.get('block', ''))
+        self.state: tuple = intern_state(item.get('data', {}))
+        self.rule: Optional[MatchRule] = None
+        rule_config = item.get('match')
+        if isinstance(rule_config, dict) and rule_config:
+            self.rule = MatchRule(self.block, self.state, rule_config)
+        self.predicates: Optional[tuple] = build_predicates(self.block, self.state, self.rule)
+        # 方块实体数据断言，需要额外使用 data get block 查询
+        self.nbt: Optional[tuple] = compile_nbt_assertions(item.get('nbt'))
+
+    @property
+    def data(self) -> dict:
+        return dict(self.state)
+
+    def signature(self) -> str:
+        """稳定的配置摘要，检查点的位置、期望状态或匹配规则变化时随之改变"""
+        rule = ''
+        if self.rule is not None:
+            allowed = sorted((k, sorted(str(v) for v in values)) for k, values in self.rule.allowed.items())
+            rule = f'{sorted(self.rule.blocks)}{allowed}'
+        signature = f'{self.world}|{self.x},{self.y},{self.z}|{self.block}|{self.state}|{rule}'
+        if self.nbt is not None:
+            signature += '|' + json.dumps([[path, expected] for path, _, expected in self.nbt], sort_keys=True)
+        return signature
+
+    def block_matches(self, block: str) -> bool:
+        return block is self.block if self.rule is None else self.rule.block_matches(block)
+
+    def state_matches(self, state: tuple) -> bool:
+        return state is self.state if self.rule is None else self.rule.state_matches(state)
+
+    def matches(self, block: str, state: tuple) -> bool:
+        """block 与 state 须已经过 intern_block / intern_state"""
+        return self.block_matches(block) and self.state_matches(state)
+
+
+# ---------- Tree Snapshot ---------
+class TreeSnapshot:
+    """
+    某一版本检查点配置的只读视图，每次修改配置都会发布新的快照
+    检查、列表等读取方取一次 CP_SNAPSHOT 即可在整个过程中看到一致的数据，无需加锁
+    快照中的字典一经发布不再修改，修改配置须通过 edit_tree() 在副本上进行
+    使用 SQLite 存储时 tree 为 None，树状结构与索引在首次访问时才从存储中读取
+    """
+    __slots__ = ('version', '_tree', 'check_point', 'groups', 'store', '_index', '_paths', '_lock')
+
+    def __init__(self, version: int, tree: Optional[dict], check_point: dict, groups: dict,
+                 store: Optional[CheckpointStore] = None):
+        self.version = version
+        self._tree = tree
+        # 兼容旧数据
+        self.check_point = check_point
+        self.groups = groups
+        self.store = store
+        self._index: Optional[list] = None
+        self._paths: Optional[Dict[str, CheckPoint]] = None
+        self._lock = threading.RLock()
+
+    @property
+    def tree(self) -> dict:
+        if self._tree is None:
+            with self._lock:
+                if self._tree is None:
+                    self._tree = self.store.load_tree()
+        return self._tree
+
+    @property
+    def indexed(self) -> bool:
+        return self._index is not None
+
+    @property
+    def index(self) -> list:
+        """所有检查点的索引"""
+        if self._index is None:
+            self._build_index()
+        return self._index
+
+    @property
+    def paths(self) -> Dict[str, CheckPoint]:
+        if self._index is None:
+            self._build_index()
+        return self._paths
+
+    def _build_index(self):
+        with self._lock:
+            if self._index is not None:
+                return
+            index = []
+            for path, item in collect_checkpoints(self.tree, self.check_point):
+                try:
+                    index.append(CheckPoint(path, item))
+                except Exception as e:
+                    PlServer.logger.warning(f'[ExtraPrimeBackup] 检查点 {path} 配置无效，已跳过: {e}')
+            paths = {}
+            for record in index:
+                # 与 status 的查找顺序一致：树状结构优先于旧数据
+                paths.setdefault(record.path, record)
+            self._paths = paths
+            self._index = index
+
+    def find(self, path: str) -> Optional[dict]:
+        """查找检查点配置，树状结构优先于旧数据；尚未从存储中读取完整配置时只读取这一个检查点"""
+        if self._tree is None and self.store is not None:
+            item = self.store.get(path)
+            return item if item is not None and item['type'] == 'checkpoint' else None
+        current = {'children': self.tree}
+        for part in path.split('.'):
+            current = current.get('children', {}).get(part)
+            if current is None:
+                break
+        if current is not None and current.get('type') == 'checkpoint':
+            return current
+        return self.check_point.get(path)
+
+    def record(self, path: str, item: dict) -> CheckPoint:
+        """已建立索引时复用其中的检查点"""
+        record = self._paths.get(path) if self._index is not None else None
+        return record or CheckPoint(path, item)
+
+    def count(self, group_path: str) -> int:
+        """分组（含子分组）中的检查点数量"""
+        if self._index is None and self.store is not None:
+            return self.store.count_checkpoints(group_path)
+        prefix = group_path + '.'
+        return sum(1 for item in self.index if item.path == group_path or item.path.startswith(prefix))
+
+
+CP_SNAPSHOT: Optional[TreeSnapshot] = None
+# 修改配置的线程依次进行，读取快照不受影响
+tree_write_lock = threading.RLock()
+# storage 为 sqlite 时的检查点存储
+checkpoint_store: Optional[CheckpointStore] = None
+
+
+def collect_checkpoints(tree: dict, check_point: dict) -> list:
+    """按顺序收集树状结构和旧数据中的所有检查点，返回 [(完整路径, 检查点数据)]"""
+    checkpoints = []
+
+    def walk(tree_dict, path_prefix=""):
+        for name, item in tree_dict.items():
+            full_name = f"{path_prefix}.{name}" if path_prefix else name
+            if item['type'] == 'checkpoint':
+                checkpoints.append((full_name, item))
+            elif item['type'] == 'group':
+                walk(item.get('children', {}), full_name)
+
+    walk(tree)
+    checkpoints.extend(check_point.items())
+    return checkpoints
+
+
+def publish_snapshot(snapshot: TreeSnapshot):
+    global CP_SNAPSHOT
+    CP_SNAPSHOT = snapshot
+    if CP_CONFIG.gate_mode == 'datapack':
+        refresh_datapack()
+
+
+def rebuild_index():
+    """根据 CP_CONFIG 或检查点存储发布新版本的快照"""
+    with tree_write_lock:
+        version = CP_SNAPSHOT.version + 1 if CP_SNAPSHOT is not None else 1
+        if checkpoint_store is not None:
+            publish_snapshot(TreeSnapshot(version, None, {}, {}, checkpoint_store))
+        else:
+            publish_snapshot(TreeSnapshot(version, CP_CONFIG.tree, CP_CONFIG.check_point, CP_CONFIG.groups))
+
+
+class TreeDraft:
+    """edit_tree() 中可以修改的配置副本"""
+    __slots__ = ('base', 'tree', 'check_point', 'groups')
+
+    def __init__(self, snapshot: TreeSnapshot):
+        self.base = snapshot
+        self.tree = thaw_tree(snapshot.tree)
+        self.check_point = deepcopy(snapshot.check_point)
+        self.groups = deepcopy(snapshot.groups)
+
+    def commit(self):
+        """保存修改并发布新快照"""
+        if checkpoint_store is not None:
+            # 只写入变化的行，配置文件中不再保存检查点
+            checkpoint_store.apply(self.base.tree, self.tree)
+            publish_snapshot(TreeSnapshot(self.base.version + 1, self.tree, {}, {}, checkpoint_store))
+            return
+        CP_CONFIG.tree, CP_CONFIG.check_point, CP_CONFIG.groups = self.tree, self.check_point, self.groups
+        save_config()
+
+
+@contextmanager
+def edit_tree():
+    """
+    在当前快照的副本上修改配置，修改者之间互斥；调用 draft.commit() 后保存并原子地替换 CP_SNAPSHOT
+    未提交（提前返回或出现异常）时副本直接丢弃，读取方始终看不到修改到一半的配置
+    """
+    with tree_write_lock:
+        yield TreeDraft(CP_SNAPSHOT)
+
+
+# ---------- Checkpoint Storage ---------
+STORAGE_MODES = ('json', 'sqlite')
+CHECKPOINT_STORE_FILE = 'checkpoints.db'
+
+
+def merge_legacy(tree: dict, check_point: dict, groups: dict) -> dict:
+    """
+    将旧数据合并到树状结构：旧分组转换为同名分组，不属于任何分组的检查点放在根级别
+    与树状结构中已有名字冲突的检查点跳过
+    """
+    result = thaw_tree(tree)
+    placed = set()
+    for group_name, group_data in groups.items():
+        names = [name for name in group_data.get('items', []) if name in check_point and name not in placed]
+        if not names:
+            continue
+        group = result.setdefault(group_name, {'type': 'group', 'description': group_data.get('description', ''), 'children': {}})
+        if group.get('type') != 'group':
+            PlServer.logger.warning(f'[ExtraPrimeBackup] 旧分组 {group_name} 与已有检查点重名，其中的检查点将放在根级别')
+            continue
+        for name in names:
+            if name in group['children']:
+                PlServer.logger.warning(f'[ExtraPrimeBackup] 旧检查点 {group_name}.{name} 与已有配置重名，已跳过')
+            else:
+                group['children'][name] = {**check_point[name], 'type': 'checkpoint'}
+            placed.add(name)
+    for name, item in check_point.items():
+        if name in placed:
+            continue
+        if name in result:
+            PlServer.logger.warning(f'[ExtraPrimeBackup] 旧检查点 {name} 与已有配置重名，已跳过')
+        else:
+            result[name] = {**item, 'type': 'checkpoint'}
+    return result
+
+
+def open_checkpoint_store() -> Optional[CheckpointStore]:
+    """
+    按 storage 配置准备检查点存储，返回 SQLite 存储，使用配置文件时返回 None
+    切换存储方式时一次性迁移已有的检查点：迁移到 SQLite 前的配置文件另存为 .bak，迁回配置文件后数据库重命名为 .migrated
+    """
+    data_folder = PlServer.get_data_folder()
+    db_path = os.path.join(data_folder, CHECKPOINT_STORE_FILE)
+    config_path = os.path.join(data_folder, PBCHECKPOINT)
+    if CP_CONFIG.storage != 'sqlite':
+        if os.path.isfile(db_path) and not CP_CONFIG.tree and not CP_CONFIG.check_point:
+            CP_CONFIG.tree = CheckpointStore(db_path).load_tree()
+            PlServer.save_config_simple(CP_CONFIG, PBCHECKPOINT)
+            os.replace(db_path, db_path + '.migrated')
+            PlServer.logger.info('[ExtraPrimeBackup] 已将检查点从 SQLite 迁回配置文件')
+        return None
+
+    store = CheckpointStore(db_path)
+    if CP_CONFIG.tree or CP_CONFIG.check_point or CP_CONFIG.groups:
+        if os.path.isfile(config_path):
+            shutil.copyfile(config_path, config_path + '.bak')
+        existing = store.load_tree()
+        merged = thaw_tree(existing)
+        merged.update(merge_legacy(CP_CONFIG.tree, CP_CONFIG.check_point, CP_CONFIG.groups))
+        store.apply(existing, merged)
+        CP_CONFIG.tree, CP_CONFIG.check_point, CP_CONFIG.groups = {}, {}, {}
+        PlServer.save_config_simple(CP_CONFIG, PBCHECKPOINT)
+        PlServer.logger.info(f'[ExtraPrimeBackup] 已将检查点迁移到 {CHECKPOINT_STORE_FILE}'
+                             f'（共 {store.count_checkpoints()} 个），原配置文件已备份为 {PBCHECKPOINT}.bak')
+    return store
 
 
 # ---------- Helper Functions ---------
@@ -112,54 +588,1355 @@ def get_player_world(source: CommandSource) -> Optional[str]:
         return None
 
 
+# ---------- Trace ---------
+class TraceRecord:
+    __slots__ = ('id', 'parent', 'depth', 'name', 'start', 'duration', 'detail')
+
+    def __init__(self, record_id: int, parent: int, depth: int, name: str, start: float, detail: dict):
+        self.id = record_id
+        self.parent = parent
+        self.depth = depth
+        self.name = name
+        self.start = start
+        self.duration = 0.0
+        self.detail = detail
+
+
+class Tracer:
+    """
+    固定大小的环形缓冲区，记录查询与备份各阶段的耗时
+    span 可以嵌套，子阶段先于父阶段结束并写入缓冲区
+    """
+
+    def __init__(self, size: int):
+        self.records = deque(maxlen=max(0, size))
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+
+    def resize(self, size: int):
+        if self.records.maxlen != max(0, size):
+            self.records = deque(self.records, maxlen=max(0, size))
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name: str, **detail):
+        stack = self._stack()
+        record = TraceRecord(next(self._ids), stack[-1].id if stack else 0, len(stack), name, time.time(), detail)
+        stack.append(record)
+        try:
+            yield record
+        finally:
+            stack.pop()
+            record.duration = time.time() - record.start
+            self.records.append(record)
+
+    def event(self, name: str, start: float, end: float, **detail):
+        """记录一段已经结束的阶段"""
+        stack = self._stack()
+        record = TraceRecord(next(self._ids), stack[-1].id if stack else 0, len(stack), name, start, detail)
+        record.duration = end - start
+        self.records.append(record)
+
+    def recent(self, count: int) -> list:
+        """最近结束的 count 条记录，按开始时间排序"""
+        records = list(self.records)[-count:] if count > 0 else []
+        return sorted(records, key=lambda record: (record.start, record.depth))
+
+    def export(self) -> list:
+        """以元组形式导出所有记录，用于重载时交接"""
+        return [(r.id, r.parent, r.depth, r.name, r.start, r.duration, r.detail) for r in list(self.records)]
+
+    def restore(self, records: list):
+        """导入 export() 导出的记录，新记录的 id 接在其后"""
+        last_id = 0
+        for record_id, parent, depth, name, start, duration, detail in records:
+            record = TraceRecord(record_id, parent, depth, name, start, detail)
+            record.duration = duration
+            self.records.append(record)
+            last_id = max(last_id, record_id)
+        self._ids = itertools.count(last_id + 1)
+
+
+tracer = Tracer(500)
+
+
 # ---------- InfoManager ---------
+# RCON 出错后暂停使用的时间（秒），期间回退到日志匹配
+RCON_RETRY_INTERVAL = 30
+# 响应时间样本不足时使用的超时时间（秒）
+DEFAULT_QUERY_TIMEOUT = 1
+MIN_QUERY_TIMEOUT = 0.2
+MAX_QUERY_TIMEOUT = 5
+# 超时时间 = p99 响应时间 * TIMEOUT_FACTOR
+TIMEOUT_FACTOR = 3
+LATENCY_WINDOW = 100
+LATENCY_MIN_SAMPLES = 10
+# 第 n 次重试前等待 RETRY_BACKOFF * 2^(n-1) 秒
+RETRY_BACKOFF = 0.1
+# 查询结束时仍有未响应的指令，则发送屏障指令：读取不存在的记分项，其报错中带有唯一的记分项名
+# 服务端按顺序执行指令，屏障的响应之前到达的都是迟到的响应，不会被下一次查询采用
+BARRIER_COMMAND = '/scoreboard players get #epb {objective}'
+# 下一次查询等待屏障响应的最长时间，以及屏障一直没有响应时放弃等待的时间（秒）
+BARRIER_TIMEOUT = 2 * MAX_QUERY_TIMEOUT
+BARRIER_EXPIRE = 60
+# 重载后等待旧实例结束查询时的检查间隔（秒）
+PREVIOUS_POLL_INTERVAL = 0.05
+
+
+class LatencyTracker:
+    """最近若干次查询响应时间的滑动窗口"""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def samples(self) -> list:
+        with self._lock:
+            return list(self._samples)
+
+    def extend(self, samples: list):
+        with self._lock:
+            self._samples.extend(samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """样本不足时返回 None"""
+        with self._lock:
+            if len(self._samples) < LATENCY_MIN_SAMPLES:
+                return None
+            samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+
 class BlockInfoGetter:
     ALLOWED_WORLDS = {"overworld", "the_nether", "the_end"}
 
     def __init__(self, server: PluginServerInterface):
         self.server: PluginServerInterface = server
-        self.block_name: str = ''
-        self.block_data: dict = {}
-        self.__TIMEOUT = 1
-        self._lock = threading.Lock()
+        # 超时后的重试次数与是否在 p95 响应时间后发送对冲查询
+        self.retries: int = 2
+        self.hedge: bool = True
+        # 是否在日志中输出每次查询的详情
+        self.debug_log: bool = False
+        self.latency = LatencyTracker()
+        # 日志匹配同一时间只能等待一条输出
+        self._lock = threading.RLock()
+        # 当前等待的输出
+        self._expect: Optional[re.Pattern] = None
+        self._expect_fail: Optional[re.Pattern] = None
+        self._match: Optional[re.Match] = None
+        self._failed: bool = False
+        self._unloaded_seen: bool = False
+        self._responded_at: float = 0
+        # 当前查询已收到的响应行数，一次查询可能因重试和对冲发送多次指令
+        self._received: int = 0
+        self._cond = threading.Condition()
+        # 等待中的屏障响应中的文本及发送时间，日志中的响应没有请求 ID，只能靠屏障区分迟到的响应
+        self._barrier: Optional[str] = None
+        self._barrier_at: float = 0
+        self._barrier_ids = itertools.count(1)
+        # 每次查询递增，on_info 据此丢弃匹配完成时查询已经换了的输出
+        self._query_seq: int = 0
+        # 每个线程各自的查询结果状态
+        self._local = threading.local()
+        # 返回重载前的实例是否仍可能在等待服务端输出的函数，两个实例读取同一份输出，期间本实例不从日志中查询
+        self.previous_busy = None
+        # RCON 连接池，未启用时为 None
+        self.rcon: Optional[RconPool] = None
+        self._rcon_retry_at: float = 0
+        # 服务端不支持 execute if loaded（1.19.4 以前）或 info block（没有 Carpet）时不再发送，服务端重启后重新检测
+        self.supports_loaded: bool = True
+        self.supports_info: bool = True
+        # 配置的查询方式，为 info 时 info block 是唯一的查询手段，被拒绝时只让这一次查询失败
+        self.query_backend: str = 'info'
+        self.info_warned: bool = False
+
+    @property
+    def last_unloaded(self) -> bool:
+        """当前线程最近一次查询是否因区块未加载而失败"""
+        return getattr(self._local, 'unloaded', False)
+
+    @last_unloaded.setter
+    def last_unloaded(self, value: bool):
+        self._local.unloaded = value
+
+    @property
+    def last_failed(self) -> bool:
+        """当前线程最近一次查询的输出是否匹配了 fail_regex"""
+        return getattr(self._local, 'failed', False)
+
+    @last_failed.setter
+    def last_failed(self, value: bool):
+        self._local.failed = value
 
     def on_info(self, info: Info):
-        if not info.is_user:
-            if (m := ParseConfig.block_info_regex.search(info.content)) is not None:
-                if self.block_name == '':
-                    self.server.logger.info('block entity data output match found: {}'.format(m.groupdict()))
-                    self.block_name = m.group('block')
-                    self.block_data = {key: val for key, val in ParseConfig.block_value_regex.findall(info.content)}
-                    self.server.logger.info('block entity data output match found: {}'.format(self.block_data))
-
-    def get_block_info(self, x, y, z, world):
+        if info.is_user:
+            return
+        barrier = self._barrier
+        if barrier is not None:
+            # 屏障响应之前的输出都是之前查询的迟到响应
+            if barrier in info.content:
+                with self._cond:
+                    self._barrier = None
+                    self._cond.notify_all()
+            return
+        seq = self._query_seq
+        expect = self._expect
+        if expect is None:
+            return
+        m = expect.search(info.content)
+        unloaded = m is None and ParseConfig.unloaded_regex.search(info.content) is not None
+        failed = (m is None and not unloaded and self._expect_fail is not None
+                  and self._expect_fail.search(info.content) is not None)
+        if m is None and not unloaded and not failed:
+            return
+        with self._cond:
+            if seq != self._query_seq or self._expect is None:
+                return
+            self._received += 1
+            # 只采用第一条响应，之后到达的是重试或对冲指令的重复响应
+            if self._received == 1:
+                self._match, self._unloaded_seen, self._failed = m, unloaded, failed
+                self._responded_at = time.time()
+            self._cond.notify_all()
+
+    @staticmethod
+    def rejection_regex(command: str) -> re.Pattern:
+        """
+        服务端拒绝指令时回显的出错位置，如 ...ld run info block 1 2 3<--[HERE]
+        回显总是以指令的最后 10 个字符结尾，据此只匹配这条指令，不会误认其他玩家或插件的错误指令
+        """
+        return re.compile(re.escape(command.lstrip('/')[-10:]) + r'<--\[HERE\]$')
+
+    def debug(self, message: str):
+        if self.debug_log:
+            self.server.logger.info(f'[ExtraPrimeBackup] {message}')
+
+    def _rcon_execute(self, command: str) -> Optional[str]:
+        """通过 RCON 执行指令，RCON 不可用时返回 None"""
+        pool = self.rcon
+        if pool is None or time.time() < self._rcon_retry_at or not self.server.is_rcon_running():
+            return None
+        try:
+            return pool.query(command.lstrip('/'))
+        except Exception as e:
+            self.server.logger.warning(f'[ExtraPrimeBackup] RCON 查询失败，暂时回退到日志匹配: {e}')
+            self._rcon_retry_at = time.time() + RCON_RETRY_INTERVAL
+            return None
+
+    def send(self, command: str):
+        """执行不需要结果的指令，与查询走同一通道以保证顺序"""
+        if self._rcon_execute(command) is None:
+            self.server.execute(command)
+
+    def query(self, command: str, regex: re.Pattern, timeout: Optional[float] = None,
+              fail_regex: Optional[re.Pattern] = None) -> Optional[re.Match]:
+        """
+        发送指令并等待第一条匹配 regex 的输出
+        启用 RCON 时直接从响应中匹配，否则从服务端日志中匹配
+        服务端提示坐标未加载或输出匹配 fail_regex 时立即返回 None，不再等待超时
+        """
+        start = time.time()
+        response = self._rcon_execute(command)
+        if response is not None:
+            self.last_unloaded = ParseConfig.unloaded_regex.search(response) is not None
+            m = None
+            for line in response.splitlines():
+                if (m := regex.search(line)) is not None:
+                    break
+            self.last_failed = m is None and fail_regex is not None and fail_regex.search(response) is not None
+            result = 'match' if m is not None else 'unloaded' if self.last_unloaded else 'failed' if self.last_failed else 'no match'
+            tracer.event('rcon', start, time.time(), command=command, result=result)
+            return m
+
+        if timeout is not None:
+            return self._wait_output(command, regex, fail_regex, timeout, None, 0)
+        # 未指定超时时间时根据最近的响应时间自适应，超时后退避重试
+        timeout, hedge_after = self._timeouts()
+        return self._wait_output(command, regex, fail_regex, timeout, hedge_after, self.retries)
+
+    def _timeouts(self) -> Tuple[float, Optional[float]]:
+        """根据最近的响应时间计算 (超时时间, 发送对冲查询的时间)"""
+        p99 = self.latency.percentile(0.99)
+        if p99 is None:
+            return DEFAULT_QUERY_TIMEOUT, None
+        timeout = min(MAX_QUERY_TIMEOUT, max(MIN_QUERY_TIMEOUT, p99 * TIMEOUT_FACTOR))
+        p95 = self.latency.percentile(0.95)
+        return timeout, p95 if self.hedge and p95 < timeout else None
+
+    def _send_barrier(self):
+        """须持有 _cond"""
+        objective = f'epb_sync_{next(self._barrier_ids)}'
+        self._barrier = f"'{objective}'"
+        self._barrier_at = time.time()
+        self.server.execute(BARRIER_COMMAND.format(objective=objective))
+
+    def _wait_barrier(self) -> bool:
+        """等待上一次查询的屏障响应，须持有 _cond；返回 False 表示仍可能有迟到的响应"""
+        if self._barrier is None:
+            return True
+        start = time.time()
+        done = self._cond.wait_for(lambda: self._barrier is None, BARRIER_TIMEOUT)
+        tracer.event('barrier', start, time.time(), done=done)
+        if not done and time.time() - self._barrier_at > BARRIER_EXPIRE:
+            self.server.logger.warning('[ExtraPrimeBackup] 长时间未收到屏障指令的响应，不再等待')
+            self._barrier = None
+            done = True
+        return done
+
+    def _wait_previous(self):
+        """等待重载前的实例结束查询，须持有 _lock；旧实例不会再开始新的查询，空闲后无需再检查"""
+        busy = self.previous_busy
+        if busy is None:
+            return
+        start = time.time()
+        while busy():
+            time.sleep(PREVIOUS_POLL_INTERVAL)
+        self.previous_busy = None
+        tracer.event('previous', start, time.time())
+
+    def _wait_output(self, command: str, regex: re.Pattern, fail_regex: Optional[re.Pattern], timeout: float,
+                     hedge_after: Optional[float], retries: int) -> Optional[re.Match]:
+        """
+        发送指令并从服务端日志中等待第一条响应
+        每次尝试超过 hedge_after 仍未响应时再发送一次，超时后退避重试；同一指令的任意一次响应都被接受
+        仍有指令未响应时发送屏障指令，下一次查询在屏障响应之后才开始，避免把迟到的响应当成自己的结果
+        """
+        with tracer.span('query', command=command, timeout=round(timeout, 3)) as span, self._lock:
+            self._wait_previous()
+            try:
+                sent = 0
+                attempt = 0
+                with self._cond:
+                    if not self._wait_barrier():
+                        span.detail.update(sent=0, result='barrier')
+                        self.last_unloaded = self.last_failed = False
+                        return None
+                    self._query_seq += 1
+                    self._match = None
+                    self._failed = False
+                    self._unloaded_seen = False
+                    self._received = 0
+                    self._expect_fail = fail_regex
+                    self._expect = regex
+                    for attempt in range(retries + 1):
+                        if attempt:
+                            self.debug(f'查询超时（{timeout:.2f}s），重试: {command}')
+                            self._cond.wait_for(lambda: self._received > 0, RETRY_BACKOFF * 2 ** (attempt - 1))
+                            if self._received:
+                                break
+                        attempt_start = time.time()
+                        self.server.execute(command)
+                        sent += 1
+                        if hedge_after is not None and not self._cond.wait_for(lambda: self._received > 0, hedge_after):
+                            self.server.execute(command)
+                            sent += 1
+                        if self._cond.wait_for(lambda: self._received > 0, max(0.0, timeout - hedge_after) if hedge_after else timeout):
+                            break
+                    if self._received:
+                        # 从本次尝试发出指令开始计时，丢失的响应不计入延迟
+                        self.latency.add(self._responded_at - attempt_start)
+                        tracer.event('first_line', attempt_start, self._responded_at)
+                    self._expect = None
+                    if self._received < sent:
+                        self._send_barrier()
+                span.detail.update(sent=sent, attempts=attempt + 1, result='match' if self._match is not None else
+                                   'unloaded' if self._unloaded_seen else 'failed' if self._failed else 'timeout')
+                self.last_unloaded = self._unloaded_seen
+                self.last_failed = self._failed
+                return self._match
+            finally:
+                self._expect = None
+
+    def clear_barrier(self):
+        with self._cond:
+            self._barrier = None
+            self._cond.notify_all()
+
+    def fetch_block(self, x, y, z, world) -> Optional[Tuple[str, dict]]:
+        """
+        获取方块信息，可在多个线程中同时调用
+        返回: (方块名, 方块属性) 或 None（获取失败）
+        """
+        if not self.supports_info:
+            return None
+        self.debug(f'获取方块信息: {x} {y} {z} in {world}')
+        command = f'/execute in minecraft:{world} run info block {x} {y} {z}'
+        m = self.query(command, ParseConfig.block_info_regex, fail_regex=self.rejection_regex(command))
+        if m is None:
+            if not self.last_failed:
+                return None
+            if self.query_backend != 'info':
+                # info block 只用于获取详情，不支持时不再发送
+                self.supports_info = False
+                self.server.logger.warning('[ExtraPrimeBackup] 服务端不支持 info block（需要 Carpet），不再获取方块详情')
+            elif not self.info_warned:
+                # info block 是唯一的查询手段，不能关闭，只让这一次查询失败
+                self.info_warned = True
+                self.server.logger.warning('[ExtraPrimeBackup] 服务端拒绝了 info block 指令（需要 Carpet），'
+                                           '没有 Carpet 时请将 query_backend 设置为 execute')
+            return None
+        with tracer.span('parse'):
+            result = m.group('block'), {key: val for key, val in ParseConfig.block_value_regex.findall(m.string)}
+        self.debug(f'方块信息: {result}')
+        return result
+
+    def fetch_nbt(self, x, y, z, world, paths: list) -> Optional[dict]:
+        """
+        使用 data get block 获取方块实体数据，只解析 paths 中的路径
+        返回: {路径: 值}，不存在的路径不在结果中，不是方块实体时为空字典；获取失败返回 None
+        """
+        self.debug(f'获取方块实体数据: {x} {y} {z} in {world}')
+        # 输出中包含坐标，只接受本次查询坐标的回复（前面不能紧跟数字，避免 1, 2, 3 匹配到 11, 2, 3）
+        coords = re.escape(f'{x}, {y}, {z}')
+        m = self.query(f'/execute in minecraft:{world} run data get block {x} {y} {z}',
+                       re.compile(rf'(?<![\d-]){coords} has the following block data: (?P<data>.*)$'),
+                       fail_regex=ParseConfig.block_data_error_regex)
+        if m is None:
+            return {} if self.last_failed else None
+        data = m.group('data')
+        try:
+            with tracer.span('parse_nbt', size=len(data)):
+                result = snbt.extract(data, paths)
+        except snbt.SnbtError as e:
+            self.server.logger.warning(f'[ExtraPrimeBackup] 无法解析方块实体数据 ({x}, {y}, {z}): {e}')
+            return None
+        self.debug(f'方块实体数据: {result}')
+        return result
+
+    def query_block(self, x, y, z, world) -> Optional[Tuple[str, dict]]:
+        """
+        线程安全地获取方块信息
+        返回: (方块名, 方块属性) 或 None（获取失败）
+        """
         world = str(world).lower()
         if world not in self.ALLOWED_WORLDS:
             self.server.logger.warning(f'[ExtraPrimeBackup] world参数非法: {world}，仅支持 overworld/the_nether/the_end')
-            return False
-
-        # 清空之前的数据
-        self.block_name = ''
-        self.block_data = {}
+            return None
+        return self.fetch_block(x, y, z, world)
+
+    def test_block(self, x, y, z, world, predicates: tuple) -> Optional[bool]:
+        """
+        使用原版 execute if block 测试方块，只解析 Test passed/failed
+        返回: 任意谓词通过时为 True，全部失败为 False，无响应为 None
+        服务端拒绝谓词（方块没有该属性、取值非法等）时立即返回 None，last_failed 为 True
+        """
+        for predicate in predicates:
+            self.debug(f'测试方块: {x} {y} {z} in {world} -> {predicate}')
+            command = f'/execute in minecraft:{world} if block {x} {y} {z} {predicate}'
+            m = self.query(command, ParseConfig.test_result_regex, fail_regex=self.rejection_regex(command))
+            if m is None:
+                return None
+            if m.group('result') == 'passed':
+                return True
+        return False
 
-        ti = time.time()
-        self.server.logger.info(f'获取方块信息: {x} {y} {z} in {world}')
-        self.server.execute(f'/execute in minecraft:{world} run info block {x} {y} {z}')
+    def get_score(self, holder: str, objective: str) -> Optional[int]:
+        """读取记分板分数，未设置或记分项不存在时返回 None"""
+        m = self.query(f'/scoreboard players get {holder} {objective}',
+                       re.compile(rf'{re.escape(holder)} has (?P<score>-?\d+) \['), fail_regex=ParseConfig.score_error_regex)
+        return int(m.group('score')) if m is not None else None
+
+    def is_loaded(self, x, y, z, world) -> Optional[bool]:
+        """
+        检测坐标所在区块是否已加载
+        返回: True/False，服务端不支持 execute if loaded 时返回 None
+        """
+        if not self.supports_loaded:
+            return None
+        command = f'/execute in minecraft:{world} if loaded {x} {y} {z}'
+        m = self.query(command, ParseConfig.test_result_regex, fail_regex=self.rejection_regex(command))
+        if m is None:
+            if self.last_failed:
+                self.supports_loaded = False
+                self.server.logger.warning('[ExtraPrimeBackup] 服务端不支持 execute if loaded（需要 1.19.4+），不再预先检测区块是否加载')
+            return False if self.last_unloaded else None
+        return m.group('result') == 'passed'
 
-        # 等待数据
-        while self.block_name == '' and time.time() - ti <= self.__TIMEOUT:
-            time.sleep(0.05)
 
-        self.server.logger.warning(f'block_name: {self.block_name}, block_data: {self.block_data}')
-        return True if self.block_name == '' else False
+block_info_getter: Optional[BlockInfoGetter] = None
 
 
-block_info_getter: Optional[BlockInfoGetter] = None
+# 重载前的实例中仍在执行的任务使用旧的 BlockInfoGetter 等待输出：(旧实例的 on_info, 旧实例是否仍可能在等待输出)
+previous_info_handler: Optional[tuple] = None
 
 
 def on_info(server: PluginServerInterface, info):
+    global previous_info_handler
     if block_info_getter:
         block_info_getter.on_info(info)
+    previous = previous_info_handler
+    if previous is not None:
+        handler, busy = previous
+        if busy():
+            handler(info)
+        else:
+            previous_info_handler = None
+
+
+def on_server_startup(server: PluginServerInterface):
+    # 服务端可能已更换版本
+    if block_info_getter:
+        block_info_getter.supports_loaded = True
+        block_info_getter.supports_info = True
+        block_info_getter.info_warned = False
+        # 服务端重启前发出的指令不会再有响应
+        block_info_getter.clear_barrier()
+
+
+# ---------- Unloaded Chunks ---------
+UNLOADED_POLICIES = ('fail', 'forceload', 'region')
+FORCELOAD_TIMEOUT = 3
+
+
+def get_world_dir() -> str:
+    """获取服务端存档目录（MCDR 工作目录 + server.properties 中的 level-name）"""
+    working_dir = PlServer.get_mcdr_config().get('working_directory', 'server')
+    level_name = 'world'
+    try:
+        with open(os.path.join(working_dir, 'server.properties'), encoding='utf8') as f:
+            for line in f:
+                if line.startswith('level-name='):
+                    level_name = line.split('=', 1)[1].strip() or level_name
+                    break
+    except OSError:
+        pass
+    return os.path.join(working_dir, level_name)
+
+
+QUERY_BACKENDS = ('info', 'execute')
+
+
+class QuerySession:
+    """
+    一次批量查询的会话
+    进入时预先检测检查点所在区块是否加载，并按 unloaded_policy 处理未加载的区块
+    - fail: 未加载的检查点直接判定失败，不再等待查询超时
+    - forceload: 批量 forceload 未加载的区块，退出时移除
+    - region: 从区域文件读取未加载区块中的方块
+    已加载的检查点按 query_backend 查询
+    """
+
+    def __init__(self, getter: BlockInfoGetter, items: list, policy: str, backend: str = 'info'):
+        # items: CheckPoint 列表
+        self.getter = getter
+        self.items = items
+        self.policy = policy if policy in UNLOADED_POLICIES else 'fail'
+        self.backend = backend if backend in QUERY_BACKENDS else 'info'
+        self.unloaded: set = set()
+        self.forceloaded: list = []
+        # 检查点路径 -> 最近一次获取到的方块实体数据 {NBT 路径: 值}
+        self.nbt_values: Dict[str, dict] = {}
+
+    @staticmethod
+    def chunk_of(item: CheckPoint) -> tuple:
+        return item.world, item.x >> 4, item.z >> 4
+
+    def __enter__(self):
+        with tracer.span('detect_unloaded', policy=self.policy):
+            self._prepare()
+        return self
+
+    def _prepare(self):
+        chunks = {}
+        for item in self.items:
+            chunks.setdefault(self.chunk_of(item), item)
+        for chunk, item in chunks.items():
+            if not self.getter.supports_loaded:
+                break
+            if self.getter.is_loaded(item.x, item.y, item.z, chunk[0]) is False:
+                self.unloaded.add(chunk)
+
+        if self.policy == 'forceload' and self.unloaded:
+            for world, cx, cz in self.unloaded:
+                self.getter.send(f'/execute in minecraft:{world} run forceload add {cx << 4} {cz << 4}')
+                self.forceloaded.append((world, cx, cz))
+            # 等待区块加载完成，超时仍未加载的按失败处理
+            deadline = time.time() + FORCELOAD_TIMEOUT
+            while self.unloaded and time.time() < deadline:
+                for chunk in list(self.unloaded):
+                    item = chunks[chunk]
+                    if self.getter.is_loaded(item.x, item.y, item.z, chunk[0]):
+                        self.unloaded.discard(chunk)
+                if self.unloaded:
+                    time.sleep(0.1)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for world, cx, cz in self.forceloaded:
+            self.getter.send(f'/execute in minecraft:{world} run forceload remove {cx << 4} {cz << 4}')
+        self.forceloaded.clear()
+
+    def is_unloaded(self, item: CheckPoint) -> bool:
+        return self.chunk_of(item) in self.unloaded
+
+    def query(self, item: CheckPoint) -> Tuple[Optional[Tuple[str, dict]], bool]:
+        """
+        获取检查点的方块信息
+        返回: (方块信息或 None, 是否因区块未加载而失败)
+        """
+        if self.is_unloaded(item):
+            if self.policy != 'region':
+                return None, True
+            try:
+                result = region.read_block(get_world_dir(), item.world, item.x, item.y, item.z)
+            except Exception as e:
+                self.getter.server.logger.warning(f'[ExtraPrimeBackup] 读取区域文件失败: {e}')
+                result = None
+            return result, result is None
+        result = self.getter.query_block(item.x, item.y, item.z, item.world)
+        return result, result is None and self.getter.last_unloaded
+
+    def uses_predicates(self, item: CheckPoint) -> bool:
+        return self.backend == 'execute' and item.predicates is not None and not self.is_unloaded(item)
+
+    def test(self, item: CheckPoint) -> Tuple[Optional[bool], bool]:
+        """
+        判断检查点是否处于关闭状态
+        返回: (True=已关闭 / False=未关闭 / None=无法获取, 是否因区块未加载而失败)
+        """
+        passed = None
+        if self.uses_predicates(item):
+            passed = self.getter.test_block(item.x, item.y, item.z, item.world, item.predicates)
+            if passed is None and not self.getter.last_failed:
+                return None, self.getter.last_unloaded
+            if passed is None:
+                # 谓词无效只与检查点的配置有关，之后不再使用（数据包下次生成时同样跳过），改用 info block 查询
+                self.getter.server.logger.warning(f'[ExtraPrimeBackup] 检查点 {item.path} 的方块谓词被服务端拒绝: '
+                                                  f'{", ".join(item.predicates)}，请检查 match 规则；已改用 info block 查询')
+                item.predicates = None
+        if passed is None:
+            result, unloaded = self.query(item)
+            if result is None:
+                return None, unloaded
+            with tracer.span('compare'):
+                passed = item.matches(intern_block(result[0]), intern_state(result[1]))
+        return self.check_nbt(item) if passed else (False, False)
+
+    def inspect(self, item: CheckPoint) -> Tuple[Optional[bool], Optional[Tuple[str, dict]], bool]:
+        """
+        获取用于详细显示的状态，execute 模式下只有不匹配且服务端支持 info block 时才查询完整的方块信息
+        返回: (是否已关闭, 方块信息或 None, 是否因区块未加载而失败)
+        """
+        if self.uses_predicates(item):
+            verdict, unloaded = self.test(item)
+            result = None
+            if verdict is False and self.getter.supports_info:
+                result, _ = self.query(item)
+            return verdict, result, unloaded
+        result, unloaded = self.query(item)
+        if result is None:
+            return None, None, unloaded
+        with tracer.span('compare'):
+            verdict = item.matches(intern_block(result[0]), intern_state(result[1]))
+        if not verdict:
+            return False, result, False
+        verdict, unloaded = self.check_nbt(item)
+        return verdict, result, unloaded
+
+    def check_nbt(self, item: CheckPoint) -> Tuple[Optional[bool], bool]:
+        """
+        检查方块实体数据断言，没有断言时直接通过
+        返回: (是否满足 / None=无法获取, 是否因区块未加载而失败)
+        """
+        if item.nbt is None:
+            return True, False
+        paths = [path for _, path, _ in item.nbt]
+        if self.is_unloaded(item):
+            if self.policy != 'region':
+                return None, True
+            try:
+                entity = region.read_block_entity(get_world_dir(), item.world, item.x, item.y, item.z)
+            except Exception as e:
+                self.getter.server.logger.warning(f'[ExtraPrimeBackup] 读取区域文件失败: {e}')
+                entity = None
+            if entity is None:
+                return None, True
+            values = {path: value for path in paths if (value := snbt.resolve(entity, path)) is not snbt.MISSING}
+        else:
+            values = self.getter.fetch_nbt(item.x, item.y, item.z, item.world, paths)
+            if values is None:
+                return None, self.getter.last_unloaded
+        self.nbt_values[item.path] = values
+        with tracer.span('compare_nbt'):
+            return all(nbt_matches(values.get(path, snbt.MISSING), expected) for _, path, expected in item.nbt), False
+
+
+# ---------- Datapack ---------
+GATE_MODES = ('query', 'datapack')
+DATAPACK_NAME = 'extra_prime_backup'
+DATAPACK_OBJECTIVE = 'epb_check'
+DATAPACK_FUNCTION = f'{DATAPACK_NAME}:check'
+# (数据包中 #cp<i> 对应的检查点, 函数版本)，函数执行时将版本写入 #generation，用于确认服务端已加载这一版本
+DATAPACK_STATE: Tuple[list, int] = ([], 0)
+
+
+def build_datapack_function(checkpoints: list) -> Tuple[str, list, int]:
+    """
+    将检查点编译为一个数据包函数
+    每个检查点默认记为失败(1)，所在区块已加载且任意谓词通过时记为 0，最后在 #failed 中累计失败数量
+    无法用谓词表达或带有方块实体数据断言的检查点不会编入函数
+    返回: (函数内容, 编入函数的检查点列表, 函数版本)
+    """
+    obj = DATAPACK_OBJECTIVE
+    lines = []
+    ids = []
+    for item in checkpoints:
+        if item.predicates is None or item.nbt is not None:
+            continue
+        holder = f'#cp{len(ids)}'
+        pos = f'{item.x} {item.y} {item.z}'
+        lines.append(f'# {item.path}')
+        lines.append(f'scoreboard players set {holder} {obj} 1')
+        for predicate in item.predicates:
+            lines.append(f'execute in minecraft:{item.world} if loaded {pos} if block {pos} {predicate} '
+                         f'run scoreboard players set {holder} {obj} 0')
+        lines.append(f'execute if score {holder} {obj} matches 1 run scoreboard players add #failed {obj} 1')
+        ids.append(item)
+    # 记分板分数为 32 位整数
+    generation = int(hashlib.sha1('\n'.join(lines).encode('utf8')).hexdigest()[:7], 16)
+    header = [
+        '# 由 ExtraPrimeBackup 自动生成，请勿手动修改',
+        f'scoreboard objectives add {obj} dummy',
+        f'scoreboard players set #failed {obj} 0',
+        f'scoreboard players set #generation {obj} {generation}',
+    ]
+    return '\n'.join(header + lines) + '\n', ids, generation
+
+
+def refresh_datapack():
+    """根据当前索引重新生成数据包，内容有变化时 /reload"""
+    global DATAPACK_STATE
+    content, ids, generation = build_datapack_function(CP_SNAPSHOT.index)
+    try:
+        root = os.path.join(get_world_dir(), 'datapacks', DATAPACK_NAME)
+        meta = {'pack': {
+            'pack_format': CP_CONFIG.datapack_format,
+            'supported_formats': {'min_inclusive': 4, 'max_inclusive': max(99, CP_CONFIG.datapack_format)},
+            'description': 'ExtraPrimeBackup checkpoints'
+        }}
+        changed = False
+        # 1.21 起函数目录由 functions 改为 function
+        files = {os.path.join(root, 'pack.mcmeta'): json.dumps(meta, indent=2)}
+        for folder in ['functions', 'function']:
+            files[os.path.join(root, 'data', DATAPACK_NAME, folder, 'check.mcfunction')] = content
+        for path, text in files.items():
+            if os.path.isfile(path):
+                with open(path, encoding='utf8') as f:
+                    if f.read() == text:
+                        continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf8') as f:
+                f.write(text)
+            changed = True
+    except OSError as e:
+        PlServer.logger.warning(f'[ExtraPrimeBackup] 生成数据包失败: {e}')
+        DATAPACK_STATE = ([], 0)
+        return
+    DATAPACK_STATE = (ids, generation)
+    if changed and PlServer.is_server_running():
+        block_info_getter.send('/reload')
+        block_info_getter.send(f'/datapack enable "file/{DATAPACK_NAME}"')
+        PlServer.logger.info(f'[ExtraPrimeBackup] 数据包已更新（{len(ids)} 个检查点）')
+
+
+def run_datapack_gate(getter: BlockInfoGetter) -> Optional[Tuple[list, list]]:
+    """
+    调用数据包函数检查所有编入的检查点
+    /reload 是异步执行的，服务端加载的函数可能还是旧版本（或加载失败），此时新增的检查点不在函数中
+    因此先核对函数写入的 #generation，与当前生成的版本不一致时不使用数据包的结果
+    返回: (未通过的检查点列表, 编入函数的检查点列表)，数据包不可用时返回 None
+    """
+    ids, generation = DATAPACK_STATE
+    if not ids:
+        return None
+    with getter._lock:
+        # 先清除旧结果，函数未执行时读取会失败而不是读到过期的分数
+        getter.send(f'/scoreboard players reset #failed {DATAPACK_OBJECTIVE}')
+        getter.send(f'/scoreboard players reset #generation {DATAPACK_OBJECTIVE}')
+        getter.send(f'/function {DATAPACK_FUNCTION}')
+        loaded = getter.get_score('#generation', DATAPACK_OBJECTIVE)
+        if loaded != generation:
+            PlServer.logger.warning(f'[ExtraPrimeBackup] 服务端加载的数据包函数不是最新版本（{loaded} != {generation}），本次逐个查询检查点')
+            return None
+        failed_count = getter.get_score('#failed', DATAPACK_OBJECTIVE)
+        if failed_count is None:
+            return None
+        if failed_count == 0:
+            return [], ids
+        failed = []
+        for i, item in enumerate(ids):
+            if getter.get_score(f'#cp{i}', DATAPACK_OBJECTIVE) != 0:
+                failed.append(item)
+                if len(failed) >= failed_count:
+                    break
+        return failed, ids
+
+
+# ---------- Incremental Check ---------
+INCREMENTAL_CACHE_FILE = 'incremental_cache.json'
+SAVE_ALL_TIMEOUT = 60
+# {检查点路径: {'sig': 配置摘要, 'ts': 确认关闭时区块的保存时间, 'verified_at': 确认时间}}
+incremental_cache: Optional[dict] = None
+
+
+def get_incremental_cache() -> dict:
+    global incremental_cache
+    if incremental_cache is None:
+        incremental_cache = {}
+        path = os.path.join(PlServer.get_data_folder(), INCREMENTAL_CACHE_FILE)
+        try:
+            with open(path, encoding='utf8') as f:
+                incremental_cache = json.load(f)
+        except (OSError, ValueError):
+            pass
+    return incremental_cache
+
+
+class IncrementalTracker:
+    """
+    增量检查：save-all flush 之后从 .mca 文件头读取每个检查点所在区块的保存时间
+    区块自上次确认关闭以来没有再被保存过，说明其中的方块没有变化，可以跳过查询
+    """
+
+    def __init__(self, getter: BlockInfoGetter):
+        self.getter = getter
+        self.cache = get_incremental_cache()
+        self.timestamps: Dict[str, int] = {}
+        self.changed = False
+
+    def filter(self, checkpoints: list) -> list:
+        """返回仍需查询的检查点，save-all 失败时不跳过任何检查点"""
+        if self.getter.query('/save-all flush', ParseConfig.save_done_regex, timeout=SAVE_ALL_TIMEOUT) is None:
+            self.getter.server.logger.warning('[ExtraPrimeBackup] save-all 未完成，本次不进行增量检查')
+            return checkpoints
+        world_dir = get_world_dir()
+        headers: Dict[str, bytes] = {}
+        pending = []
+        for item in checkpoints:
+            path = region.get_region_file(world_dir, item.world, item.x, item.z)
+            if path not in headers:
+                try:
+                    with open(path, 'rb') as f:
+                        headers[path] = f.read(2 * region.SECTOR_SIZE)
+                except OSError:
+                    headers[path] = b''
+            ts = region.read_chunk_timestamp(headers[path], item.x, item.z)
+            self.timestamps[item.path] = ts
+            entry = self.cache.get(item.path)
+            # 保存时间须早于确认时间所在的那一秒，否则同一秒内的再次保存无法区分
+            if (entry is not None and ts != 0 and entry.get('sig') == item.signature()
+                    and entry.get('ts') == ts and ts < int(entry.get('verified_at', 0))):
+                continue
+            pending.append(item)
+        return pending
+
+    def record(self, item: CheckPoint, verdict: Optional[bool]):
+        ts = self.timestamps.get(item.path, 0)
+        if verdict and ts != 0:
+            self.cache[item.path] = {'sig': item.signature(), 'ts': ts, 'verified_at': time.time()}
+            self.changed = True
+        elif self.cache.pop(item.path, None) is not None:
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        path = os.path.join(PlServer.get_data_folder(), INCREMENTAL_CACHE_FILE)
+        try:
+            with open(path, 'w', encoding='utf8') as f:
+                json.dump(self.cache, f)
+        except OSError as e:
+            self.getter.server.logger.warning(f'[ExtraPrimeBackup] 保存增量检查缓存失败: {e}')
+
+
+# ---------- Backup Verification ---------
+BACKUP_POLL_INTERVAL = 2
+CHECK_HISTORY_FILE = 'check_history.db'
+# 旧版本保存备份校验结果的文件，打开历史数据库时导入
+LEGACY_VERDICT_FILE = 'backup_verdicts.json'
+check_history: Optional[CheckHistory] = None
+
+
+def open_check_history() -> CheckHistory:
+    history = CheckHistory(os.path.join(PlServer.get_data_folder(), CHECK_HISTORY_FILE))
+    legacy = os.path.join(PlServer.get_data_folder(), LEGACY_VERDICT_FILE)
+    if os.path.isfile(legacy):
+        try:
+            with open(legacy, encoding='utf8') as f:
+                verdicts = json.load(f)
+            for backup_id, verdict in verdicts.items():
+                # 旧版本在缺少区块时也记为通过
+                clean = verdict.get('clean', False) and not verdict.get('missing')
+                history.record(KIND_BACKUP, clean, verdict.get('checked', 0), verdict.get('duration', 0),
+                               verdict.get('failed', {}), verdict.get('missing', []), backup_id=int(backup_id),
+                               sig=verdict.get('sig'), at=verdict.get('time'))
+            os.replace(legacy, legacy + '.migrated')
+        except (OSError, ValueError, sqlite3.Error) as e:
+            PlServer.logger.warning(f'[ExtraPrimeBackup] 导入旧版备份校验结果失败: {e}')
+    return history
+
+
+def save_backup_verdict(backup_id: int, verdict: dict):
+    try:
+        check_history.record(KIND_BACKUP, verdict['clean'], verdict['checked'], verdict['duration'], verdict['failed'],
+                             verdict['missing'], backup_id=backup_id, sig=verdict['sig'], at=verdict['time'])
+    except sqlite3.Error as e:
+        PlServer.logger.warning(f'[ExtraPrimeBackup] 保存备份校验结果失败: {e}')
+
+
+def get_pb_paths() -> Tuple[str, str]:
+    """获取 PrimeBackup 的存储目录与备份源目录，读取不到 PrimeBackup 配置时使用其默认值"""
+    working_dir = PlServer.get_mcdr_config().get('working_directory', 'server')
+    try:
+        # noinspection PyUnresolvedReferences
+        from prime_backup.config.config import Config
+        config = Config.get()
+        return str(config.storage_path), str(config.source_path)
+    except Exception:
+        return 'pb_files', working_dir
+
+
+def open_backup_reader() -> Tuple[BackupReader, str]:
+    """返回 (备份读取器, 存档目录相对于备份源目录的路径)"""
+    storage_root, source_root = get_pb_paths()
+    level_dir = os.path.relpath(get_world_dir(), source_root).replace(os.sep, '/')
+    return BackupReader(storage_root), level_dir
+
+
+def get_latest_backup_id() -> Optional[int]:
+    """返回最新的备份 ID，还没有备份时返回 0，无法读取 PrimeBackup 数据库时返回 None"""
+    try:
+        reader, _ = open_backup_reader()
+    except (BackupReadError, sqlite3.Error):
+        return None
+    try:
+        return reader.latest_backup_id() or 0
+    except sqlite3.Error:
+        return None
+    finally:
+        reader.close()
+
+
+SCAN_WORKERS = min(4, os.cpu_count() or 1)
+# 备份扫描使用的线程池，区块解压（zlib）期间释放 GIL，可以并行
+# 不使用进程池：fork 会复制整个多线程的 MCDR 进程（包括服务端的管道与其他线程持有的锁），spawn 则会在子进程中重新导入 MCDR 的启动模块
+scan_pool: Optional[Executor] = None
+scan_pool_lock = threading.Lock()
+
+
+def get_scan_pool() -> Executor:
+    global scan_pool
+    with scan_pool_lock:
+        if scan_pool is None:
+            scan_pool = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix='ExtraPrimeBackup_Scan')
+        return scan_pool
+
+
+def shutdown_scan_pool():
+    global scan_pool
+    with scan_pool_lock:
+        if scan_pool is not None:
+            scan_pool.shutdown(wait=False)
+            scan_pool = None
+
+
+def checkpoints_signature(checkpoints: list) -> str:
+    """检查点集合的摘要，用于判断缓存的备份校验结果是否仍然有效"""
+    digest = hashlib.sha1()
+    for item in sorted(checkpoints, key=lambda cp: cp.path):
+        digest.update(f'{item.path}={item.signature()}\n'.encode('utf8'))
+    return digest.hexdigest()
+
+
+def verify_backup(reader: BackupReader, level_dir: str, backup_id: int, checkpoints: list) -> dict:
+    """读取备份中每个检查点的方块状态，返回校验结果；有检查点未能读取时与 CheckReport 一样不算通过"""
+    start = time.time()
+    targets = [(item.path, item.world, item.x, item.y, item.z) for item in checkpoints]
+    blocks = read_blocks(reader, backup_id, level_dir, targets, get_scan_pool())
+    failed = {}
+    missing = []
+    for item in checkpoints:
+        block = blocks.get(item.path)
+        if block is None:
+            missing.append(item.path)
+        elif not item.matches(intern_block(block[0]), intern_state(block[1])):
+            failed[item.path] = [block[0], block[1]]
+    return {'time': time.time(), 'clean': not failed and not missing, 'checked': len(checkpoints), 'failed': failed,
+            'missing': missing, 'duration': round(time.time() - start, 3), 'sig': checkpoints_signature(checkpoints)}
+
+
+def get_cached_verdict(backup_id: int, checkpoints: list) -> Optional[dict]:
+    """备份内容不会改变，检查点集合未变化时缓存的校验结果始终有效"""
+    try:
+        return check_history.get_verdict(backup_id, checkpoints_signature(checkpoints))
+    except sqlite3.Error as e:
+        PlServer.logger.warning(f'[ExtraPrimeBackup] 读取备份校验结果失败: {e}')
+        return None
+
+
+def track_backup(source: CommandSource, previous_id: int, result_id: Optional[int], verify: bool):
+    """等待 PrimeBackup 创建出新的备份，将备份前检查的结果关联到该备份，并按配置复核备份中的检查点状态"""
+    try:
+        reader, level_dir = open_backup_reader()
+    except (BackupReadError, sqlite3.Error) as e:
+        PlServer.logger.warning(f'[ExtraPrimeBackup] 无法读取 PrimeBackup 数据库: {e}')
+        return
+    try:
+        deadline = time.time() + CP_CONFIG.backup_wait_timeout
+        backup_id = None
+        while time.time() < deadline:
+            latest = reader.latest_backup_id()
+            if latest is not None and latest > previous_id:
+                backup_id = latest
+                break
+            time.sleep(BACKUP_POLL_INTERVAL)
+        if backup_id is None:
+            PlServer.logger.warning('[ExtraPrimeBackup] 等待备份完成超时，未能关联检查结果')
+            return
+        if result_id is not None:
+            check_history.attach_backup(result_id, backup_id)
+        checkpoints = CP_SNAPSHOT.index
+        if not verify or not checkpoints:
+            return
+        verdict = verify_backup(reader, level_dir, backup_id, checkpoints)
+    except (BackupReadError, sqlite3.Error, OSError, ValueError, ImportError) as e:
+        PlServer.logger.warning(f'[ExtraPrimeBackup] 备份校验失败: {e}')
+        return
+    finally:
+        reader.close()
+
+    save_backup_verdict(backup_id, verdict)
+    if verdict['clean']:
+        source.reply(f'§a备份 #{backup_id} 校验通过，共检查 {verdict["checked"]} 个检查点')
+    elif verdict['failed']:
+        source.get_server().broadcast(f'§c备份 #{backup_id} 中有未关闭的机器: §e{", ".join(verdict["failed"])}')
+    if verdict['missing']:
+        source.reply(f'§e备份 #{backup_id} 中缺少 {len(verdict["missing"])} 个检查点所在的区块，未能校验，不视为通过')
+
+
+# ---------- Watch ---------
+WATCH_MIN_INTERVAL = 1
+# 连续没有变化时轮询间隔的增长倍数
+WATCH_BACKOFF = 1.5
+# 轮询间隔至少为单轮查询耗时的倍数，避免大分组持续占用查询通道
+WATCH_LOAD_FACTOR = 2
+WATCH_STATES = {True: '§a已关闭', False: '§c运行中', None: '§8未知'}
+# 来源标识 -> 正在运行的监视
+watchers: Dict[str, 'Watcher'] = {}
+watchers_lock = threading.Lock()
+
+
+class Watcher:
+    """
+    监视分组中检查点的状态，只向来源发送发生变化的检查点
+    状态有变化时以最小间隔轮询，持续没有变化时逐渐放慢；全部关闭、超时或被停止时结束
+    """
+
+    def __init__(self, source: CommandSource, key: str, group_path: str, timeout: float, max_interval: float):
+        self.source = source
+        self.key = key
+        self.group_path = group_path
+        self.timeout = timeout
+        self.max_interval = max(WATCH_MIN_INTERVAL, max_interval)
+        self.stop_reason: Optional[str] = None
+        self._stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f'ExtraPrimeBackup_Watch_{key}', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, reason: str):
+        if not self._stopped.is_set():
+            self.stop_reason = reason
+            self._stopped.set()
+
+    def items(self) -> list:
+        """分组下的所有检查点，每轮重新获取以反映配置的修改"""
+        prefix = self.group_path + '.'
+        return [item for item in CP_SNAPSHOT.index if item.path == self.group_path or item.path.startswith(prefix)]
+
+    @staticmethod
+    def poll(items: list) -> Dict[str, Optional[bool]]:
+        with QuerySession(block_info_getter, items, CP_CONFIG.unloaded_policy, CP_CONFIG.query_backend) as access:
+            return {item.path: access.test(item)[0] for item in items}
+
+    def _run(self):
+        deadline = time.time() + self.timeout
+        interval = WATCH_MIN_INTERVAL
+        states: Optional[Dict[str, Optional[bool]]] = None
+        try:
+            while not self._stopped.is_set():
+                items = self.items()
+                if not items:
+                    self.source.reply(f'§c分组 §e{self.group_path} §c中已没有检查点，停止监视')
+                    return
+                # 监视线程不经过指令执行器，备份检查期间同样暂停轮询，避免与备份争用查询
+                executor = command_executor
+                while executor is not None and not self._stopped.is_set() and not executor.wait_backup(WATCH_MIN_INTERVAL):
+                    pass
+                if self._stopped.is_set():
+                    break
+                start = time.time()
+                with tracer.span('watch', group=self.group_path, checkpoints=len(items)):
+                    current = self.poll(items)
+                elapsed = time.time() - start
+                if self._stopped.is_set():
+                    break
+
+                if states is None:
+                    running = [path for path, verdict in current.items() if verdict is not True]
+                    self.source.reply(f'§a开始监视 §e{self.group_path}§a：共 {len(items)} 个检查点，{len(running)} 个未关闭')
+                    for path in running:
+                        self.source.reply(f'§7  {path}: {WATCH_STATES[current[path]]}')
+                else:
+                    changed = False
+                    for path, verdict in current.items():
+                        previous = states.get(path)
+                        if path in states and previous == verdict:
+                            continue
+                        changed = True
+                        self.source.reply(f'§e{path}§7: {WATCH_STATES[previous]} §7→ {WATCH_STATES[verdict]}')
+                    interval = WATCH_MIN_INTERVAL if changed else min(self.max_interval, interval * WATCH_BACKOFF)
+                states = current
+
+                if all(verdict is True for verdict in current.values()):
+                    self.source.reply(f'§a分组 §e{self.group_path} §a中的机器已全部关闭')
+                    return
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.stop('timeout')
+                    break
+                self._stopped.wait(min(remaining, max(interval, elapsed * WATCH_LOAD_FACTOR)))
+
+            if self.stop_reason == 'timeout':
+                self.source.reply(f'§e监视 {self.group_path} 已超时，仍有机器未关闭')
+            elif self.stop_reason in ('unwatch', 'replaced', 'unload'):
+                self.source.reply(f'§7已停止监视 {self.group_path}')
+        except Exception:
+            PlServer.logger.exception(f'[ExtraPrimeBackup] 监视 {self.group_path} 异常')
+        finally:
+            with watchers_lock:
+                if watchers.get(self.key) is self:
+                    del watchers[self.key]
+
+
+def start_watch(source: CommandSource, group_path: str) -> Watcher:
+    """为来源启动监视，同一来源已有的监视会被替换"""
+    key = get_source_key(source)
+    watcher = Watcher(source, key, group_path, CP_CONFIG.watch_timeout, CP_CONFIG.watch_max_interval)
+    with watchers_lock:
+        previous = watchers.get(key)
+        watchers[key] = watcher
+    if previous is not None:
+        previous.stop('replaced')
+    watcher.start()
+    return watcher
+
+
+def stop_watch(key: str, reason: str) -> bool:
+    with watchers_lock:
+        watcher = watchers.pop(key, None)
+    if watcher is None:
+        return False
+    watcher.stop(reason)
+    return True
+
+
+def stop_all_watches(reason: str) -> list:
+    """停止所有监视，返回被停止的监视，其线程可能仍在完成当前一轮轮询"""
+    with watchers_lock:
+        current = list(watchers.values())
+        watchers.clear()
+    for watcher in current:
+        watcher.stop(reason)
+    return current
+
+
+def on_player_left(server: PluginServerInterface, player: str):
+    stop_watch(player, 'left')
+
+
+# ---------- Executor ---------
+PRIORITY_BACKUP = 0
+PRIORITY_INTERACTIVE = 10
+
+
+class CommandExecutor:
+    """
+    指令执行器：固定数量的工作线程 + 有界优先级队列
+    - 交互指令超过 queue_size 时直接拒绝
+    - 同一来源的重复请求（相同指令、相同参数）在排队期间只保留一个
+    - 备份任务优先出队，且备份检查进行时交互指令暂停执行
+    - 插件重载后排队中的任务交给新实例重新提交，由新的代码执行
+    """
+
+    def __init__(self, server: PluginServerInterface, worker_count: int = 2, queue_size: int = 16):
+        self.server = server
+        self.queue_size = max(1, queue_size)
+        self._queue: PriorityQueue = PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._pending: set = set()
+        self._interactive_count = 0
+        self._backup_running = 0
+        self._backup_done = threading.Condition(self._lock)
+        # 正在执行的任务数
+        self._active = 0
+        self._running = True
+        # 重载后接收排队中任务的函数 forward(name, priority, key, args, kwargs)
+        self._forward = None
+        self._workers = []
+        for i in range(max(1, worker_count)):
+            thread = threading.Thread(target=self._work, name=f'ExtraPrimeBackup_Worker_{i}', daemon=True)
+            thread.start()
+            self._workers.append(thread)
+
+    def submit(self, name: str, source: CommandSource, func, key: tuple, priority: int = PRIORITY_INTERACTIVE) -> bool:
+        """提交任务，返回是否成功入队"""
+        with self._lock:
+            if not self._running:
+                return False
+            if key in self._pending:
+                source.reply('§e相同的请求已在队列中，请稍候')
+                return False
+            if priority != PRIORITY_BACKUP:
+                if self._interactive_count >= self.queue_size:
+                    source.reply('§c指令队列已满，请稍后再试')
+                    return False
+                self._interactive_count += 1
+            self._pending.add(key)
+        self._queue.put((priority, next(self._seq), name, key, func))
+        return True
+
+    def _work(self):
+        while True:
+            priority, _, name, key, func = self._queue.get()
+            if func is None:
+                break
+            with self._lock:
+                self._pending.discard(key)
+                if priority != PRIORITY_BACKUP:
+                    self._interactive_count -= 1
+                    # 备份检查期间交互指令让路
+                    while self._backup_running > 0 and self._running:
+                        self._backup_done.wait()
+                forward = self._forward
+                if forward is None:
+                    self._active += 1
+                    if priority == PRIORITY_BACKUP:
+                        self._backup_running += 1
+            if forward is not None:
+                self._forward_task(forward, name, priority, key, func)
+                continue
+            try:
+                func()
+            except Exception:
+                self.server.logger.exception(f'[ExtraPrimeBackup] 任务 {name} 执行异常')
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    if priority == PRIORITY_BACKUP:
+                        self._backup_running -= 1
+                        self._backup_done.notify_all()
+
+    def _forward_task(self, forward, name: str, priority: int, key: tuple, func: functools.partial):
+        try:
+            forward(name, priority, key, func.args, func.keywords)
+        except Exception:
+            self.server.logger.exception(f'[ExtraPrimeBackup] 任务 {name} 交接失败')
+
+    def hand_over(self, forward):
+        """
+        停止执行排队中的任务，改为交给 forward 在新实例中重新提交
+        正在执行的任务不受影响，之后出队的任务（包括正在为备份让路的）同样转交
+        """
+        with self._lock:
+            self._running = False
+            self._forward = forward
+            self._backup_done.notify_all()
+        while True:
+            try:
+                priority, _, name, key, func = self._queue.get_nowait()
+            except Empty:
+                break
+            if func is None:
+                continue
+            with self._lock:
+                self._pending.discard(key)
+            self._forward_task(forward, name, priority, key, func)
+
+    def wait_backup(self, timeout: float) -> bool:
+        """等待正在进行的备份检查结束，返回是否已没有备份检查在进行"""
+        with self._lock:
+            return self._backup_done.wait_for(lambda: self._backup_running == 0 or not self._running, timeout)
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def busy(self) -> bool:
+        """是否有任务正在执行"""
+        return self._active > 0
+
+    @property
+    def worker_count(self) -> int:
+        return len(self._workers)
+
+    def shutdown(self, timeout: float = 2):
+        with self._lock:
+            self._running = False
+            self._backup_done.notify_all()
+        for _ in self._workers:
+            # 停止信号排在所有已入队任务之后
+            self._queue.put((PRIORITY_INTERACTIVE + 1, next(self._seq), '', None, None))
+        for thread in self._workers:
+            thread.join(timeout=timeout)
+
+
+command_executor: Optional[CommandExecutor] = None
+
+
+def get_source_key(source: CommandSource) -> str:
+    """用于合并重复请求的来源标识"""
+    player = getattr(source, 'player', None)
+    return player if player else type(source).__name__
+
+
+# 任务名 -> 未经装饰的指令函数，重载后用于重新提交上一个实例排队中的任务
+EXECUTOR_TASKS: dict = {}
+
+
+def run_in_executor(name: str, priority: int = PRIORITY_INTERACTIVE):
+    """装饰器：将指令交给 command_executor 执行，替代 @new_thread"""
+    def decorator(func):
+        EXECUTOR_TASKS[name] = func
+
+        @functools.wraps(func)
+        def wrapper(source: CommandSource, context: dict, *args, **kwargs):
+            args_key = tuple(sorted((str(k), str(v)) for k, v in dict(context).items()))
+            key = (name, get_source_key(source), args_key, args, tuple(sorted(kwargs.items())))
+            command_executor.submit(name, source, functools.partial(func, source, context, *args, **kwargs), key, priority)
+        return wrapper
+    return decorator
+
+
+def resubmit_task(name: str, priority: int, key: tuple, args: tuple, kwargs: dict):
+    """重新提交上一个实例交接过来的任务，使用本实例的指令函数"""
+    func = EXECUTOR_TASKS.get(name)
+    source = args[0]
+    if func is None:
+        source.reply('§c插件已重载，排队中的指令未能继续执行，请重新输入')
+        return
+    command_executor.submit(name, source, functools.partial(func, *args, **kwargs), key, priority)
 
 
 # ---------- Command ---------
@@ -195,11 +1972,35 @@ def cmd_help(source: CommandSource, context: dict):
             'example': '!!pb cp del factory.redstone.piston',
         },
         'update': {
-            'usage': '!!pb cp update <name>',
+            'usage': '!!pb cp update <name> [-r]',
             'desc': '§e📁 更新检查点为当前状态',
-            'detail': '将指定检查点的方块信息更新为当前位置的状态。',
+            'detail': '将指定检查点的方块信息更新为当前位置的状态；加 -r 时一次性重新记录分组（含子分组）中的所有检查点，显示变化后统一保存。',
             'example': '!!pb cp update factory.redstone.piston',
         },
+        'inspect': {
+            'usage': '!!pb cp inspect [备份ID]',
+            'desc': '§e🔎 检查备份中的机器状态',
+            'detail': '读取指定备份中的区域文件，检查所有检查点在该备份中是否已关闭，结果会被缓存；不带参数时列出已缓存的结果。',
+            'example': '!!pb cp inspect 12',
+        },
+        'history': {
+            'usage': '!!pb cp history [name]',
+            'desc': '§e📜 查看检查历史',
+            'detail': '列出最近的检查结果与最近一个所有机器均已关闭的备份；指定检查点时列出该检查点未通过检查的记录及当时的实际状态。',
+            'example': '!!pb cp history factory.redstone.piston',
+        },
+        'trace': {
+            'usage': '!!pb cp trace [count]',
+            'desc': '§e⏱ 查看最近的追踪记录',
+            'detail': '显示最近的查询与备份各阶段的耗时（发送查询、收到响应、解析、比较、检查、PrimeBackup 回调），默认 20 条。',
+            'example': '!!pb cp trace 50',
+        },
+        'watch': {
+            'usage': '!!pb cp watch <group_path>',
+            'desc': '§e👀 监视分组中机器的状态变化',
+            'detail': '持续查询分组中的检查点，只发送状态发生变化的检查点，全部关闭后提示并停止；超时、退出游戏或使用 !!pb cp unwatch 时也会停止。',
+            'example': '!!pb cp watch factory.redstone',
+        },
         'add': {
             'usage': '!!pb cp add <x> <y> <z> <name> [world]',
             'desc': '§e➕ 添加新的检查点',
@@ -242,6 +2043,10 @@ def cmd_help(source: CommandSource, context: dict):
             'status': 'status', 'st': 'status',
             'del': 'del', 'delete': 'del',
             'update': 'update',
+            'inspect': 'inspect',
+            'history': 'history',
+            'trace': 'trace',
+            'watch': 'watch', 'unwatch': 'watch',
             'add': 'add',
             'addg': 'add_group', 'add_group': 'add_group', 'gr': 'add_group',
             'add_to_group': 'add_to_group',
@@ -270,7 +2075,9 @@ def cmd_help(source: CommandSource, context: dict):
     source.reply(RText('§a=== ExtraPrimeBackup 指令帮助 ==='))
     # 分组展示
     group_titles = [
-        ('§6检查点管理', ['list', 'status', 'del', 'update', 'add', 'add_group', 'add_to_group']),
+        ('§6检查点管理', ['list', 'status', 'watch', 'del', 'update', 'add', 'add_group', 'add_to_group']),
+        ('§6备份', ['inspect', 'history']),
+        ('§6诊断', ['trace']),
         ('§6其他', ['ignore', 'help', 'helpc']),  # 新增 helpc
     ]
     for group_title, cmds in group_titles:
@@ -301,11 +2108,17 @@ def cmd_helpc(source: CommandSource, context: dict):
     HELP_LIST = [
         ('!!pb cp list', '列出所有检查点和分组（树状结构）'),
         ('!!pb cp status <name>', '查看指定检查点的状态'),
+        ('!!pb cp watch <group_path>', '监视分组中机器的状态变化，全部关闭时提示'),
+        ('!!pb cp unwatch', '停止监视'),
         ('!!pb cp del <name>', '删除指定检查点或分组'),
         ('!!pb cp update <name>', '更新检查点为当前状态'),
+        ('!!pb cp update <group_path> -r', '重新记录分组中所有检查点的当前状态，显示变化后统一保存'),
         ('!!pb cp add <x> <y> <z> <name> [world]', '添加新的检查点'),
         ('!!pb cp add g <group_path>', '创建新的分组（支持嵌套）'),
         ('!!pb cp add g <group_path> <x> <y> <z> <name> [world]', '在指定分组中添加检查点'),
+        ('!!pb cp inspect [备份ID]', '检查备份中的机器状态（不带参数时列出已缓存的结果）'),
+        ('!!pb cp history [name]', '查看检查历史与最近一个所有机器均已关闭的备份'),
+        ('!!pb cp trace [count]', '查看最近的查询与备份各阶段耗时'),
         ('!!pb ignore', '忽略检查点状态强制执行'),
         ('!!pb cp help [子命令]', '查看帮助'),
         ('!!pb cp helpc', '输出本列表（纯文本总览）'),
@@ -316,7 +2129,7 @@ def cmd_helpc(source: CommandSource, context: dict):
 
 # 应用权限装饰器到所有命令函数
 @require_permission('list')
-@new_thread('Pb_CheckPoint_List')
+@run_in_executor('Pb_CheckPoint_List')
 def cmd_list(source: CommandSource, context: dict):
     """列出检查点，支持树状结构显示"""
 
@@ -348,11 +2161,12 @@ def cmd_list(source: CommandSource, context: dict):
 
                 source.reply(checkpoint_text)
 
-    if not CP_CONFIG.tree:
+    snapshot = CP_SNAPSHOT
+    if not snapshot.tree:
         # 如果新结构为空，检查旧数据
-        if CP_CONFIG.check_point:
+        if snapshot.check_point:
             source.reply('§e=== 检查点列表（旧格式） ===')
-            for name, info in CP_CONFIG.check_point.items():
+            for name, info in snapshot.check_point.items():
                 world = info.get('world', 'overworld')
                 x, y, z = info.get('x', 0), info.get('y', 0), info.get('z', 0)
 
@@ -367,30 +2181,16 @@ def cmd_list(source: CommandSource, context: dict):
         return
 
     source.reply('§a=== 检查点树状结构 ===')
-    display_tree(CP_CONFIG.tree)
+    display_tree(snapshot.tree)
 
 
 @require_permission('status')
-@new_thread('Pb_CheckPoint_Status')
+@run_in_executor('Pb_CheckPoint_Status')
 def cmd_status(source: CommandSource, context: dict):
     """显示检查点状态，支持新树状结构和嵌套路径，以树状格式显示详细信息"""
     item_name = context.get('name') or context.get('n')
 
-    def find_in_tree(tree_dict, path_parts):
-        """递归查找树状结构中的检查点"""
-        if len(path_parts) == 1:
-            name = path_parts[0]
-            if name in tree_dict and tree_dict[name]['type'] == 'checkpoint':
-                return tree_dict[name]
-            return None
-        else:
-            parent = path_parts[0]
-            if parent in tree_dict and tree_dict[parent]['type'] == 'group':
-                children = tree_dict[parent].get('children', {})
-                return find_in_tree(children, path_parts[1:])
-            return None
-
-    def display_status_tree(checkpoint_data, actual_block, actual_data, success):
+    def display_status_tree(checkpoint_data, record, verdict, result, nbt_values):
         """以树状格式显示检查点状态信息"""
         source.reply(f'§a=== 检查点状态：{item_name} ===')
 
@@ -398,23 +2198,49 @@ def cmd_status(source: CommandSource, context: dict):
         source.reply('§6├─ 基本信息')
         source.reply(f'§7│  ├─ 坐标: §e({checkpoint_data["x"]}, {checkpoint_data["y"]}, {checkpoint_data["z"]})')
         source.reply(f'§7│  ├─ 世界: §e{checkpoint_data.get("world", "overworld")}')
+        success = verdict is not None
         source.reply(f'§7│  └─ 获取状态: {"§a成功" if success else "§c失败"}')
 
         # 配置中的方块信息
         source.reply('§6├─ 配置数据')
         source.reply(f'§7│  ├─ 方块类型: §e{checkpoint_data.get("block", "未知")}')
         config_data = checkpoint_data.get("data", {})
+        has_rule = record.rule is not None
+        attr_branch, attr_indent = ("├─", "│  ") if has_rule else ("└─", "   ")
         if config_data:
-            source.reply('§7│  └─ 方块属性:')
+            source.reply(f'§7│  {attr_branch} 方块属性:')
             data_items = list(config_data.items())
             for i, (key, value) in enumerate(data_items):
                 is_last = (i == len(data_items) - 1)
                 branch = "└─" if is_last else "├─"
-                source.reply(f'§7│     {branch} §b{key}§7: §e{value}')
+                source.reply(f'§7│  {attr_indent}{branch} §b{key}§7: §e{value}')
         else:
-            source.reply('§7│  └─ 方块属性: §8无')
+            source.reply(f'§7│  {attr_branch} 方块属性: §8无')
+        if has_rule:
+            source.reply('§7│  └─ 匹配规则:')
+            rule_lines = record.rule.describe(record.block)
+            for i, line in enumerate(rule_lines):
+                branch = "└─" if i == len(rule_lines) - 1 else "├─"
+                source.reply(f'§7│     {branch} {line}')
+
+        # 方块实体数据断言，nbt_values 为 None 表示未获取（方块不匹配或获取失败）
+        nbt_match = None
+        if record.nbt is not None:
+            source.reply('§6├─ 方块实体数据')
+            for i, (path_text, path, expected) in enumerate(record.nbt):
+                branch = "└─" if i == len(record.nbt) - 1 else "├─"
+                shown = '§8不存在' if expected is None else f'§e{json.dumps(expected, ensure_ascii=False)}'
+                line = f'§7│  {branch} §b{path_text}§7: 期望 {shown}'
+                if nbt_values is not None:
+                    value = nbt_values.get(path, snbt.MISSING)
+                    actual = '§8不存在' if value is snbt.MISSING else f'§e{json.dumps(value, ensure_ascii=False, default=list)}'
+                    matched = nbt_matches(value, expected)
+                    line += f'§7，实际 {actual} {"§a✔" if matched else "§c✘"}'
+                    nbt_match = matched if nbt_match is None else nbt_match and matched
+                source.reply(line)
 
-        if success:
+        if success and result is not None:
+            actual_block, actual_data = result
             # 实际获取的方块信息
             source.reply('§6├─ 实际数据')
             source.reply(f'§7│  ├─ 方块类型: §e{actual_block}')
@@ -429,14 +2255,23 @@ def cmd_status(source: CommandSource, context: dict):
                 source.reply('§7│  └─ 方块属性: §8无')
 
             # 对比结果
-            block_match = (actual_block == checkpoint_data.get("block", ""))
-            data_match = (actual_data == config_data)
-            overall_match = block_match and data_match
+            block_match = record.block_matches(intern_block(actual_block))
+            data_match = record.state_matches(intern_state(actual_data))
 
             source.reply('§6├─ 状态分析')
             source.reply(f'§7│  ├─ 方块类型匹配: {"§a是" if block_match else "§c否"}')
             source.reply(f'§7│  ├─ 方块属性匹配: {"§a是" if data_match else "§c否"}')
-            source.reply(f'§7│  └─ 整体状态: {"§a机器已关闭" if overall_match else "§c机器正在运行"}')
+            if nbt_match is not None:
+                source.reply(f'§7│  ├─ 方块实体数据匹配: {"§a是" if nbt_match else "§c否"}')
+            source.reply(f'§7│  └─ 整体状态: {"§a机器已关闭" if verdict else "§c机器正在运行"}')
+        elif success:
+            # execute if block 只给出测试结果
+            source.reply('§6├─ 状态分析')
+            if verdict:
+                source.reply('§7│  ├─ 方块测试: §a通过（与配置匹配）')
+            else:
+                source.reply('§7│  ├─ 方块测试: §c未通过（无法获取详细方块信息）')
+            source.reply(f'§7│  └─ 整体状态: {"§a机器已关闭" if verdict else "§c机器正在运行"}')
         else:
             source.reply('§6├─ §c无法获取实际数据进行对比')
 
@@ -458,39 +2293,24 @@ def cmd_status(source: CommandSource, context: dict):
 
         source.reply(button_line)
 
-    # 支持嵌套路径查找
-    path_parts = item_name.split('.')
-    checkpoint = find_in_tree(CP_CONFIG.tree, path_parts)
-
-    if checkpoint:
-        world = checkpoint.get('world', 'overworld')
-        success = not block_info_getter.get_block_info(checkpoint['x'], checkpoint['y'], checkpoint['z'], world)
-
-        display_status_tree(
-            checkpoint,
-            block_info_getter.block_name if success else "获取失败",
-            block_info_getter.block_data if success else {},
-            success
-        )
-    else:
-        # 兼容旧数据
-        if item_name in CP_CONFIG.check_point:
-            pei = CP_CONFIG.check_point[item_name]
-            world = pei.get('world', 'overworld')  # 兼容旧数据，默认overworld
-            success = not block_info_getter.get_block_info(pei['x'], pei['y'], pei['z'], world)
-
-            display_status_tree(
-                pei,
-                block_info_getter.block_name if success else "获取失败",
-                block_info_getter.block_data if success else {},
-                success
-            )
-        else:
-            source.reply('§c配置不存在')
+    # 支持嵌套路径查找，树状结构优先于旧数据
+    snapshot = CP_SNAPSHOT
+    checkpoint = snapshot.find(item_name)
+    if checkpoint is None:
+        source.reply('§c配置不存在')
+        return
+
+    record = snapshot.record(item_name, checkpoint)
+    with QuerySession(block_info_getter, [record], CP_CONFIG.unloaded_policy, CP_CONFIG.query_backend) as access:
+        verdict, result, unloaded = access.inspect(record)
+    if unloaded:
+        source.reply('§e检查点所在区块未加载')
+
+    display_status_tree(checkpoint, record, verdict, result, access.nbt_values.get(record.path))
 
 
 @require_permission('del')
-@new_thread('Pb_CheckPoint_Del')
+@run_in_executor('Pb_CheckPoint_Del')
 def cmd_del(source: CommandSource, context: dict):
     """删除检查点或分组"""
     item_name = context.get('name') or context.get('n')
@@ -513,131 +2333,100 @@ def cmd_del(source: CommandSource, context: dict):
     # 支持删除嵌套路径
     path_parts = item_name.split('.')
 
-    if delete_from_tree(CP_CONFIG.tree, path_parts):
-        save_config()
-        source.reply(f'§a删除成功：{item_name}')
-    else:
-        # 兼容旧数据
-        if item_name in CP_CONFIG.check_point:
-            del CP_CONFIG.check_point[item_name]
-            # 从所有分组中移除
-            for group_name, group_data in CP_CONFIG.groups.items():
-                if item_name in group_data.get('items', []):
-                    group_data['items'].remove(item_name)
-            save_config()
+    with edit_tree() as draft:
+        if delete_from_tree(draft.tree, path_parts):
+            draft.commit()
             source.reply(f'§a删除成功：{item_name}')
         else:
-            source.reply('§e配置不存在')
-
-
-@require_permission('add')
-@new_thread('Pb_CheckPoint_Add')
-def cmd_add(source: CommandSource, context: dict):
-    # 解析路径和名称
-    name = context.get('name') or context.get('n')
-    path_parts = name.split('.')
-
-    # 如果只有坐标参数，直接添加到根级别
-    if len(path_parts) == 1:
-        # 检查名字是否已存在
-        if name in CP_CONFIG.tree:
-            source.reply('§c该名字已被使用')
-            return
-
-        # 获取坐标信息
-        x, y, z = context['x'], context['y'], context['z']
-        world = context.get('world')
-
-        # world参数处理
-        if not world:
-            world = get_player_world(source)
-            if not world:
-                source.reply('§c无法自动获取玩家维度，请手动指定 world (overworld/the_nether/the_end)')
-                return
-        world = str(world).lower()
-        if world not in BlockInfoGetter.ALLOWED_WORLDS:
-            source.reply('§cworld参数非法，仅支持 overworld/the_nether/the_end')
-            return
-
-        # 获取方块信息
-        if block_info_getter.get_block_info(x, y, z, world):
-            source.reply('§c未能获取方块信息')
-            return
-
-        # 添加检查点到树状结构
-        CP_CONFIG.tree[name] = {
-            'type': 'checkpoint',
-            'x': x,
-            'y': y,
-            'z': z,
-            'world': world,
-            'block': block_info_getter.block_name,
-            'data': block_info_getter.block_data
-        }
-        save_config()
-        source.reply(f'§a成功添加检查点 "{name}"')
-
-    else:
-        # 有路径，表示要添加到指定分组
-        if len(path_parts) < 2:
-            source.reply('§c路径格式错误，应为：group.subgroup.name')
-            return
+            # 兼容旧数据
+            if item_name in draft.check_point:
+                del draft.check_point[item_name]
+                # 从所有分组中移除
+                for group_name, group_data in draft.groups.items():
+                    if item_name in group_data.get('items', []):
+                        group_data['items'].remove(item_name)
+                draft.commit()
+                source.reply(f'§a删除成功：{item_name}')
+            else:
+                source.reply('§e配置不存在')
 
-        group_path = '.'.join(path_parts[:-1])
-        item_name = path_parts[-1]
 
-        # 检查分组是否存在
-        current = CP_CONFIG.tree
+def find_add_target(source: CommandSource, tree: dict, group_path: str, name: str) -> Optional[dict]:
+    """
+    检查分组存在且名字未被使用，group_path 为空时表示根级别
+    返回: 新检查点所在的 children 字典；不满足条件时回复原因并返回 None
+    """
+    current = tree
+    if group_path:
         for part in group_path.split('.'):
             if part not in current:
                 source.reply(f'§c分组路径 "{group_path}" 不存在，请先创建分组')
-                return
+                return None
             if current[part]['type'] != 'group':
                 source.reply(f'§c路径 "{part}" 不是分组')
-                return
-            current = current[part].setdefault('children', {})
+                return None
+            current = current[part].get('children', {})
+    if name in current:
+        source.reply(f'§c名字 "{name}" 在分组 "{group_path}" 中已存在' if group_path else '§c该名字已被使用')
+        return None
+    return current
 
-        # 检查名字是否已在该分组中存在
-        if item_name in current:
-            source.reply(f'§c名字 "{item_name}" 在分组 "{group_path}" 中已存在')
-            return
 
-        # 获取坐标信息
-        x, y, z = context['x'], context['y'], context['z']
-        world = context.get('world')
+@require_permission('add')
+@run_in_executor('Pb_CheckPoint_Add')
+def cmd_add(source: CommandSource, context: dict):
+    # 解析路径和名称，只有名字时添加到根级别
+    name = context.get('name') or context.get('n')
+    group_path, _, item_name = name.rpartition('.')
+
+    # 先按当前快照检查一次，避免为无效请求查询方块
+    if find_add_target(source, CP_SNAPSHOT.tree, group_path, item_name) is None:
+        return
+
+    # 获取坐标信息
+    x, y, z = context['x'], context['y'], context['z']
+    world = context.get('world')
 
-        # world参数处理
+    # world参数处理
+    if not world:
+        world = get_player_world(source)
         if not world:
-            world = get_player_world(source)
-            if not world:
-                source.reply('§c无法自动获取玩家维度，请手动指定 world (overworld/the_nether/the_end)')
-                return
-        world = str(world).lower()
-        if world not in BlockInfoGetter.ALLOWED_WORLDS:
-            source.reply('§cworld参数非法，仅支持 overworld/the_nether/the_end')
+            source.reply('§c无法自动获取玩家维度，请手动指定 world (overworld/the_nether/the_end)')
             return
+    world = str(world).lower()
+    if world not in BlockInfoGetter.ALLOWED_WORLDS:
+        source.reply('§cworld参数非法，仅支持 overworld/the_nether/the_end')
+        return
 
-        # 获取方块信息
-        if block_info_getter.get_block_info(x, y, z, world):
-            source.reply('§c未能获取方块信息')
-            return
+    # 获取方块信息，查询期间不持有写锁
+    result = block_info_getter.query_block(x, y, z, world)
+    if result is None:
+        source.reply('§c未能获取方块信息')
+        return
 
-        # 添加检查点到指定分组
+    with edit_tree() as draft:
+        # 查询期间配置可能已被修改，重新检查
+        current = find_add_target(source, draft.tree, group_path, item_name)
+        if current is None:
+            return
         current[item_name] = {
             'type': 'checkpoint',
             'x': x,
             'y': y,
             'z': z,
             'world': world,
-            'block': block_info_getter.block_name,
-            'data': block_info_getter.block_data
+            'block': result[0],
+            'data': result[1]
         }
-        save_config()
+        draft.commit()
+    if group_path:
         source.reply(f'§a成功在分组 "{group_path}" 中添加检查点 "{item_name}"')
+    else:
+        source.reply(f'§a成功添加检查点 "{name}"')
 
 
 @require_permission('add_group')
-@new_thread('Pb_CheckPoint_AddG')
+@run_in_executor('Pb_CheckPoint_AddG')
 def cmd_add_group(source: CommandSource, context: dict):
     """添加分组，支持多级嵌套路径"""
     group_path = context['group_path']
@@ -646,90 +2435,298 @@ def cmd_add_group(source: CommandSource, context: dict):
         source.reply('§c分组名不能为空')
         return
 
-    # 解析路径
-    path_parts = group_path.split('.')
-    current = CP_CONFIG.tree
+    with edit_tree() as draft:
+        # 解析路径
+        path_parts = group_path.split('.')
+        current = draft.tree
+
+        # 检查并创建路径
+        for i, part in enumerate(path_parts):
+            if part in current:
+                if current[part]['type'] != 'group':
+                    current_path = '.'.join(path_parts[:i + 1])
+                    source.reply(f'§c路径 "{current_path}" 已存在且不是分组')
+                    return
+                current = current[part].setdefault('children', {})
+            else:
+                # 创建新分组
+                current[part] = {
+                    'type': 'group',
+                    'description': '',
+                    'children': {}
+                }
+                if i < len(path_parts) - 1:
+                    current = current[part]['children']
+
+        draft.commit()
+        source.reply(f'§a成功创建分组 "{group_path}"')
+
+
+INSPECT_LIST_LIMIT = 10
+
+
+def format_block(block: str, props: dict) -> str:
+    if not props:
+        return block
+    return f'{block}[{",".join(f"{k}={v}" for k, v in props.items())}]'
+
+
+def format_time(timestamp: float) -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+def display_backup_verdict(source: CommandSource, backup_id: int, verdict: dict, cached: bool):
+    checked_at = format_time(verdict.get('time', 0))
+    source.reply(f'§a=== 备份 #{backup_id} 检查结果 ===')
+    source.reply(f'§7检查点: §e{verdict.get("checked", 0)} §7耗时: §e{verdict.get("duration", 0)}s §7时间: §e{checked_at}'
+                 + (' §8(缓存)' if cached else ''))
+    for path, block in verdict.get('failed', {}).items():
+        source.reply(f'§c  ✘ {path} §7实际: §e{format_block(*block)}' if block else f'§c  ✘ {path}')
+    for path in verdict.get('missing', []):
+        source.reply(f'§e  ? {path} §7所在区块不在备份中')
+    failed, missing = verdict.get('failed', {}), verdict.get('missing', [])
+    if failed:
+        source.reply(f'§c✘ 备份中有 {len(failed)} 台机器未关闭')
+    elif missing:
+        # 旧版本保存的结果中缺少区块时也标记为通过，这里按缺少的检查点判断
+        source.reply(f'§e? 有 {len(missing)} 个检查点未能在备份中读取，无法确认可以回档')
+    else:
+        command = f'!!pb back {backup_id}'
+        source.reply(RText('§a✔ 所有机器均已关闭，可以回档 ') + RText(f'§b[{command}]')
+                     .set_click_event(RAction.suggest_command, command).set_hover_text('§a点击填充到聊天框'))
+
+
+@require_permission('inspect')
+@run_in_executor('Pb_CheckPoint_Inspect')
+def cmd_inspect(source: CommandSource, context: dict):
+    """扫描指定备份中的检查点状态，结果按备份缓存；不带参数时列出已缓存的结果"""
+    backup_id = context.get('backup_id')
+    checkpoints = CP_SNAPSHOT.index
+    if backup_id is None:
+        try:
+            verdicts = check_history.list_verdicts(INSPECT_LIST_LIMIT)
+        except sqlite3.Error as e:
+            source.reply(f'§c读取备份检查结果失败: {e}')
+            return
+        if not verdicts:
+            source.reply('§e暂无备份检查结果，使用 !!pb cp inspect <备份ID> 扫描备份')
+            return
+        sig = checkpoints_signature(checkpoints)
+        source.reply('§a=== 备份检查结果 ===')
+        for verdict in verdicts:
+            if verdict['failed']:
+                state = f'§c✘ {len(verdict["failed"])} 台未关闭'
+            elif verdict['missing']:
+                state = f'§e? {len(verdict["missing"])} 个无法读取'
+            else:
+                state = '§a✔ 全部关闭'
+            stale = '' if verdict['sig'] == sig else ' §8(检查点已变化)'
+            source.reply(f'§7#{verdict["backup_id"]} {state} §7检查点 {verdict["checked"]}{stale}')
+        return
 
-    # 检查并创建路径
-    for i, part in enumerate(path_parts):
-        if part in current:
-            if current[part]['type'] != 'group':
-                current_path = '.'.join(path_parts[:i + 1])
-                source.reply(f'§c路径 "{current_path}" 已存在且不是分组')
+    if not checkpoints:
+        source.reply('§e没有需要检查的检查点')
+        return
+    verdict = get_cached_verdict(backup_id, checkpoints)
+    # 缺少区块可能是 level_dir 等配置错误导致的，这样的结果不复用
+    cached = verdict is not None and not verdict['missing']
+    if not cached:
+        try:
+            reader, level_dir = open_backup_reader()
+        except (BackupReadError, sqlite3.Error) as e:
+            source.reply(f'§c无法读取 PrimeBackup 数据库: {e}')
+            return
+        try:
+            if not reader.has_backup(backup_id):
+                source.reply(f'§c备份 #{backup_id} 不存在')
                 return
-            current = current[part].setdefault('children', {})
+            source.reply(f'§7正在扫描备份 #{backup_id}...')
+            verdict = verify_backup(reader, level_dir, backup_id, checkpoints)
+        except (BackupReadError, sqlite3.Error, OSError, ValueError, ImportError) as e:
+            source.reply(f'§c扫描备份 #{backup_id} 失败: {e}')
+            return
+        finally:
+            reader.close()
+        save_backup_verdict(backup_id, verdict)
+    display_backup_verdict(source, backup_id, verdict, cached)
+
+
+HISTORY_LIMIT = 10
+KIND_NAMES = {KIND_GATE: '备份前检查', KIND_BACKUP: '备份校验'}
+
+
+@require_permission('history')
+@run_in_executor('Pb_CheckPoint_History')
+def cmd_history(source: CommandSource, context: dict):
+    """查询检查结果历史，指定检查点时列出该检查点未通过检查的记录"""
+    name = context.get('name')
+    try:
+        if name is None:
+            latest_clean = check_history.latest_clean_backup()
+            results = check_history.list_results(HISTORY_LIMIT)
         else:
-            # 创建新分组
-            current[part] = {
-                'type': 'group',
-                'description': '',
-                'children': {}
-            }
-            if i < len(path_parts) - 1:
-                current = current[part]['children']
+            records = check_history.checkpoint_history(name, HISTORY_LIMIT)
+    except sqlite3.Error as e:
+        source.reply(f'§c读取检查历史失败: {e}')
+        return
 
-    save_config()
-    source.reply(f'§a成功创建分组 "{group_path}"')
+    if name is not None:
+        if not records:
+            source.reply(f'§a检查点 §e{name} §a没有未通过检查的记录')
+            return
+        source.reply(f'§a=== 检查点历史：{name} ===')
+        for record in records:
+            target = f'#{record["backup_id"]}' if record['backup_id'] is not None else '未备份'
+            if record['status'] != 'failed':
+                state = '§e无法获取状态'
+            elif record['block'] is not None:
+                state = f'§c未关闭 §7实际: §e{format_block(record["block"], record["state"])}'
+            else:
+                state = '§c未关闭'
+            forced = ' §6(强制)' if record['forced'] else ''
+            source.reply(f'§7[{format_time(record["time"])}] §e{target} §7{KIND_NAMES.get(record["kind"], record["kind"])} {state}{forced}')
+        return
 
+    source.reply('§a=== 检查历史 ===')
+    if latest_clean is None:
+        source.reply('§7暂无确认所有机器均已关闭的备份')
+    else:
+        command = f'!!pb back {latest_clean}'
+        source.reply(RText(f'§a最近一个所有机器均已关闭的备份: ') + RText(f'§b[#{latest_clean}]')
+                     .set_click_event(RAction.suggest_command, command).set_hover_text(f'§a点击填充: {command}'))
+    for result in results:
+        target = f'#{result["backup_id"]}' if result['backup_id'] is not None else '未备份'
+        if result['clean']:
+            state = '§a✔'
+        else:
+            state = f'§c✘ {len(result["failed"])} 台未关闭'
+            if result['missing']:
+                state += f' §e{len(result["missing"])} 个无法获取'
+        forced = ' §6(强制)' if result['forced'] else ''
+        source.reply(f'§7[{format_time(result["time"])}] §e{target} §7{KIND_NAMES.get(result["kind"], result["kind"])} '
+                     f'{state}{forced} §7耗时 {result["duration"]}s')
 
-def check(source: CommandSource, group=False):
-    """检查所有检查点状态，支持新树状结构和旧数据兼容"""
-    if group:
-        lis = ""
-    f = 1
 
-    def check_tree_checkpoints(tree_dict, path_prefix=""):
-        """递归检查树状结构中的所有检查点"""
-        nonlocal lis, f
-        for name, item in tree_dict.items():
-            if item['type'] == 'checkpoint':
-                full_name = f"{path_prefix}.{name}" if path_prefix else name
-                time.sleep(0.2)
-                world = item.get('world', 'overworld')
-                if block_info_getter.get_block_info(item['x'], item['y'], item['z'], world):
-                    if not group:
-                        source.reply(f'§c未能获取机器 §e{full_name} 的状态')
-                    f = 0
-                    continue
-                if block_info_getter.block_name != item['block'] or block_info_getter.block_data != item['data']:
-                    if group:
-                        lis += full_name + ','
-                    if not group:
-                        source.get_server().broadcast(f'§c机器 §e{full_name} §c貌似没有关闭')
-                    f = 0
-            elif item['type'] == 'group':
-                children = item.get('children', {})
-                if children:
-                    new_prefix = f"{path_prefix}.{name}" if path_prefix else name
-                    check_tree_checkpoints(children, new_prefix)
-
-    # 检查新树状结构
-    if CP_CONFIG.tree:
-        check_tree_checkpoints(CP_CONFIG.tree)
-
-    # 兼容检查旧数据
-    for index in CP_CONFIG.check_point:
-        time.sleep(0.2)
-        world = CP_CONFIG.check_point[index].get('world', 'overworld')  # 兼容旧数据，默认overworld
-        if block_info_getter.get_block_info(CP_CONFIG.check_point[index]['x'], CP_CONFIG.check_point[index]['y'],
-                                            CP_CONFIG.check_point[index]['z'], world):
-            if not group:
-                source.reply(f'§c未能获取机器 §e{index} 的状态')
-            f = 0
-            continue
-        if block_info_getter.block_name != CP_CONFIG.check_point[index]['block'] or block_info_getter.block_data != \
-                CP_CONFIG.check_point[index]['data']:
-            if group:
-                lis += index + ','
-            if not group:
-                source.get_server().broadcast(f'§c机器 §e{index} §c貌似没有关闭')
-            f = 0
-
-    if group:
-        return lis
-    if f:
-        return False
-    return True
+TRACE_DEFAULT_COUNT = 20
+
+
+@require_permission('trace')
+def cmd_trace(source: CommandSource, context: dict):
+    """显示最近的追踪记录；不进入指令队列，检查进行中也能立即查看"""
+    records = tracer.recent(context.get('count', TRACE_DEFAULT_COUNT))
+    if not records:
+        source.reply('§e暂无追踪记录')
+        return
+    source.reply(f'§a=== 最近 {len(records)} 条追踪记录 ===')
+    for record in records:
+        started = time.strftime('%H:%M:%S', time.localtime(record.start)) + f'.{int(record.start * 1000) % 1000:03d}'
+        detail = ' '.join(f'{key}={value}' for key, value in record.detail.items())
+        source.reply(f'§7{started} §e{"  " * record.depth}{record.name} §b{record.duration * 1000:.1f}ms §7{detail}')
+
+
+@require_permission('watch')
+def cmd_watch(source: CommandSource, context: dict):
+    """持续监视分组中检查点的状态变化；在独立线程中运行，不占用指令队列"""
+    group_path = context.get('group_path')
+    if not CP_SNAPSHOT.count(group_path):
+        source.reply(f'§c分组 §e{group_path} §c不存在或没有检查点')
+        return
+    start_watch(source, group_path)
+    source.reply(f'§7正在监视 §e{group_path}§7，机器全部关闭、超过 {CP_CONFIG.watch_timeout} 秒或使用 §e!!pb cp unwatch §7时停止')
+
+
+@require_permission('watch')
+def cmd_unwatch(source: CommandSource, context: dict):
+    if not stop_watch(get_source_key(source), 'unwatch'):
+        source.reply('§e当前没有正在进行的监视')
+
+
+class CheckReport:
+    """一次备份前检查的结构化结果"""
+    __slots__ = ('failed', 'unknown', 'checked', 'duration', 'checkpoints')
+
+    def __init__(self):
+        # {路径: (方块, 属性) 或 None（未获取到详情）}
+        self.failed: Dict[str, Optional[Tuple[str, dict]]] = {}
+        # 无法获取状态的检查点路径
+        self.unknown: list = []
+        self.checked = 0
+        self.duration = 0.0
+        # 本次检查所用快照中的检查点
+        self.checkpoints: list = []
+
+    @property
+    def clean(self) -> bool:
+        return not self.failed and not self.unknown
+
+
+# 逐个查询检查点时两次查询之间的间隔（秒），避免短时间内向服务端发送大量指令
+QUERY_INTERVAL = 0.2
+
+
+def check(source: CommandSource) -> CheckReport:
+    """检查所有检查点状态，支持新树状结构和旧数据兼容"""
+    report = CheckReport()
+    # 整个检查过程只使用这一版本的配置，检查期间的修改从下一次检查开始生效
+    index = CP_SNAPSHOT.index
+    report.checkpoints = index
+    report.checked = len(index)
+    start = time.time()
+
+    checkpoints = index
+    if CP_CONFIG.gate_mode == 'datapack':
+        with tracer.span('datapack_gate'):
+            result = run_datapack_gate(block_info_getter)
+        if result is not None:
+            # 数据包已覆盖的检查点只需重新查询未通过的部分，以便给出准确的提示
+            failed, ids = result
+            covered = set(map(id, ids))
+            checkpoints = failed + [item for item in checkpoints if id(item) not in covered]
+
+    # 增量检查只用于逐个查询，数据包的结果总是最新的
+    tracker = None
+    if checkpoints is index and CP_CONFIG.incremental_check:
+        tracker = IncrementalTracker(block_info_getter)
+        with tracer.span('incremental_filter'):
+            checkpoints = tracker.filter(checkpoints)
+        skipped = len(index) - len(checkpoints)
+        if skipped:
+            source.reply(f'§7增量检查：跳过 {skipped} 个区块未变化的检查点')
+
+    with QuerySession(block_info_getter, checkpoints, CP_CONFIG.unloaded_policy, CP_CONFIG.query_backend) as access:
+        for item in checkpoints:
+            full_name = item.path
+            if not access.is_unloaded(item):
+                time.sleep(QUERY_INTERVAL)
+            with tracer.span('checkpoint', path=full_name):
+                verdict, result, unloaded = access.inspect(item)
+            if tracker is not None:
+                tracker.record(item, verdict)
+            if verdict is None:
+                if unloaded:
+                    source.reply(f'§c机器 §e{full_name} §c所在区块未加载，无法获取状态')
+                else:
+                    source.reply(f'§c未能获取机器 §e{full_name} 的状态')
+                report.unknown.append(full_name)
+                continue
+            if not verdict:
+                source.get_server().broadcast(f'§c机器 §e{full_name} §c貌似没有关闭')
+                report.failed[full_name] = result
+    if tracker is not None:
+        tracker.save()
+
+    report.duration = time.time() - start
+    return report
+
+
+def record_check(report: CheckReport, forced: bool) -> Optional[int]:
+    """记录备份前检查的结果，返回记录 ID"""
+    try:
+        return check_history.record(KIND_GATE, report.clean, report.checked, report.duration, report.failed,
+                                    report.unknown, forced=forced, sig=checkpoints_signature(report.checkpoints))
+    except sqlite3.Error as e:
+        PlServer.logger.warning(f'[ExtraPrimeBackup] 保存检查结果失败: {e}')
+        return None
 
 
 help_callback = None
@@ -746,20 +2743,37 @@ def help_callback_override(source: CommandSource, context: CommandContext):
 
 
 @require_permission('ignore')
-@new_thread('Pb_CheckPoint_Make')
+@run_in_executor('Pb_CheckPoint_Make', PRIORITY_BACKUP)
 def make_callback_override(source: CommandSource, context: CommandContext, ignore=True):
     global CP_CONFIG, block_info_getter  # 确保使用当前插件实例
-    if check(source) and ignore:
-        source.get_server().broadcast("§e请关闭所有机器后再次确定，或者使用 !!pb ignore 强制执行")
+    with tracer.span('make', forced=not ignore) as span:
+        with tracer.span('check', checkpoints=len(CP_SNAPSHOT.index)):
+            report = check(source)
+        span.detail.update(failed=len(report.failed), unknown=len(report.unknown))
+        result_id = record_check(report, forced=not ignore)
+        if not report.clean and ignore:
+            source.get_server().broadcast("§e请关闭所有机器后再次确定，或者使用 !!pb ignore 强制执行")
+            return
+        if not ignore:
+            note = f'§e强制备份 未关机机器(§c{",".join(report.failed)}§e)'
+            if context.get('comment', None) is None:
+                context['comment'] = note
+            else:
+                context['comment'] = context['comment'] + ' ' + note
+        run_make_callback(source, context, result_id)
+
+
+def run_make_callback(source: CommandSource, context: CommandContext, result_id: Optional[int] = None):
+    """执行 PrimeBackup 原本的 !!pb make，然后在后台等待备份完成，关联检查结果并按配置复核备份"""
+    if make_callback is None:
+        source.reply('§c未能找到 PrimeBackup 的 !!pb make 指令，备份未执行')
         return
-    if not ignore:
-        if context.get('comment', None) is None:
-            context['comment'] = f'§e强制备份 未关机机器(§c{check(source, True)}§e)'
-        else:
-            context['comment'] = context['comment'] + f' §e强制备份 未关机机器(§c{check(source, True)}§e)'
-        make_callback(source, context)
-    else:
+    previous_id = get_latest_backup_id()
+    with tracer.span('pb_callback'):
         make_callback(source, context)
+    if previous_id is not None and (result_id is not None or CP_CONFIG.post_backup_verify):
+        threading.Thread(target=track_backup, args=(source, previous_id, result_id, CP_CONFIG.post_backup_verify),
+                         name='ExtraPrimeBackup_TrackBackup', daemon=True).start()
 
 
 def extract_function_name(func_str):
@@ -769,30 +2783,39 @@ def extract_function_name(func_str):
     return None
 
 
+def override_primebackup(server, builder) -> bool:
+    """尝试覆写一次 PrimeBackup 的指令，返回 !!pb make 当前是否已被覆写"""
+    global help_callback, make_callback
+    pl: AbstractPlugin = getattr(server, '_PluginServerInterface__plugin')
+    node = pl.mcdr_server.command_manager.root_nodes.get('!!pb', [None])[0]
+    if node is None:
+        return False
+    make_node = node.node._children_literal.get('make', [None])[0]
+    if make_node is None:
+        return False
+    # 检查是否已被覆写，或者强制重新覆写以确保指向当前插件实例
+    current_callback_name = extract_function_name(getattr(make_node, '_callback', ''))
+    if (current_callback_name != extract_function_name(make_callback_override) or
+            make_callback is None):
+        make_callback = copy(getattr(make_node, '_callback', None))
+        builder.add_children_for(node.node)
+        help_callback = copy(getattr(node.node, '_callback', None))
+        builder.add_children_for(node.node)
+        make_node._callback = make_callback_override
+        node.node._callback = help_callback_override
+        server.logger.info('[ExtraPrimeBackup] 覆写 primebackup 指令成功')
+    return True
+
+
 def monitor_and_override_primebackup(server, builder, timeout=None):
-    global help_callback, make_callback, override_monitor_running
+    global override_monitor_running
     with override_monitor_lock:
         override_monitor_running = True
         server.logger.info('[ExtraPrimeBackup] 启动覆写监控线程')
         start_time = time.time()
         while override_monitor_running:
             try:
-                pl: AbstractPlugin = getattr(server, '_PluginServerInterface__plugin')
-                node = pl.mcdr_server.command_manager.root_nodes.get('!!pb', [None])[0]
-                if node is not None:
-                    make_node = node.node._children_literal.get('make', [None])[0]
-                    if make_node is not None:
-                        # 检查是否已被覆写，或者强制重新覆写以确保指向当前插件实例
-                        current_callback_name = extract_function_name(getattr(make_node, '_callback', ''))
-                        if (current_callback_name != extract_function_name(make_callback_override) or
-                                make_callback is None):
-                            make_callback = copy(getattr(make_node, '_callback', None))
-                            builder.add_children_for(node.node)
-                            help_callback = copy(getattr(node.node, '_callback', None))
-                            builder.add_children_for(node.node)
-                            make_node._callback = make_callback_override
-                            node.node._callback = help_callback_override
-                            server.logger.info('[ExtraPrimeBackup] 覆写 primebackup 指令成功')
+                override_primebackup(server, builder)
             except Exception as e:
                 server.logger.warning(f'[ExtraPrimeBackup] 覆写 primebackup 指令异常: {e}')
             # 检查超时
@@ -807,16 +2830,110 @@ def monitor_and_override_primebackup(server, builder, timeout=None):
         server.logger.info('[ExtraPrimeBackup] 覆写监控线程已停止')
 
 
+# ---------- Hot Reload ---------
+# 重载时交给新实例的数据的格式版本，修改 export_runtime() 导出的内容时需要递增
+# 交接的只有内置类型与标准库对象，由新实例用自己的类重新包装，因此插件代码的修改在重载后总能生效
+HANDOVER_VERSION = 7
+# 卸载后等待正在执行的任务结束的时间（秒），到期后释放执行器与未被接管的 RCON 连接
+HANDOVER_GRACE = 10
+handover_timer: Optional[threading.Timer] = None
+# 卸载时停止的监视，正在进行的一轮轮询仍使用本实例查询
+unloaded_watchers: list = []
+
+
+def release_runtime(executor: Optional[CommandExecutor], getter: Optional[BlockInfoGetter]):
+    """释放未被新实例接管的执行器与 RCON 连接"""
+    if executor is not None:
+        executor.shutdown()
+    if getter is not None and getter.rcon is not None:
+        getter.rcon.close()
+
+
+def export_runtime(forward) -> dict:
+    """
+    由重载后的新实例调用，导出可以继续使用的数据
+    排队中的任务交给 forward 在新实例中重新提交；正在执行的任务仍由本实例完成，期间由新实例转发服务端输出
+    两个实例读取同一份服务端输出，本实例仍可能在等待输出时新实例不从日志中查询，避免互相拿走对方的响应
+    """
+    data = {'incremental_cache': incremental_cache, 'trace': tracer.export()}
+    getter, executor = block_info_getter, command_executor
+    if getter is not None:
+        data['latency'] = getter.latency.samples()
+        data['supports_loaded'] = getter.supports_loaded
+        data['supports_info'] = getter.supports_info
+        if getter.rcon is not None:
+            pool = getter.rcon
+            data['rcon'] = (pool.host, pool.port, pool.password, pool.export_connections())
+    if executor is not None:
+        executor.hand_over(forward)
+        if getter is not None:
+            watches = list(unloaded_watchers)
+
+            def busy() -> bool:
+                # 排队中的任务已经转交，正在执行的任务、轮询与屏障结束后不会再有新的查询
+                return (executor.busy or any(watcher.thread.is_alive() for watcher in watches)
+                        or (getter._barrier is not None and time.time() - getter._barrier_at < BARRIER_EXPIRE))
+
+            data['on_info'] = (getter.on_info, busy)
+    return data
+
+
+def adopt_previous(prev):
+    """接管上一个插件实例导出的数据，版本不兼容或不是重载时什么也不做"""
+    global incremental_cache, previous_info_handler
+    if prev is None or getattr(prev, 'HANDOVER_VERSION', None) != HANDOVER_VERSION or not hasattr(prev, 'export_runtime'):
+        return
+    data = prev.export_runtime(resubmit_task)
+    if data.get('incremental_cache') is not None:
+        incremental_cache = data['incremental_cache']
+    tracer.restore(data.get('trace', []))
+    block_info_getter.latency.extend(data.get('latency', []))
+    block_info_getter.supports_loaded = data.get('supports_loaded', True)
+    block_info_getter.supports_info = data.get('supports_info', True)
+    if 'rcon' in data:
+        host, port, password, sockets = data['rcon']
+        pool = block_info_getter.rcon
+        if pool is not None and (pool.host, pool.port, pool.password) == (host, port, password):
+            pool.adopt_connections(sockets)
+        else:
+            for sock in sockets:
+                sock.close()
+    previous_info_handler = data.get('on_info')
+    if previous_info_handler is not None:
+        block_info_getter.previous_busy = previous_info_handler[1]
+
+
 def on_load(server: PluginServerInterface, prev):
     global CP_CONFIG, block_info_getter, PlServer, override_monitor_thread, override_monitor_running, PERM_CONFIG
-    block_info_getter = BlockInfoGetter(server)
+    global command_executor, check_history, checkpoint_store
     PlServer = server
+    check_history = open_check_history()
 
     # 使用MCDR标准方法加载权限配置
     PERM_CONFIG = server.load_config_simple('config.json', target_class=PermissionConfig)
 
-    # 加载检查点配置
     CP_CONFIG = server.load_config_simple(PBCHECKPOINT, target_class=PbCheckPoint, in_data_folder=True)
+    # 取值无效时各处均按第一个（默认）取值处理
+    for field, modes in (('storage', STORAGE_MODES), ('gate_mode', GATE_MODES),
+                         ('unloaded_policy', UNLOADED_POLICIES), ('query_backend', QUERY_BACKENDS)):
+        if getattr(CP_CONFIG, field) not in modes:
+            server.logger.warning(f'[ExtraPrimeBackup] 未知的 {field}: {getattr(CP_CONFIG, field)}，'
+                                  f'可选值为 {"/".join(modes)}，使用默认值 {modes[0]}')
+    block_info_getter = BlockInfoGetter(server)
+    block_info_getter.retries = max(0, CP_CONFIG.query_retries)
+    block_info_getter.hedge = CP_CONFIG.query_hedge
+    block_info_getter.debug_log = CP_CONFIG.debug_log
+    block_info_getter.query_backend = CP_CONFIG.query_backend
+    tracer.resize(CP_CONFIG.trace_size)
+    checkpoint_store = open_checkpoint_store()
+    rebuild_index()
+    command_executor = CommandExecutor(server, CP_CONFIG.worker_count, CP_CONFIG.queue_size)
+
+    # MCDR 启用 RCON 时通过连接池查询，否则从服务端日志中匹配
+    rcon_config = server.get_mcdr_config().get('rcon', {})
+    if CP_CONFIG.rcon_pool_size > 0 and rcon_config.get('enable', False):
+        block_info_getter.rcon = RconPool(rcon_config.get('address', '127.0.0.1'), rcon_config.get('port', 25575),
+                                          rcon_config.get('password', ''), CP_CONFIG.rcon_pool_size)
     override_mode = CP_CONFIG.override_mode
     pl: AbstractPlugin = getattr(server, '_PluginServerInterface__plugin')
     server.get_plugin_command_source()
@@ -836,6 +2953,17 @@ def on_load(server: PluginServerInterface, prev):
         builder.command(f'{i} st <name>', cmd_status)
         builder.command(f'{i} del <name>', cmd_del)
         builder.command(f'{i} update <name>', cmd_update)
+        builder.command(f'{i} update <name> -r', cmd_update_group)
+        builder.command(f'{i} inspect', cmd_inspect)
+        builder.command(f'{i} inspect <backup_id>', cmd_inspect)
+        builder.command(f'{i} history', cmd_history)
+        builder.command(f'{i} history <name>', cmd_history)
+        builder.command(f'{i} trace', cmd_trace)
+        builder.command(f'{i} trace <count>', cmd_trace)
+        builder.command(f'{i} watch <group_path>', cmd_watch)
+        builder.command(f'{i} unwatch', cmd_unwatch)
+        builder.arg('count', Integer)
+        builder.arg('backup_id', Integer)
         # 添加分组
         builder.command(f'{i} add g <group_path>', cmd_add_group)
         # 添加检查点到指定分组
@@ -865,6 +2993,15 @@ def on_load(server: PluginServerInterface, prev):
         builder.command('ignore', lambda src, tex: make_callback_override(src, tex, False))
         builder.arg('comment', GreedyText)
 
+    # 立即覆写一次，重载时不留下 !!pb make 未被检查的空档
+    try:
+        override_primebackup(server, builder)
+    except Exception as e:
+        server.logger.warning(f'[ExtraPrimeBackup] 覆写 primebackup 指令异常: {e}')
+
+    # 重载时接管上一个实例的数据与排队中的任务，须在覆写之后进行，重新提交的 !!pb make 才能找到原始回调
+    adopt_previous(prev)
+
     with override_monitor_lock:
         # 关闭旧线程
         if override_monitor_thread is not None and override_monitor_thread.is_alive():
@@ -899,13 +3036,22 @@ def on_unload(server: PluginServerInterface):
     """
     插件卸载时优雅地停止监控线程、取消覆写、清除命令并重载 PrimeBackup 插件
     """
-    global override_monitor_running, override_monitor_thread, help_callback, make_callback
+    global override_monitor_running, override_monitor_thread, help_callback, handover_timer, unloaded_watchers
+
+    # 0. 延迟释放指令执行器与 RCON 连接：正在执行的任务在此期间完成，空闲的连接与排队中的任务重载时由新实例接管
+    handover_timer = threading.Timer(HANDOVER_GRACE, release_runtime, args=(command_executor, block_info_getter))
+    handover_timer.daemon = True
+    handover_timer.start()
 
-    # 1. 停止监控线程
+    # 备份扫描线程池与监视线程不参与交接，新实例按需重新创建
+    shutdown_scan_pool()
+    unloaded_watchers = stop_all_watches('unload')
+
+    # 1. 停止监控线程（监控线程运行期间持有 override_monitor_lock，需先发出停止信号）
+    override_monitor_running = False
     with override_monitor_lock:
         if override_monitor_thread is not None and override_monitor_thread.is_alive():
             server.logger.info('[ExtraPrimeBackup] 正在停止覆写监控线程...')
-            override_monitor_running = False
             override_monitor_thread.join(timeout=2)
             if override_monitor_thread.is_alive():
                 server.logger.warning('[ExtraPrimeBackup] 监控线程未能在超时时间内停止')
@@ -949,15 +3095,14 @@ def on_unload(server: PluginServerInterface):
     except Exception as e:
         server.logger.warning(f'[ExtraPrimeBackup] 清除命令时发生异常: {e}')
 
-    # 5. 清理全局变量
+    # 5. 清理全局变量；make_callback 保留，重载前已开始的备份检查仍由本实例完成，之后需要调用原始回调
     help_callback = None
-    make_callback = None
 
     server.logger.info('[ExtraPrimeBackup] 插件完全卸载完成，所有命令已清除')
 
 
 @require_permission('add_to_group')
-@new_thread('Pb_CheckPoint_AddGT')
+@run_in_executor('Pb_CheckPoint_AddGT')
 def cmd_add_to_group(source: CommandSource, context: dict):
     """向指定分组添加检查点"""
     group_path = context['group_path']
@@ -976,62 +3121,41 @@ def cmd_add_to_group(source: CommandSource, context: dict):
         source.reply('§cworld参数非法，仅支持 overworld/the_nether/the_end')
         return
 
-    # 检查分组是否存在
-    current = CP_CONFIG.tree
-    path_parts = group_path.split('.')
-    for part in path_parts:
-        if part not in current:
-            source.reply(f'§c分组路径 "{group_path}" 不存在，请先创建分组')
-            return
-        if current[part]['type'] != 'group':
-            source.reply(f'§c路径 "{part}" 不是分组')
-            return
-        current = current[part].setdefault('children', {})
-
-    # 检查名字是否已在该分组中存在
-    if name in current:
-        source.reply(f'§c名字 "{name}" 在分组 "{group_path}" 中已存在')
+    # 先按当前快照检查一次，避免为无效请求查询方块
+    if find_add_target(source, CP_SNAPSHOT.tree, group_path, name) is None:
         return
 
-    # 获取方块信息
-    if block_info_getter.get_block_info(x, y, z, world):
+    # 获取方块信息，查询期间不持有写锁
+    result = block_info_getter.query_block(x, y, z, world)
+    if result is None:
         source.reply('§c未能获取方块信息')
         return
 
-    # 添加检查点到指定分组
-    current[name] = {
-        'type': 'checkpoint',
-        'x': x,
-        'y': y,
-        'z': z,
-        'world': world,
-        'block': block_info_getter.block_name,
-        'data': block_info_getter.block_data
-    }
-    save_config()
+    with edit_tree() as draft:
+        # 查询期间配置可能已被修改，重新检查
+        current = find_add_target(source, draft.tree, group_path, name)
+        if current is None:
+            return
+        # 添加检查点到指定分组
+        current[name] = {
+            'type': 'checkpoint',
+            'x': x,
+            'y': y,
+            'z': z,
+            'world': world,
+            'block': result[0],
+            'data': result[1]
+        }
+        draft.commit()
     source.reply(f'§a成功在分组 "{group_path}" 中添加检查点 "{name}"')
 
 
 @require_permission('update')
-@new_thread('Pb_CheckPoint_Update')
+@run_in_executor('Pb_CheckPoint_Update')
 def cmd_update(source: CommandSource, context: dict):
     """更新检查点：先删除后重新创建"""
     item_name = context.get('name') or context.get('n')
 
-    def find_in_tree(tree_dict, path_parts):
-        """递归查找树状结构中的检查点"""
-        if len(path_parts) == 1:
-            name = path_parts[0]
-            if name in tree_dict and tree_dict[name]['type'] == 'checkpoint':
-                return tree_dict[name]
-            return None
-        else:
-            parent = path_parts[0]
-            if parent in tree_dict and tree_dict[parent]['type'] == 'group':
-                children = tree_dict[parent].get('children', {})
-                return find_in_tree(children, path_parts[1:])
-            return None
-
     def delete_from_tree(tree_dict, path_parts):
         """递归删除树状结构中的项目"""
         if len(path_parts) == 1:
@@ -1063,53 +3187,149 @@ def cmd_update(source: CommandSource, context: dict):
     # 支持嵌套路径
     path_parts = item_name.split('.')
 
-    # 首先查找现有检查点
-    checkpoint = find_in_tree(CP_CONFIG.tree, path_parts)
-    if not checkpoint and item_name not in CP_CONFIG.check_point:
+    # 首先查找现有检查点（树状结构优先于旧数据）
+    checkpoint = CP_SNAPSHOT.find(item_name)
+    if checkpoint is None:
         source.reply('§c检查点不存在')
         return
+    x, y, z = checkpoint['x'], checkpoint['y'], checkpoint['z']
+    world = checkpoint.get('world', 'overworld')
 
-    # 获取坐标信息（从现有检查点或旧数据）
-    if checkpoint:
-        x, y, z = checkpoint['x'], checkpoint['y'], checkpoint['z']
-        world = checkpoint.get('world', 'overworld')
-    else:
-        # 兼容旧数据
-        pei = CP_CONFIG.check_point[item_name]
-        x, y, z = pei['x'], pei['y'], pei['z']
-        world = pei.get('world', 'overworld')
-
-    # 获取当前方块信息
-    if block_info_getter.get_block_info(x, y, z, world):
+    # 获取当前方块信息，查询期间不持有写锁
+    result = block_info_getter.query_block(x, y, z, world)
+    if result is None:
         source.reply('§c未能获取方块信息，更新失败')
         return
 
-    # 删除旧的检查点
-    deleted_from_tree = delete_from_tree(CP_CONFIG.tree, path_parts)
-    if not deleted_from_tree and item_name in CP_CONFIG.check_point:
-        del CP_CONFIG.check_point[item_name]
-        # 从所有分组中移除
-        for group_name, group_data in CP_CONFIG.groups.items():
-            if item_name in group_data.get('items', []):
-                group_data['items'].remove(item_name)
-
-    # 创建新的检查点数据
-    new_checkpoint = {
-        'type': 'checkpoint',
-        'x': x,
-        'y': y,
-        'z': z,
-        'world': world,
-        'block': block_info_getter.block_name,
-        'data': block_info_getter.block_data
-    }
+    with edit_tree() as draft:
+        # 查询期间被其他指令修改或删除的检查点不覆盖
+        if draft.base.find(item_name) != checkpoint:
+            source.reply(f'§e检查点 "{item_name}" 在查询期间被修改，未更新')
+            return
 
-    # 添加回树状结构（如果原来在树中）
-    if deleted_from_tree:
-        add_to_tree(CP_CONFIG.tree, path_parts, new_checkpoint)
-    else:
-        # 如果是旧数据，添加到根级别
-        CP_CONFIG.tree[item_name] = new_checkpoint
+        # 删除旧的检查点
+        deleted_from_tree = delete_from_tree(draft.tree, path_parts)
+        if not deleted_from_tree and item_name in draft.check_point:
+            del draft.check_point[item_name]
+            # 从所有分组中移除
+            for group_name, group_data in draft.groups.items():
+                if item_name in group_data.get('items', []):
+                    group_data['items'].remove(item_name)
 
-    save_config()
+        # 创建新的检查点数据
+        new_checkpoint = {
+            'type': 'checkpoint',
+            'x': x,
+            'y': y,
+            'z': z,
+            'world': world,
+            'block': result[0],
+            'data': result[1]
+        }
+        # 保留匹配规则
+        old_rule = checkpoint.get('match')
+        if old_rule:
+            new_checkpoint['match'] = old_rule
+        old_nbt = checkpoint.get('nbt')
+        if old_nbt:
+            new_checkpoint['nbt'] = old_nbt
+
+        # 添加回树状结构（如果原来在树中）
+        if deleted_from_tree:
+            add_to_tree(draft.tree, path_parts, new_checkpoint)
+        else:
+            # 如果是旧数据，添加到根级别
+            draft.tree[item_name] = new_checkpoint
+
+        draft.commit()
     source.reply(f'§a成功更新检查点 "{item_name}" 为当前状态')
+
+
+def format_state_change(old: dict, new: dict) -> str:
+    """方块属性的变化，如 extended: false → true"""
+    changes = []
+    for key in sorted(set(old) | set(new)):
+        before, after = old.get(key), new.get(key)
+        if before != after:
+            shown_before = '§8无' if before is None else f'§e{before}'
+            shown_after = '§8无' if after is None else f'§e{after}'
+            changes.append(f'§b{key}§7: {shown_before} §7→ {shown_after}')
+    return '§7, '.join(changes)
+
+
+@require_permission('update')
+@run_in_executor('Pb_CheckPoint_UpdateR')
+def cmd_update_group(source: CommandSource, context: dict):
+    """重新记录分组（含子分组）中所有检查点的当前状态：一轮批量查询，显示变化后一次性保存"""
+    group_path = context.get('name') or context.get('n')
+    snapshot = CP_SNAPSHOT
+    prefix = group_path + '.'
+    items = [item for item in snapshot.index if item.path == group_path or item.path.startswith(prefix)]
+    if not items:
+        source.reply(f'§c分组 §e{group_path} §c不存在或没有检查点')
+        return
+    source.reply(f'§7正在获取 {len(items)} 个检查点的当前状态...')
+
+    # 查询期间不持有写锁，其他修改不受影响
+    results = {}
+    failed = []
+    with tracer.span('rebaseline', group=group_path, checkpoints=len(items)):
+        with QuerySession(block_info_getter, items, CP_CONFIG.unloaded_policy, CP_CONFIG.query_backend) as access:
+            for item in items:
+                if not access.is_unloaded(item):
+                    time.sleep(QUERY_INTERVAL)
+                result, _ = access.query(item)
+                if result is None:
+                    failed.append(item.path)
+                else:
+                    results[item.path] = result
+
+    changes = []
+    for item in items:
+        result = results.get(item.path)
+        if result is None:
+            continue
+        old = snapshot.find(item.path)
+        block, data = result
+        if old is not None and (block != old.get('block') or data != old.get('data', {})):
+            changes.append((item.path, old, block, data))
+
+    source.reply(f'§a=== 重新记录 {group_path} ===')
+    for path, old, block, data in changes:
+        if block != old.get('block'):
+            source.reply(f'§e{path}§7: §b{old.get("block")} §7→ §b{block}')
+        if data != old.get('data', {}):
+            source.reply(f'§e{path}§7: {format_state_change(old.get("data", {}), data)}')
+    unchanged = len(results) - len(changes)
+    if unchanged:
+        source.reply(f'§7{unchanged} 个检查点与当前状态一致')
+    if failed:
+        source.reply(f'§c未能获取 {len(failed)} 个检查点的状态，保持不变: §e{", ".join(failed)}')
+    if not changes:
+        source.reply('§a没有需要更新的检查点')
+        return
+
+    conflicts = []
+    with edit_tree() as draft:
+        for path, old, block, data in changes:
+            # 查询期间被其他指令修改或删除的检查点不覆盖
+            if draft.base.find(path) is not old:
+                conflicts.append(path)
+                continue
+            # 保留匹配规则、方块实体数据断言等其余字段
+            updated = {**old, 'block': block, 'data': data}
+            parts = path.split('.')
+            parent = {'children': draft.tree}
+            for part in parts[:-1]:
+                parent = parent.get('children', {}).get(part) or {}
+            siblings = parent.get('children')
+            if siblings is not None and siblings.get(parts[-1]) is old:
+                siblings[parts[-1]] = updated
+            else:
+                # 兼容旧数据
+                draft.check_point[path] = updated
+        if len(conflicts) < len(changes):
+            draft.commit()
+    if conflicts:
+        source.reply(f'§e以下检查点在查询期间被修改，未更新: §e{", ".join(conflicts)}')
+    source.reply(f'§a已更新 {len(changes) - len(conflicts)} 个检查点')
@@ -0,0 +1,149 @@
+"""
+只读访问 PrimeBackup 的数据库与 blob 存储，从备份中读取文件内容
+直接读取 SQLite，兼容 PrimeBackup 新旧两种文件表结构（按备份存储 / 按文件集存储）
+只依赖标准库，zstd / lz4 压缩的 blob 需要安装与 PrimeBackup 相同的可选依赖
+"""
+import bz2
+import gzip
+import lzma
+import os
+import posixpath
+import sqlite3
+import threading
+from concurrent.futures import Executor
+from typing import Optional, List, Tuple, Dict, Any
+
+from . import region
+
+DB_FILE = 'prime_backup.db'
+BLOB_DIR = 'blobs'
+
+
+class BackupReadError(Exception):
+    pass
+
+
+def _decompress_blob(method: str, path: str) -> bytes:
+    if method == 'plain':
+        with open(path, 'rb') as f:
+            return f.read()
+    if method == 'gzip':
+        with gzip.open(path, 'rb') as f:
+            return f.read()
+    if method == 'bz2':
+        with bz2.open(path, 'rb') as f:
+            return f.read()
+    if method == 'lzma':
+        with lzma.open(path, 'rb') as f:
+            return f.read()
+    if method == 'zstd':
+        import zstandard
+        with open(path, 'rb') as f:
+            return zstandard.ZstdDecompressor().stream_reader(f).read()
+    if method == 'lz4':
+        import lz4.frame
+        with lz4.frame.open(path, 'rb') as f:
+            return f.read()
+    raise BackupReadError(f'unsupported blob compression {method}')
+
+
+class BackupReader:
+    def __init__(self, storage_root: str):
+        self.storage_root = storage_root
+        db_path = os.path.join(storage_root, DB_FILE)
+        if not os.path.isfile(db_path):
+            raise BackupReadError(f'PrimeBackup database not found: {db_path}')
+        self._conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._file_columns = self._columns('file')
+        self._backup_columns = self._columns('backup')
+
+    def _columns(self, table: str) -> set:
+        return {row[1] for row in self._conn.execute(f'PRAGMA table_info({table})')}
+
+    def _fetch(self, sql: str, *args) -> Optional[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, args).fetchone()
+
+    def close(self):
+        self._conn.close()
+
+    def latest_backup_id(self) -> Optional[int]:
+        row = self._fetch('SELECT MAX(id) FROM backup')
+        return row[0] if row is not None else None
+
+    def has_backup(self, backup_id: int) -> bool:
+        return self._fetch('SELECT id FROM backup WHERE id = ?', backup_id) is not None
+
+    def _file_blob(self, backup_id: int, path: str) -> Optional[Tuple[str, str]]:
+        """返回 (blob 哈希, 压缩方式)，文件不存在或不是普通文件时返回 None"""
+        compress_column = 'blob_compress' if 'blob_compress' in self._file_columns else 'NULL'
+        if 'backup_id' in self._file_columns:
+            row = self._fetch(f'SELECT blob_hash, {compress_column} FROM file WHERE backup_id = ? AND path = ?', backup_id, path)
+        elif 'fileset_id' in self._file_columns and 'fileset_id_base' in self._backup_columns:
+            filesets = self._fetch('SELECT fileset_id_delta, fileset_id_base FROM backup WHERE id = ?', backup_id)
+            if filesets is None:
+                return None
+            row = None
+            # 增量文件集中的记录优先，其中没有 blob 的记录表示文件已被删除
+            for fileset_id in filesets:
+                row = self._fetch(f'SELECT blob_hash, {compress_column} FROM file WHERE fileset_id = ? AND path = ?', fileset_id, path)
+                if row is not None:
+                    break
+        else:
+            raise BackupReadError('unknown PrimeBackup database layout')
+        if row is None or row[0] is None:
+            return None
+        blob_hash, compress = row
+        if compress is None:
+            blob = self._fetch('SELECT compress FROM blob WHERE hash = ?', blob_hash)
+            compress = blob[0] if blob is not None else 'plain'
+        return blob_hash, compress
+
+    def read_file(self, backup_id: int, path: str) -> Optional[bytes]:
+        """读取备份中的文件内容，path 为相对于备份源目录的路径"""
+        blob = self._file_blob(backup_id, path)
+        if blob is None:
+            return None
+        blob_hash, compress = blob
+        blob_path = os.path.join(self.storage_root, BLOB_DIR, blob_hash[:2], blob_hash)
+        if not os.path.isfile(blob_path):
+            raise BackupReadError(f'blob file not found: {blob_path}')
+        return _decompress_blob(compress, blob_path)
+
+
+def read_blocks(reader: BackupReader, backup_id: int, level_dir: str, targets: List[Tuple[Any, str, int, int, int]],
+                executor: Executor) -> Dict[Any, Optional[Tuple[str, dict]]]:
+    """
+    从备份中批量读取方块状态，每个区域文件只读取一次，区块的解压与解析交给 executor 并行执行
+    targets: [(键, 维度, x, y, z)]，level_dir 为存档目录相对于备份源目录的路径
+    返回: {键: (方块名, 方块属性) 或 None（备份中没有该区块）}
+    """
+    results: Dict[Any, Optional[Tuple[str, dict]]] = {key: None for key, *_ in targets}
+    by_region: Dict[str, list] = {}
+    for target in targets:
+        _, world, x, _, z = target
+        region_dir = posixpath.join(level_dir, region.DIMENSION_DIRS.get(world, ''), 'region')
+        region_path = posixpath.normpath(posixpath.join(region_dir, f'r.{x >> 9}.{z >> 9}.mca'))
+        by_region.setdefault(region_path, []).append(target)
+
+    futures = []
+    for region_path, region_targets in by_region.items():
+        data = reader.read_file(backup_id, region_path)
+        if data is None:
+            continue
+        by_chunk: Dict[int, list] = {}
+        for target in region_targets:
+            by_chunk.setdefault(region.get_chunk_index(target[2], target[4]), []).append(target)
+        for chunk_targets in by_chunk.values():
+            _, _, x, _, z = chunk_targets[0]
+            raw = region.read_raw_chunk(data, x, z)
+            if raw is None:
+                continue
+            positions = [(tx, ty, tz) for _, _, tx, ty, tz in chunk_targets]
+            futures.append((chunk_targets, executor.submit(region.decode_chunk_blocks, raw[0], raw[1], positions)))
+
+    for chunk_targets, future in futures:
+        for target, block in zip(chunk_targets, future.result()):
+            results[target[0]] = block
+    return results
@@ -0,0 +1,156 @@
+"""
+检查结果历史：以 SQLite 记录备份前检查与备份内容校验的结构化结果
+每次操作使用独立的连接，可在任意线程中以及插件重载前后安全调用
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Tuple
+
+# 备份前检查
+KIND_GATE = 'gate'
+# 备份内容校验（备份完成后复核或 !!pb cp inspect）
+KIND_BACKUP = 'backup'
+
+# 检查点未关闭
+STATUS_FAILED = 'failed'
+# 无法获取状态（区块未加载、备份中缺少区块等）
+STATUS_UNKNOWN = 'unknown'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS check_result (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    backup_id INTEGER,
+    kind TEXT NOT NULL,
+    time REAL NOT NULL,
+    forced INTEGER NOT NULL DEFAULT 0,
+    clean INTEGER NOT NULL,
+    checked INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    sig TEXT
+);
+CREATE TABLE IF NOT EXISTS check_entry (
+    result_id INTEGER NOT NULL REFERENCES check_result(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    block TEXT,
+    state TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_result_backup ON check_result(backup_id, kind);
+CREATE INDEX IF NOT EXISTS idx_result_clean ON check_result(clean, backup_id);
+CREATE INDEX IF NOT EXISTS idx_entry_result ON check_entry(result_id);
+CREATE INDEX IF NOT EXISTS idx_entry_path ON check_entry(path, result_id);
+'''
+
+RESULT_COLUMNS = 'id, backup_id, kind, time, forced, clean, checked, duration, sig'
+
+
+class CheckHistory:
+    def __init__(self, path: str):
+        self.path = path
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            if not self._ready:
+                with self._init_lock:
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.executescript(SCHEMA)
+                    self._ready = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, kind: str, clean: bool, checked: int, duration: float,
+               failed: Dict[str, Optional[Tuple[str, dict]]], unknown: List[str],
+               backup_id: Optional[int] = None, forced: bool = False, sig: Optional[str] = None,
+               at: Optional[float] = None) -> int:
+        """
+        记录一次检查结果，failed 为 {路径: (方块, 属性) 或 None（未获取到详情）}
+        返回: 记录 ID
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO check_result (backup_id, kind, time, forced, clean, checked, duration, sig) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (backup_id, kind, at if at is not None else time.time(), int(forced), int(clean), checked,
+                 round(duration, 3), sig))
+            result_id = cursor.lastrowid
+            rows = [(result_id, path, STATUS_FAILED, block[0] if block else None,
+                     json.dumps(block[1], ensure_ascii=False) if block else None) for path, block in failed.items()]
+            rows += [(result_id, path, STATUS_UNKNOWN, None, None) for path in unknown]
+            conn.executemany('INSERT INTO check_entry (result_id, path, status, block, state) VALUES (?, ?, ?, ?, ?)', rows)
+            return result_id
+
+    def attach_backup(self, result_id: int, backup_id: int):
+        """将备份前检查的结果关联到随后创建的备份"""
+        with self._connect() as conn:
+            conn.execute('UPDATE check_result SET backup_id = ? WHERE id = ?', (backup_id, result_id))
+
+    @staticmethod
+    def _verdict(conn: sqlite3.Connection, row: sqlite3.Row) -> dict:
+        failed = {}
+        missing = []
+        for entry in conn.execute('SELECT path, status, block, state FROM check_entry WHERE result_id = ?', (row['id'],)):
+            if entry['status'] == STATUS_FAILED:
+                failed[entry['path']] = [entry['block'], json.loads(entry['state'])] if entry['block'] is not None else None
+            else:
+                missing.append(entry['path'])
+        # 旧版本保存的备份校验结果在缺少区块时也记为通过，这里按记录的条目重新判断
+        clean = bool(row['clean']) and not failed and not missing
+        return {'id': row['id'], 'backup_id': row['backup_id'], 'kind': row['kind'], 'time': row['time'],
+                'forced': bool(row['forced']), 'clean': clean, 'checked': row['checked'],
+                'failed': failed, 'missing': missing, 'duration': row['duration'], 'sig': row['sig']}
+
+    def get_verdict(self, backup_id: int, sig: Optional[str] = None) -> Optional[dict]:
+        """获取备份最近一次的内容校验结果，指定 sig 时只返回检查点集合一致的结果"""
+        with self._connect() as conn:
+            row = conn.execute(
+                f'SELECT {RESULT_COLUMNS} FROM check_result WHERE backup_id = ? AND kind = ? ORDER BY id DESC LIMIT 1',
+                (backup_id, KIND_BACKUP)).fetchone()
+            if row is None or (sig is not None and row['sig'] != sig):
+                return None
+            return self._verdict(conn, row)
+
+    def list_verdicts(self, limit: int) -> List[dict]:
+        """每个备份最近一次的内容校验结果，按备份 ID 倒序"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f'SELECT {RESULT_COLUMNS} FROM check_result WHERE id IN '
+                '(SELECT MAX(id) FROM check_result WHERE kind = ? AND backup_id IS NOT NULL GROUP BY backup_id) '
+                'ORDER BY backup_id DESC LIMIT ?', (KIND_BACKUP, limit)).fetchall()
+            return [self._verdict(conn, row) for row in rows]
+
+    def list_results(self, limit: int) -> List[dict]:
+        """最近的检查结果"""
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT {RESULT_COLUMNS} FROM check_result ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+            return [self._verdict(conn, row) for row in rows]
+
+    def checkpoint_history(self, path: str, limit: int) -> List[dict]:
+        """检查点最近未通过检查的记录: [{'time', 'backup_id', 'kind', 'forced', 'status', 'block', 'state'}]"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT r.time, r.backup_id, r.kind, r.forced, e.status, e.block, e.state '
+                'FROM check_entry e JOIN check_result r ON r.id = e.result_id '
+                'WHERE e.path = ? ORDER BY e.result_id DESC LIMIT ?', (path, limit)).fetchall()
+            return [{'time': row['time'], 'backup_id': row['backup_id'], 'kind': row['kind'], 'forced': bool(row['forced']),
+                     'status': row['status'], 'block': row['block'],
+                     'state': json.loads(row['state']) if row['state'] else {}} for row in rows]
+
+    def latest_clean_backup(self) -> Optional[int]:
+        """最近一个没有任何未通过记录的备份 ID，有检查点无法获取状态的结果同样不算通过"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT MAX(backup_id) FROM check_result c WHERE clean = 1 AND backup_id IS NOT NULL '
+                'AND NOT EXISTS (SELECT 1 FROM check_entry e WHERE e.result_id = c.id) AND NOT EXISTS '
+                '(SELECT 1 FROM check_result d WHERE d.backup_id = c.backup_id AND (d.clean = 0 OR EXISTS '
+                '(SELECT 1 FROM check_entry e WHERE e.result_id = d.id)))').fetchone()
+            return row[0]
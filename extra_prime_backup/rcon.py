@@ -0,0 +1,141 @@
+"""
+最小的 Minecraft RCON 客户端与连接池
+每个请求独占一个连接，响应直接返回给调用者，无需从服务端日志中匹配
+"""
+import itertools
+import socket
+import struct
+import threading
+from queue import Queue, Empty
+from typing import Tuple
+
+PACKET_RESPONSE = 0
+PACKET_COMMAND = 2
+PACKET_LOGIN = 3
+# 服务端会对未知类型的数据包回复 "Unknown request"，借此判断命令的响应已全部接收
+PACKET_END_MARKER = 100
+
+
+class RconError(Exception):
+    pass
+
+
+class RconClient:
+    def __init__(self, host: str, port: int, password: str, timeout: float = 3):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._sock = None
+
+    def connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        request_id = next(self._ids)
+        self._send(request_id, PACKET_LOGIN, self.password)
+        while True:
+            packet_id, packet_type, _ = self._recv()
+            if packet_id == -1:
+                self.close()
+                raise RconError('rcon authentication failed')
+            if packet_type == PACKET_COMMAND and packet_id == request_id:
+                return
+
+    def _send(self, request_id: int, packet_type: int, body: str):
+        data = struct.pack('<ii', request_id, packet_type) + body.encode('utf8') + b'\x00\x00'
+        self._sock.sendall(struct.pack('<i', len(data)) + data)
+
+    def _recv_exact(self, size: int) -> bytes:
+        buf = b''
+        while len(buf) < size:
+            chunk = self._sock.recv(size - len(buf))
+            if not chunk:
+                raise RconError('rcon connection closed')
+            buf += chunk
+        return buf
+
+    def _recv(self) -> Tuple[int, int, str]:
+        length, = struct.unpack('<i', self._recv_exact(4))
+        data = self._recv_exact(length)
+        packet_id, packet_type = struct.unpack_from('<ii', data)
+        return packet_id, packet_type, data[8:-2].decode('utf8', errors='replace')
+
+    def command(self, command: str) -> str:
+        if self._sock is None:
+            self.connect()
+        request_id = next(self._ids)
+        end_id = next(self._ids)
+        self._send(request_id, PACKET_COMMAND, command)
+        self._send(end_id, PACKET_END_MARKER, '')
+        parts = []
+        while True:
+            packet_id, _, body = self._recv()
+            if packet_id == end_id:
+                return ''.join(parts)
+            if packet_id == request_id:
+                parts.append(body)
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+
+class RconPool:
+    """最多 size 个并发连接的 RCON 连接池，连接按需建立并复用"""
+
+    def __init__(self, host: str, port: int, password: str, size: int = 2, timeout: float = 3):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.size = max(1, size)
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle: Queue = Queue()
+
+    def query(self, command: str) -> str:
+        """执行命令并返回响应，连接或协议错误时抛出 OSError / RconError"""
+        with self._slots:
+            try:
+                client = self._idle.get_nowait()
+            except Empty:
+                client = RconClient(self.host, self.port, self.password, self.timeout)
+            try:
+                result = client.command(command)
+            except Exception:
+                client.close()
+                raise
+            self._idle.put(client)
+            return result
+
+    def export_connections(self) -> list:
+        """取出空闲连接的套接字，交给重载后的新连接池继续使用"""
+        sockets = []
+        while True:
+            try:
+                client = self._idle.get_nowait()
+            except Empty:
+                return sockets
+            if client._sock is not None:
+                sockets.append(client._sock)
+                client._sock = None
+
+    def adopt_connections(self, sockets: list):
+        """接管已登录的连接，超出连接数上限的直接关闭"""
+        for sock in sockets:
+            if self._idle.qsize() >= self.size:
+                sock.close()
+                continue
+            client = RconClient(self.host, self.port, self.password, self.timeout)
+            client._sock = sock
+            self._idle.put(client)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
@@ -0,0 +1,254 @@
+"""
+区域文件（Anvil .mca）读取工具
+只依赖标准库
+"""
+import gzip
+import os
+import struct
+import zlib
+from typing import Optional, Tuple, Dict, Any, List
+
+SECTOR_SIZE = 4096
+
+# 维度 -> 存档目录下的子目录
+DIMENSION_DIRS = {
+    'overworld': '',
+    'the_nether': 'DIM-1',
+    'the_end': 'DIM1',
+}
+
+# 1.16 (20w17a) 起 BlockStates 中的值不再跨 long 存储
+DATA_VERSION_NO_SPANNING = 2529
+# 1.18 (21w43a) 起使用新的区块格式
+DATA_VERSION_NEW_CHUNK_FORMAT = 2844
+
+
+# ---------- NBT ---------
+class _NbtReader:
+    __slots__ = ('data', 'pos')
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def _unpack(self, fmt: str, size: int):
+        value = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += size
+        return value
+
+    def read_string(self) -> str:
+        length, = self._unpack('>H', 2)
+        value = self.data[self.pos:self.pos + length].decode('utf-8', errors='replace')
+        self.pos += length
+        return value
+
+    def read_payload(self, tag: int) -> Any:
+        if tag == 1:
+            return self._unpack('>b', 1)[0]
+        if tag == 2:
+            return self._unpack('>h', 2)[0]
+        if tag == 3:
+            return self._unpack('>i', 4)[0]
+        if tag == 4:
+            return self._unpack('>q', 8)[0]
+        if tag == 5:
+            return self._unpack('>f', 4)[0]
+        if tag == 6:
+            return self._unpack('>d', 8)[0]
+        if tag == 7:
+            length, = self._unpack('>i', 4)
+            value = self.data[self.pos:self.pos + length]
+            self.pos += length
+            return value
+        if tag == 8:
+            return self.read_string()
+        if tag == 9:
+            item_tag, length = self._unpack('>bi', 5)
+            return [self.read_payload(item_tag) for _ in range(length)]
+        if tag == 10:
+            result = {}
+            while True:
+                item_tag = self.data[self.pos]
+                self.pos += 1
+                if item_tag == 0:
+                    return result
+                name = self.read_string()
+                result[name] = self.read_payload(item_tag)
+        if tag == 11:
+            length, = self._unpack('>i', 4)
+            return list(self._unpack(f'>{length}i', 4 * length))
+        if tag == 12:
+            length, = self._unpack('>i', 4)
+            return list(self._unpack(f'>{length}q', 8 * length))
+        raise ValueError(f'unknown nbt tag {tag}')
+
+
+def parse_nbt(data: bytes) -> dict:
+    """解析未压缩的 NBT 数据，返回根 compound"""
+    reader = _NbtReader(data)
+    tag = reader.data[0]
+    reader.pos = 1
+    if tag != 10:
+        raise ValueError('root tag is not a compound')
+    reader.read_string()
+    return reader.read_payload(10)
+
+
+# ---------- Region ---------
+def get_region_dir(world_dir: str, world: str) -> str:
+    return os.path.join(world_dir, DIMENSION_DIRS.get(world, ''), 'region')
+
+
+def get_region_file(world_dir: str, world: str, x: int, z: int) -> str:
+    """返回方块所在区域文件的路径"""
+    return os.path.join(get_region_dir(world_dir, world), f'r.{x >> 9}.{z >> 9}.mca')
+
+
+def get_chunk_index(x: int, z: int) -> int:
+    """区块在区域文件头中的序号（参数为方块坐标）"""
+    return ((x >> 4) & 31) + ((z >> 4) & 31) * 32
+
+
+def read_chunk_timestamp(header: bytes, x: int, z: int) -> int:
+    """从区域文件头读取区块最后保存时间（秒），区块不存在时返回 0"""
+    index = get_chunk_index(x, z)
+    if len(header) < 2 * SECTOR_SIZE:
+        return 0
+    return struct.unpack_from('>I', header, SECTOR_SIZE + index * 4)[0]
+
+
+def read_raw_chunk(region: bytes, x: int, z: int) -> Optional[Tuple[int, bytes]]:
+    """
+    从区域文件内容中取出方块所在区块的原始数据
+    返回: (压缩方式, 压缩数据) 或 None（区块不存在）
+    """
+    if len(region) < 2 * SECTOR_SIZE:
+        return None
+    location, = struct.unpack_from('>I', region, get_chunk_index(x, z) * 4)
+    offset, count = location >> 8, location & 0xFF
+    if offset == 0 or count == 0:
+        return None
+    start = offset * SECTOR_SIZE
+    if start + 5 > len(region):
+        return None
+    length, compression = struct.unpack_from('>iB', region, start)
+    if compression & 0x80:
+        # 外置的 .mcc 区块文件，暂不支持
+        return None
+    return compression, region[start + 5:start + 4 + length]
+
+
+def decompress_chunk(compression: int, data: bytes) -> bytes:
+    if compression == 1:
+        return gzip.decompress(data)
+    if compression == 2:
+        return zlib.decompress(data)
+    if compression == 3:
+        return data
+    raise ValueError(f'unsupported chunk compression {compression}')
+
+
+def _unpack_index(states: list, bits: int, index: int, spanning: bool) -> int:
+    mask = (1 << bits) - 1
+    if spanning:
+        bit = index * bits
+        long_index, offset = divmod(bit, 64)
+        value = (states[long_index] & 0xFFFFFFFFFFFFFFFF) >> offset
+        if offset + bits > 64:
+            value |= (states[long_index + 1] & 0xFFFFFFFFFFFFFFFF) << (64 - offset)
+        return value & mask
+    per_long = 64 // bits
+    long_index, slot = divmod(index, per_long)
+    return ((states[long_index] & 0xFFFFFFFFFFFFFFFF) >> (slot * bits)) & mask
+
+
+def get_block_from_chunk(chunk: dict, x: int, y: int, z: int) -> Optional[Tuple[str, Dict[str, str]]]:
+    """
+    从已解析的区块 NBT 中获取方块状态
+    返回: (方块名, 方块属性) 或 None（找不到对应的区块段）
+    """
+    data_version = chunk.get('DataVersion', 0)
+    if data_version >= DATA_VERSION_NEW_CHUNK_FORMAT:
+        sections = chunk.get('sections', [])
+    else:
+        sections = chunk.get('Level', {}).get('Sections', [])
+
+    section_y = y >> 4
+    for section in sections:
+        if section.get('Y') != section_y:
+            continue
+        if data_version >= DATA_VERSION_NEW_CHUNK_FORMAT:
+            block_states = section.get('block_states', {})
+            palette = block_states.get('palette', [])
+            states = block_states.get('data')
+        else:
+            palette = section.get('Palette', [])
+            states = section.get('BlockStates')
+        if not palette:
+            return None
+
+        if len(palette) == 1 or not states:
+            entry = palette[0]
+        else:
+            index = ((y & 15) << 8) | ((z & 15) << 4) | (x & 15)
+            spanning = data_version < DATA_VERSION_NO_SPANNING
+            if spanning:
+                bits = len(states) * 64 // 4096
+            else:
+                bits = max(4, (len(palette) - 1).bit_length())
+            entry = palette[_unpack_index(states, bits, index, spanning)]
+        properties = {str(k): str(v) for k, v in entry.get('Properties', {}).items()}
+        return entry.get('Name', 'minecraft:air'), properties
+    return None
+
+
+def get_block_entity_from_chunk(chunk: dict, x: int, y: int, z: int) -> Optional[Dict[str, Any]]:
+    """从已解析的区块 NBT 中获取方块实体数据，该位置没有方块实体时返回 None"""
+    if chunk.get('DataVersion', 0) >= DATA_VERSION_NEW_CHUNK_FORMAT:
+        entities = chunk.get('block_entities', [])
+    else:
+        entities = chunk.get('Level', {}).get('TileEntities', [])
+    for entity in entities:
+        if entity.get('x') == x and entity.get('y') == y and entity.get('z') == z:
+            return entity
+    return None
+
+
+def read_block_from_region(region: bytes, x: int, y: int, z: int) -> Optional[Tuple[str, Dict[str, str]]]:
+    """从区域文件内容中读取单个方块的状态"""
+    raw = read_raw_chunk(region, x, z)
+    if raw is None:
+        return None
+    chunk = parse_nbt(decompress_chunk(*raw))
+    return get_block_from_chunk(chunk, x, y, z)
+
+
+def read_block(world_dir: str, world: str, x: int, y: int, z: int) -> Optional[Tuple[str, Dict[str, str]]]:
+    """从存档目录的区域文件中读取单个方块的状态"""
+    path = get_region_file(world_dir, world, x, z)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        region = f.read()
+    return read_block_from_region(region, x, y, z)
+
+
+def read_block_entity(world_dir: str, world: str, x: int, y: int, z: int) -> Optional[Dict[str, Any]]:
+    """
+    从存档目录的区域文件中读取方块实体数据
+    返回: 方块实体数据，该位置没有方块实体时为空字典；区块不存在时返回 None
+    """
+    path = get_region_file(world_dir, world, x, z)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        raw = read_raw_chunk(f.read(), x, z)
+    if raw is None:
+        return None
+    return get_block_entity_from_chunk(parse_nbt(decompress_chunk(*raw)), x, y, z) or {}
+
+
+def decode_chunk_blocks(compression: int, data: bytes, positions: List[Tuple[int, int, int]]) -> List[Optional[Tuple[str, Dict[str, str]]]]:
+    """解压并解析一个区块，返回 positions 中每个方块的状态，供线程池调用"""
+    chunk = parse_nbt(decompress_chunk(compression, data))
+    return [get_block_from_chunk(chunk, x, y, z) for x, y, z in positions]
@@ -0,0 +1,323 @@
+"""
+流式 SNBT 解析：只取出需要的路径，其余内容只扫描边界而不构造对象
+用于解析 data get block 的输出，大容器的物品列表等无关数据不会被完整解析
+"""
+import re
+from typing import Any, Dict, Iterable, Tuple, Union
+
+PathToken = Union[str, int]
+Path = Tuple[PathToken, ...]
+
+
+class _Missing:
+    """路径不存在"""
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+
+class SnbtError(ValueError):
+    pass
+
+
+# 无引号字符串与数字可以包含的字符
+_UNQUOTED_CHARS = frozenset('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_-.+')
+_INT_RE = re.compile(r'[-+]?\d+[bBsSlL]?')
+_FLOAT_RE = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?[fFdD]?')
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 's': ' '}
+
+
+def parse_path(path: str) -> Path:
+    """
+    解析 NBT 路径，如 Items[0].id -> ('Items', 0, 'id')
+    键中包含 . 或 [ 时可用双引号包裹：'"minecraft:custom_data".flag'
+    """
+    tokens = []
+    i, n = 0, len(path)
+    expect_key = True
+    while i < n:
+        c = path[i]
+        if c == '[':
+            end = path.find(']', i)
+            if end < 0:
+                raise SnbtError(f'unclosed index in path: {path}')
+            try:
+                tokens.append(int(path[i + 1:end]))
+            except ValueError:
+                raise SnbtError(f'invalid index in path: {path}') from None
+            i = end + 1
+            expect_key = False
+        elif c == '.':
+            if expect_key:
+                raise SnbtError(f'empty key in path: {path}')
+            i += 1
+            expect_key = True
+        elif expect_key and c == '"':
+            end = path.find('"', i + 1)
+            if end < 0:
+                raise SnbtError(f'unclosed quote in path: {path}')
+            tokens.append(path[i + 1:end])
+            i = end + 1
+            expect_key = False
+        elif expect_key:
+            end = i
+            while end < n and path[end] not in '.[':
+                end += 1
+            tokens.append(path[i:end])
+            i = end
+            expect_key = False
+        else:
+            raise SnbtError(f'unexpected character {c!r} in path: {path}')
+    if not tokens or expect_key:
+        raise SnbtError(f'invalid path: {path}')
+    return tuple(tokens)
+
+
+def resolve(value: Any, path: Path) -> Any:
+    """在已解析的值中按路径取值，不存在时返回 MISSING"""
+    for token in path:
+        if isinstance(token, int):
+            if not isinstance(value, list) or not -len(value) <= token < len(value):
+                return MISSING
+        elif not isinstance(value, dict) or token not in value:
+            return MISSING
+        value = value[token]
+    return value
+
+
+def _scalar(token: str) -> Any:
+    if _INT_RE.fullmatch(token):
+        return int(token.rstrip('bBsSlL'))
+    if _FLOAT_RE.fullmatch(token):
+        return float(token.rstrip('fFdD'))
+    if token == 'true':
+        return True
+    if token == 'false':
+        return False
+    return token
+
+
+class _Scanner:
+    __slots__ = ('text', 'pos')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+
+    def peek(self) -> str:
+        text, pos = self.text, self.pos
+        while pos < len(text) and text[pos] in ' \t\r\n':
+            pos += 1
+        self.pos = pos
+        return text[pos] if pos < len(text) else ''
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise SnbtError(f'expected {char!r} at {self.pos}')
+        self.pos += 1
+
+    def _string_end(self) -> int:
+        """返回当前引号字符串结束引号之后的位置"""
+        text = self.text
+        quote = text[self.pos]
+        pos = self.pos + 1
+        while True:
+            end = text.find(quote, pos)
+            if end < 0:
+                raise SnbtError('unterminated string')
+            # 结束引号前连续反斜杠为奇数个时是转义
+            backslashes = 0
+            while text[end - 1 - backslashes] == '\\':
+                backslashes += 1
+            if backslashes % 2 == 0:
+                return end + 1
+            pos = end + 1
+
+    def read_string(self) -> str:
+        start = self.pos + 1
+        self.pos = self._string_end()
+        raw = self.text[start:self.pos - 1]
+        if '\\' not in raw:
+            return raw
+        result = []
+        i = 0
+        while i < len(raw):
+            c = raw[i]
+            if c == '\\' and i + 1 < len(raw):
+                i += 1
+                c = _ESCAPES.get(raw[i], raw[i])
+            result.append(c)
+            i += 1
+        return ''.join(result)
+
+    def read_unquoted(self) -> str:
+        text, start = self.text, self.pos
+        pos = start
+        while pos < len(text) and text[pos] in _UNQUOTED_CHARS:
+            pos += 1
+        if pos == start:
+            raise SnbtError(f'unexpected character at {start}')
+        self.pos = pos
+        return text[start:pos]
+
+    def read_key(self) -> str:
+        c = self.peek()
+        return self.read_string() if c in '"\'' else self.read_unquoted()
+
+    def skip_value(self):
+        """跳过一个值，只跟踪括号深度与字符串边界"""
+        c = self.peek()
+        if c in '"\'':
+            self.pos = self._string_end()
+            return
+        if c not in '{[':
+            self.read_unquoted()
+            return
+        text = self.text
+        depth = 0
+        pos = self.pos
+        while pos < len(text):
+            c = text[pos]
+            if c in '"\'':
+                self.pos = pos
+                pos = self._string_end()
+                continue
+            if c in '{[':
+                depth += 1
+            elif c in '}]':
+                depth -= 1
+                if depth == 0:
+                    self.pos = pos + 1
+                    return
+            pos += 1
+        raise SnbtError('unexpected end of input')
+
+    def _typed_array(self) -> bool:
+        text, pos = self.text, self.pos
+        return pos + 2 < len(text) and text[pos + 1] in 'BIL' and text[pos + 2] == ';'
+
+    def parse_value(self) -> Any:
+        c = self.peek()
+        if c == '{':
+            self.pos += 1
+            result = {}
+            while self.peek() != '}':
+                key = self.read_key()
+                self.expect(':')
+                result[key] = self.parse_value()
+                if self.peek() == ',':
+                    self.pos += 1
+            self.pos += 1
+            return result
+        if c == '[':
+            self.pos += 3 if self._typed_array() else 1
+            result = []
+            while self.peek() != ']':
+                result.append(self.parse_value())
+                if self.peek() == ',':
+                    self.pos += 1
+            self.pos += 1
+            return result
+        if c in '"\'':
+            return self.read_string()
+        return _scalar(self.read_unquoted())
+
+
+class _Done(Exception):
+    pass
+
+
+def extract(text: str, paths: Iterable[Path]) -> Dict[Path, Any]:
+    """
+    从 SNBT 文本中取出指定路径的值
+    只构造目标路径上的值，其余子树直接跳过；所有路径找到后立即停止扫描
+    返回: {路径: 值}，不存在的路径不在结果中
+    """
+    # 路径前缀树，None 键标记路径终点
+    trie: dict = {}
+    for path in paths:
+        node = trie
+        for token in path:
+            node = node.setdefault(token, {})
+        node[None] = True
+    found: Dict[Path, Any] = {}
+    remaining = [sum(1 for _ in _terminals(trie))]
+    if not remaining[0]:
+        return found
+    scanner = _Scanner(text)
+    try:
+        _walk(scanner, trie, (), found, remaining)
+    except _Done:
+        pass
+    except IndexError:
+        raise SnbtError('unexpected end of input') from None
+    return found
+
+
+def _terminals(node: dict):
+    for token, child in node.items():
+        if token is None:
+            yield True
+        else:
+            yield from _terminals(child)
+
+
+def _walk(scanner: _Scanner, node: dict, prefix: Path, found: dict, remaining: list):
+    c = scanner.peek()
+    if c == '{':
+        scanner.pos += 1
+        while scanner.peek() != '}':
+            key = scanner.read_key()
+            scanner.expect(':')
+            child = node.get(key)
+            if child is None:
+                scanner.skip_value()
+            else:
+                _visit(scanner, child, prefix + (key,), found, remaining)
+            if scanner.peek() == ',':
+                scanner.pos += 1
+        scanner.pos += 1
+    elif c == '[':
+        if scanner._typed_array() or any(isinstance(t, int) and t < 0 for t in node):
+            # 数组元素都是数字，负数下标需要知道长度，直接完整解析
+            _collect(scanner.parse_value(), node, prefix, found, remaining)
+            return
+        scanner.pos += 1
+        index = 0
+        while scanner.peek() != ']':
+            child = node.get(index)
+            if child is None:
+                scanner.skip_value()
+            else:
+                _visit(scanner, child, prefix + (index,), found, remaining)
+            index += 1
+            if scanner.peek() == ',':
+                scanner.pos += 1
+        scanner.pos += 1
+    else:
+        scanner.skip_value()
+
+
+def _visit(scanner: _Scanner, node: dict, path: Path, found: dict, remaining: list):
+    if None in node:
+        # 路径终点需要完整的值，其下更深的路径直接在该值中查找
+        _collect(scanner.parse_value(), node, path, found, remaining)
+    else:
+        _walk(scanner, node, path, found, remaining)
+
+
+def _collect(value: Any, node: dict, path: Path, found: dict, remaining: list):
+    for token, child in node.items():
+        if token is None:
+            found[path] = value
+            remaining[0] -= 1
+            continue
+        sub = resolve(value, (token,))
+        if sub is not MISSING:
+            _collect(sub, child, path + (token,), found, remaining)
+    if remaining[0] <= 0:
+        raise _Done
@@ -0,0 +1,186 @@
+"""
+检查点的 SQLite 存储，用于检查点数量很多的部署
+分组与检查点各占一行，按路径、所属分组、维度与区块建立索引；修改配置时只写入发生变化的行
+每次操作使用独立的连接，可在任意线程中以及插件重载前后安全调用
+"""
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, List
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS node (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    description TEXT,
+    world TEXT,
+    x INTEGER,
+    y INTEGER,
+    z INTEGER,
+    chunk_x INTEGER,
+    chunk_z INTEGER,
+    block TEXT,
+    data TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_node_parent ON node(parent, position);
+CREATE INDEX IF NOT EXISTS idx_node_chunk ON node(world, chunk_x, chunk_z);
+'''
+
+NODE_COLUMNS = 'path, parent, name, position, type, description, world, x, y, z, chunk_x, chunk_z, block, data, extra'
+# 检查点中有独立列的字段，其余字段（match、nbt 等）以 JSON 保存在 extra 中
+CHECKPOINT_FIELDS = {'type', 'x', 'y', 'z', 'world', 'block', 'data'}
+GROUP_FIELDS = {'type', 'description', 'children'}
+
+
+def _join(parent: str, name: str) -> str:
+    return f'{parent}.{name}' if parent else name
+
+
+def _columns(item: dict) -> tuple:
+    """节点的列值（不含 path、parent、name、position）"""
+    if item.get('type') == 'group':
+        extra = {k: v for k, v in item.items() if k not in GROUP_FIELDS}
+        return ('group', item.get('description', ''), None, None, None, None, None, None, None, None,
+                json.dumps(extra, ensure_ascii=False) if extra else None)
+    x, y, z = item['x'], item['y'], item['z']
+    extra = {k: v for k, v in item.items() if k not in CHECKPOINT_FIELDS}
+    return ('checkpoint', None, str(item.get('world', 'overworld')), x, y, z, x >> 4, z >> 4, item.get('block', ''),
+            json.dumps(item.get('data', {}), ensure_ascii=False), json.dumps(extra, ensure_ascii=False) if extra else None)
+
+
+def thaw_tree(tree: dict) -> dict:
+    """
+    复制树状结构中的分组及其 children 字典；检查点只会被整体替换而不会原地修改，因此直接共享
+    在副本上修改后交给 CheckpointStore.apply，未修改的检查点按身份比较即可跳过
+    """
+    result = {}
+    for name, item in tree.items():
+        if item.get('type') == 'group':
+            item = dict(item)
+            item['children'] = thaw_tree(item.get('children', {}))
+        result[name] = item
+    return result
+
+
+def _node(row: sqlite3.Row) -> dict:
+    extra = json.loads(row['extra']) if row['extra'] else {}
+    if row['type'] == 'group':
+        return {'type': 'group', 'description': row['description'] or '', **extra, 'children': {}}
+    return {'type': 'checkpoint', 'x': row['x'], 'y': row['y'], 'z': row['z'], 'world': row['world'],
+            'block': row['block'], 'data': json.loads(row['data']) if row['data'] else {}, **extra}
+
+
+class CheckpointStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            if not self._ready:
+                with self._init_lock:
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.executescript(SCHEMA)
+                    self._ready = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load_tree(self) -> dict:
+        """读取完整的树状结构，同一分组中按添加顺序排列"""
+        with self._connect() as conn:
+            rows = conn.execute(f'SELECT {NODE_COLUMNS} FROM node ORDER BY position').fetchall()
+        children: Dict[str, List[sqlite3.Row]] = {}
+        for row in rows:
+            children.setdefault(row['parent'], []).append(row)
+
+        def build(parent: str) -> dict:
+            result = {}
+            for row in children.get(parent, []):
+                node = _node(row)
+                if node['type'] == 'group':
+                    node['children'] = build(row['path'])
+                result[row['name']] = node
+            return result
+
+        return build('')
+
+    def get(self, path: str) -> Optional[dict]:
+        """读取单个检查点，分组不返回子节点"""
+        with self._connect() as conn:
+            row = conn.execute(f'SELECT {NODE_COLUMNS} FROM node WHERE path = ?', (path,)).fetchone()
+        return _node(row) if row is not None else None
+
+    def count_checkpoints(self, group_path: str = '') -> int:
+        """分组（含子分组）中的检查点数量，group_path 为检查点路径时返回 1 或 0"""
+        with self._connect() as conn:
+            if not group_path:
+                return conn.execute("SELECT COUNT(*) FROM node WHERE type = 'checkpoint'").fetchone()[0]
+            # '/' 紧接在 '.' 之后，用主键范围扫描代替 LIKE
+            return conn.execute(
+                "SELECT COUNT(*) FROM node WHERE type = 'checkpoint' AND (path = ? OR (path > ? AND path < ?))",
+                (group_path, group_path + '.', group_path + '/')).fetchone()[0]
+
+    def apply(self, old: dict, new: dict) -> int:
+        """
+        将树状结构从 old 修改为 new，只写入发生变化的行，在同一个事务中完成
+        未修改的检查点与 old 中共享同一个字典对象，按身份比较即可跳过
+        返回: 写入的行数
+        """
+        with self._connect() as conn:
+            return self._diff(conn, old, new, '')
+
+    def _diff(self, conn: sqlite3.Connection, old: dict, new: dict, parent: str) -> int:
+        written = 0
+        next_position = None
+        for name, item in new.items():
+            before = old.get(name)
+            if before is item:
+                continue
+            path = _join(parent, name)
+            if before is not None and before.get('type') == item.get('type'):
+                if _columns(before) != _columns(item):
+                    conn.execute('UPDATE node SET type = ?, description = ?, world = ?, x = ?, y = ?, z = ?, chunk_x = ?, '
+                                 'chunk_z = ?, block = ?, data = ?, extra = ? WHERE path = ?', (*_columns(item), path))
+                    written += 1
+                if item.get('type') == 'group':
+                    written += self._diff(conn, before.get('children', {}), item.get('children', {}), path)
+                continue
+            if before is not None:
+                written += self._delete(conn, before, path)
+            if next_position is None:
+                next_position = (conn.execute('SELECT MAX(position) FROM node WHERE parent = ?', (parent,)).fetchone()[0] or 0) + 1
+            conn.execute(f'INSERT INTO node ({NODE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         (path, parent, name, next_position, *_columns(item)))
+            next_position += 1
+            written += 1
+            if item.get('type') == 'group':
+                written += self._diff(conn, {}, item.get('children', {}), path)
+        for name, before in old.items():
+            if name not in new:
+                written += self._delete(conn, before, _join(parent, name))
+        return written
+
+    def _delete(self, conn: sqlite3.Connection, item: dict, path: str) -> int:
+        paths = [path]
+        if item.get('type') == 'group':
+            stack = [(path, item)]
+            while stack:
+                group_path, group = stack.pop()
+                for name, child in group.get('children', {}).items():
+                    child_path = _join(group_path, name)
+                    paths.append(child_path)
+                    if child.get('type') == 'group':
+                        stack.append((child_path, child))
+        conn.executemany('DELETE FROM node WHERE path = ?', [(p,) for p in paths])
+        return len(paths)
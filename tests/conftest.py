@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 插件包的 __init__ 依赖 MCDR，这里直接导入包内不依赖 MCDR 的模块
+sys.path.insert(0, os.path.join(ROOT, 'extra_prime_backup'))
+# 测试插件本体的用例通过 pytest.importorskip('mcdreforged') 在没有 MCDR 时跳过
+sys.path.insert(0, ROOT)
@@ -0,0 +1,245 @@
+import re
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('mcdreforged')
+
+import extra_prime_backup as epb  # noqa: E402
+
+
+class Logger:
+    def __init__(self):
+        self.warnings = []
+
+    def info(self, message):
+        pass
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+
+class Info:
+    def __init__(self, content: str):
+        self.content = content
+        self.is_user = False
+
+
+class FakeServer:
+    """按 handler 为每条指令生成输出行，在另一个线程中依次交给 getter.on_info，模拟服务端日志"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.logger = Logger()
+        self.commands = []
+        self.getter = None
+
+    def execute(self, command: str):
+        self.commands.append(command)
+        lines = self.handler(command)
+        threading.Thread(target=self._deliver, args=(lines,), daemon=True).start()
+
+    def _deliver(self, lines):
+        time.sleep(0.01)
+        for line in lines:
+            self.getter.on_info(Info(line))
+
+
+def make_getter(handler, **attrs) -> epb.BlockInfoGetter:
+    server = FakeServer(handler)
+    getter = epb.BlockInfoGetter(server)
+    server.getter = getter
+    for key, value in attrs.items():
+        setattr(getter, key, value)
+    return getter
+
+
+def rejected(command: str) -> list:
+    """服务端拒绝指令时的两行输出，第二行回显指令末尾"""
+    return ['Unknown or incomplete command, see below for error', '...' + command.lstrip('/')[-10:] + '<--[HERE]']
+
+
+BLOCK_INFO = 'Block info for minecraft:piston, extended=false facing=north'
+
+
+def test_unrelated_rejection_is_ignored():
+    # 其他玩家或插件的错误指令恰好出现在等待期间
+    getter = make_getter(lambda command: rejected('/say_typo') + [BLOCK_INFO])
+    assert getter.query_block(1, 2, 3, 'overworld') == ('minecraft:piston', {'extended': 'false', 'facing': 'north'})
+    assert getter.supports_info
+
+
+def test_rejected_info_block_fails_only_this_query_with_info_backend():
+    getter = make_getter(rejected)
+    start = time.time()
+    assert getter.query_block(1, 2, 3, 'overworld') is None
+    assert time.time() - start < epb.DEFAULT_QUERY_TIMEOUT
+    assert getter.supports_info
+    assert getter.query_block(1, 2, 3, 'overworld') is None
+    assert len(getter.server.commands) == 2
+    assert len(getter.server.logger.warnings) == 1
+
+
+def test_rejected_info_block_stops_details_with_execute_backend():
+    getter = make_getter(rejected, query_backend='execute')
+    assert getter.query_block(1, 2, 3, 'overworld') is None
+    assert not getter.supports_info
+    assert getter.query_block(1, 2, 3, 'overworld') is None
+    assert len(getter.server.commands) == 1
+
+
+def loaded_handler(command: str) -> list:
+    if ' if loaded ' in command:
+        return ['Test passed']
+    return [BLOCK_INFO]
+
+
+def test_unrelated_rejection_keeps_loaded_probe():
+    getter = make_getter(lambda command: rejected('/forceload_typo') + loaded_handler(command))
+    assert getter.is_loaded(1, 2, 3, 'overworld') is True
+    assert getter.supports_loaded
+
+
+def test_rejected_loaded_probe_is_disabled():
+    # 1.19.4 以前的服务端没有 execute if loaded
+    getter = make_getter(lambda command: rejected(command) if ' if loaded ' in command else [BLOCK_INFO])
+    assert getter.is_loaded(1, 2, 3, 'overworld') is None
+    assert not getter.supports_loaded
+    assert getter.is_loaded(1, 2, 3, 'overworld') is None
+    assert len(getter.server.commands) == 1
+    assert getter.server.logger.warnings
+
+
+def test_waits_for_previous_instance_before_querying():
+    # 重载后旧实例仍在等待输出时，新实例不能发出指令，否则两边会拿走对方的响应
+    old_busy = threading.Event()
+    old_busy.set()
+    getter = make_getter(lambda command: ['Test passed'], previous_busy=old_busy.is_set)
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('loaded', getter.is_loaded(1, 2, 3, 'overworld')))
+    thread.start()
+    time.sleep(0.2)
+    assert getter.server.commands == []
+    old_busy.clear()
+    thread.join(timeout=2)
+    assert result['loaded'] is True
+    assert getter.previous_busy is None
+
+
+def door(**extra) -> epb.CheckPoint:
+    return epb.CheckPoint('door', {'x': 1, 'y': 2, 'z': 3, 'world': 'overworld', 'block': 'minecraft:piston',
+                                   'data': {'extended': 'false', 'facing': 'north'}, **extra})
+
+
+def test_rejected_predicate_falls_back_to_info_block():
+    # 手动修改的 allow 中有方块不接受的取值
+    def handler(command):
+        if ' if loaded ' in command:
+            return ['Test passed']
+        if ' if block ' in command:
+            return rejected(command)
+        return [BLOCK_INFO]
+
+    getter = make_getter(handler)
+    item = door(match={'allow': {'extended': ['false', 'maybe']}})
+    assert item.predicates is not None
+    start = time.time()
+    with epb.QuerySession(getter, [item], 'fail', 'execute') as access:
+        assert access.test(item) == (True, False)
+    assert time.time() - start < epb.DEFAULT_QUERY_TIMEOUT
+    assert item.predicates is None
+    assert any('door' in warning for warning in getter.server.logger.warnings)
+    with epb.QuerySession(getter, [item], 'fail', 'execute') as access:
+        assert access.test(item) == (True, False)
+    assert sum(' if block ' in command for command in getter.server.commands) == 1
+
+
+def test_predicates_are_used_with_execute_backend():
+    getter = make_getter(lambda command: ['Test passed'] if ' if ' in command else [BLOCK_INFO])
+    item = door()
+    with epb.QuerySession(getter, [item], 'fail', 'execute') as access:
+        assert access.test(item) == (True, False)
+    assert not any('info block' in command for command in getter.server.commands)
+
+
+VALUE = re.compile(r'value (?P<value>\w+)')
+
+
+def barrier_reply(command: str) -> list:
+    """屏障指令读取不存在的记分项，报错中带有记分项名"""
+    return [f"Unknown scoreboard objective '{command.split()[-1]}'"]
+
+
+def dropping(count: int):
+    """前 count 条查询指令没有响应（如被其他输出淹没），之后正常响应"""
+    calls = []
+
+    def handler(command):
+        if command.startswith('/scoreboard players get #epb '):
+            return barrier_reply(command)
+        calls.append(command)
+        return [] if len(calls) <= count else [f'value v{len(calls)}']
+    return handler
+
+
+def test_retries_after_timeout_and_fences_lost_replies():
+    getter = make_getter(dropping(2))
+    m = getter._wait_output('/get', VALUE, None, 0.1, None, 2)
+    assert m.group('value') == 'v3'
+    assert getter.server.commands[:3] == ['/get'] * 3
+    # 前两条指令的响应可能迟到，发送屏障
+    assert getter.server.commands[3].startswith('/scoreboard players get #epb epb_sync_')
+    assert len(getter.latency.samples()) == 1
+
+
+def test_hedge_sends_second_command_before_timeout():
+    getter = make_getter(dropping(1))
+    start = time.time()
+    m = getter._wait_output('/get', VALUE, None, 1, 0.05, 0)
+    assert time.time() - start < 0.5
+    assert m.group('value') == 'v2'
+    assert getter.server.commands[:2] == ['/get'] * 2
+
+
+def test_no_barrier_when_every_command_answered():
+    getter = make_getter(dropping(0))
+    assert getter._wait_output('/get', VALUE, None, 1, None, 2).group('value') == 'v1'
+    time.sleep(0.05)
+    assert getter.server.commands == ['/get']
+    assert getter._barrier is None
+
+
+def test_late_reply_is_not_taken_by_next_query():
+    held = []
+
+    def handler(command):
+        if command.startswith('/scoreboard players get #epb '):
+            held.append(command)
+            return []
+        return [] if command == '/get a' else ['value fresh']
+
+    getter = make_getter(handler)
+    assert getter._wait_output('/get a', VALUE, None, 0.05, None, 0) is None
+    assert len(held) == 1
+
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('m', getter._wait_output('/get b', VALUE, None, 1, None, 0)))
+    thread.start()
+    time.sleep(0.05)
+    # 屏障响应之前到达的是 /get a 迟到的响应
+    getter.on_info(Info('value stale'))
+    assert '/get b' not in getter.server.commands
+    for line in barrier_reply(held[0]):
+        getter.on_info(Info(line))
+    thread.join(timeout=2)
+    assert result['m'].group('value') == 'fresh'
+
+
+def test_timeouts_follow_latency():
+    getter = make_getter(dropping(0))
+    assert getter._timeouts() == (epb.DEFAULT_QUERY_TIMEOUT, None)
+    getter.latency.extend([0.1] * epb.LATENCY_MIN_SAMPLES)
+    assert getter._timeouts() == (0.1 * epb.TIMEOUT_FACTOR, 0.1)
+    getter.hedge = False
+    assert getter._timeouts() == (0.1 * epb.TIMEOUT_FACTOR, None)
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+pytest.importorskip('mcdreforged')
+
+import extra_prime_backup as epb  # noqa: E402
+
+
+def checkpoint(path: str, **item) -> epb.CheckPoint:
+    base = {'x': 1, 'y': 64, 'z': -2, 'block': 'minecraft:lever', 'data': {'powered': 'false'}}
+    base.update(item)
+    return epb.CheckPoint(path, base)
+
+
+LEVER = checkpoint('base.lever')
+PISTON = checkpoint('base.piston', world='the_nether', block='minecraft:piston', data={'extended': 'false'},
+                    match={'allow': {'extended': ['false', 'true']}})
+# 要求属性不存在，无法用谓词表达
+ABSENT = checkpoint('base.absent', match={'properties': ['powered', 'waterlogged']})
+CHEST = checkpoint('base.chest', block='minecraft:chest', data={}, nbt={'Items': []})
+
+
+def test_function_only_contains_expressible_checkpoints():
+    content, ids, generation = epb.build_datapack_function([LEVER, ABSENT, CHEST, PISTON])
+    assert ids == [LEVER, PISTON]
+    lines = content.splitlines()
+    assert f'scoreboard players set #generation epb_check {generation}' in lines
+    assert 'execute in minecraft:overworld if loaded 1 64 -2 if block 1 64 -2 minecraft:lever[powered=false] ' \
+           'run scoreboard players set #cp0 epb_check 0' in lines
+    assert [line for line in lines if line.startswith('execute in minecraft:the_nether')] == [
+        'execute in minecraft:the_nether if loaded 1 64 -2 if block 1 64 -2 minecraft:piston[extended=false] '
+        'run scoreboard players set #cp1 epb_check 0',
+        'execute in minecraft:the_nether if loaded 1 64 -2 if block 1 64 -2 minecraft:piston[extended=true] '
+        'run scoreboard players set #cp1 epb_check 0']
+    assert 'base.absent' not in content and 'base.chest' not in content
+
+
+def test_generation_is_stable_and_follows_content():
+    _, _, generation = epb.build_datapack_function([LEVER, PISTON])
+    assert epb.build_datapack_function([LEVER, PISTON])[2] == generation
+    assert epb.build_datapack_function([LEVER, PISTON, CHEST])[2] == generation
+    assert epb.build_datapack_function([PISTON, LEVER])[2] != generation
+    assert epb.build_datapack_function([LEVER, checkpoint('base.piston', y=65)])[2] != generation
+    # 记分板分数为 32 位整数
+    assert 0 <= generation < 2 ** 31
+
+
+class Logger:
+    def __init__(self):
+        self.warnings = []
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+
+class Server:
+    def __init__(self):
+        self.logger = Logger()
+
+
+class Getter:
+    def __init__(self, scores: dict):
+        self._lock = threading.RLock()
+        self.scores = scores
+        self.sent = []
+
+    def send(self, command: str):
+        self.sent.append(command)
+
+    def get_score(self, holder: str, objective: str):
+        return self.scores.get(holder)
+
+
+@pytest.fixture
+def datapack(monkeypatch):
+    content, ids, generation = epb.build_datapack_function([LEVER, PISTON])
+    monkeypatch.setattr(epb, 'DATAPACK_STATE', (ids, generation))
+    monkeypatch.setattr(epb, 'PlServer', Server())
+    return generation
+
+
+def test_gate_reports_failed_checkpoints(datapack):
+    getter = Getter({'#generation': datapack, '#failed': 1, '#cp0': 0, '#cp1': 1})
+    assert epb.run_datapack_gate(getter) == ([PISTON], [LEVER, PISTON])
+    assert getter.sent[-1] == '/function extra_prime_backup:check'
+    assert epb.run_datapack_gate(Getter({'#generation': datapack, '#failed': 0})) == ([], [LEVER, PISTON])
+
+
+def test_gate_ignores_stale_function(datapack):
+    assert epb.run_datapack_gate(Getter({'#generation': datapack + 1, '#failed': 0})) is None
+    assert epb.run_datapack_gate(Getter({'#failed': 0})) is None
+    assert len(epb.PlServer.logger.warnings) == 2
+    assert epb.run_datapack_gate(Getter({'#generation': datapack})) is None
@@ -0,0 +1,93 @@
+import functools
+import threading
+
+import pytest
+
+pytest.importorskip('mcdreforged')
+
+import extra_prime_backup as epb  # noqa: E402
+
+
+class Logger:
+    def exception(self, message):
+        pass
+
+
+class Server:
+    logger = Logger()
+
+
+class Source:
+    def __init__(self):
+        self.replies = []
+
+    def reply(self, message):
+        self.replies.append(message)
+
+
+@pytest.fixture
+def executor():
+    executor = epb.CommandExecutor(Server(), worker_count=1, queue_size=2)
+    yield executor
+    executor.hand_over(lambda *args: None)
+
+
+def block(executor: epb.CommandExecutor, source: Source) -> threading.Event:
+    """占住唯一的工作线程，直到返回的事件被设置"""
+    started, release = threading.Event(), threading.Event()
+
+    def task():
+        started.set()
+        release.wait(5)
+
+    assert executor.submit('block', source, task, ('block',))
+    assert started.wait(5)
+    return release
+
+
+def test_backup_dequeues_first_and_coalesces(executor):
+    source, order, done = Source(), [], threading.Event()
+    release = block(executor, source)
+    assert executor.busy
+
+    assert executor.submit('check', source, functools.partial(order.append, 'check'), ('check', 1))
+    assert not executor.submit('check', source, functools.partial(order.append, 'check'), ('check', 1))
+    assert source.replies == ['§e相同的请求已在队列中，请稍候']
+    assert executor.submit('backup', source, functools.partial(order.append, 'backup'), ('backup',), epb.PRIORITY_BACKUP)
+    assert executor.submit('done', source, done.set, ('done',))
+
+    release.set()
+    assert done.wait(5)
+    assert order == ['backup', 'check']
+
+
+def test_full_queue_rejects_interactive_but_not_backup(executor):
+    source = Source()
+    release = block(executor, source)
+    assert executor.submit('a', source, lambda: None, ('a',))
+    assert executor.submit('b', source, lambda: None, ('b',))
+    assert not executor.submit('c', source, lambda: None, ('c',))
+    assert source.replies == ['§c指令队列已满，请稍后再试']
+    assert executor.submit('backup', source, lambda: None, ('backup',), epb.PRIORITY_BACKUP)
+    release.set()
+
+
+def test_wait_backup_and_hand_over(executor):
+    source, forwarded = Source(), []
+    started, release = threading.Event(), threading.Event()
+
+    def backup():
+        started.set()
+        release.wait(5)
+
+    assert executor.submit('backup', source, backup, ('backup',), epb.PRIORITY_BACKUP)
+    assert started.wait(5)
+    assert not executor.wait_backup(0.05)
+    assert executor.submit('check', source, functools.partial(print, 'x'), ('check', 1))
+
+    # 排队中的任务交给新实例，正在执行的备份不受影响
+    executor.hand_over(lambda *args: forwarded.append(args))
+    assert forwarded == [('check', epb.PRIORITY_INTERACTIVE, ('check', 1), ('x',), {})]
+    assert not executor.submit('late', source, lambda: None, ('late',))
+    assert executor.busy
+    release.set()
@@ -0,0 +1,42 @@
+import pytest
+
+from history import CheckHistory, KIND_BACKUP, KIND_GATE
+
+
+@pytest.fixture
+def history(tmp_path):
+    return CheckHistory(str(tmp_path / 'history.db'))
+
+
+def test_latest_clean_backup_skips_failed_backups(history):
+    history.record(KIND_GATE, True, 2, 0.1, {}, [], backup_id=1)
+    history.record(KIND_GATE, True, 2, 0.1, {}, [], backup_id=2)
+    history.record(KIND_BACKUP, False, 2, 0.1, {'door': ('minecraft:piston', {'extended': 'true'})}, [], backup_id=2)
+    assert history.latest_clean_backup() == 1
+
+
+def test_latest_clean_backup_skips_unread_checkpoints(history):
+    history.record(KIND_BACKUP, True, 2, 0.1, {}, [], backup_id=1)
+    history.record(KIND_BACKUP, False, 2, 0.1, {}, ['door'], backup_id=2)
+    # 旧版本在缺少区块时仍记为通过
+    history.record(KIND_BACKUP, True, 2, 0.1, {}, ['door'], backup_id=3)
+    history.record(KIND_GATE, True, 2, 0.1, {}, [], backup_id=3)
+    assert history.latest_clean_backup() == 1
+
+
+def test_verdict_with_missing_entries_is_not_clean(history):
+    history.record(KIND_BACKUP, True, 2, 0.1, {}, ['door'], backup_id=3, sig='abc')
+    verdict = history.get_verdict(3, 'abc')
+    assert verdict['missing'] == ['door']
+    assert not verdict['clean']
+    assert history.get_verdict(3, 'other') is None
+
+
+def test_verdict_round_trip(history):
+    history.record(KIND_BACKUP, False, 3, 0.25, {'door': ('minecraft:piston', {'extended': 'true'}), 'lamp': None},
+                   ['farm'], backup_id=4, sig='abc')
+    verdict = history.get_verdict(4)
+    assert verdict['failed'] == {'door': ['minecraft:piston', {'extended': 'true'}], 'lamp': None}
+    assert verdict['missing'] == ['farm']
+    assert verdict['checked'] == 3
+    assert [v['backup_id'] for v in history.list_verdicts(10)] == [4]
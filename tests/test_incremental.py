@@ -0,0 +1,127 @@
+import json
+import os
+import struct
+
+import pytest
+
+pytest.importorskip('mcdreforged')
+
+import extra_prime_backup as epb  # noqa: E402
+import region  # noqa: E402
+
+
+class Logger:
+    def __init__(self):
+        self.warnings = []
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+
+class Server:
+    def __init__(self, data_folder: str):
+        self.logger = Logger()
+        self.data_folder = data_folder
+
+    def get_data_folder(self):
+        return self.data_folder
+
+
+class Getter:
+    def __init__(self, server: Server, saved: bool = True):
+        self.server = server
+        self.saved = saved
+        self.commands = []
+
+    def query(self, command, regex, **kwargs):
+        self.commands.append(command)
+        return object() if self.saved else None
+
+
+LEVER = epb.CheckPoint('base.lever', {'x': 1, 'y': 64, 'z': -2, 'block': 'minecraft:lever', 'data': {'powered': 'false'}})
+DOOR = epb.CheckPoint('base.door', {'x': 600, 'y': 64, 'z': 5, 'block': 'minecraft:oak_door', 'data': {'open': 'false'}})
+
+
+def write_timestamp(world_dir: str, item: epb.CheckPoint, timestamp: int):
+    path = region.get_region_file(world_dir, item.world, item.x, item.z)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    header = bytearray(2 * region.SECTOR_SIZE)
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            header = bytearray(f.read())
+    struct.pack_into('>I', header, region.SECTOR_SIZE + region.get_chunk_index(item.x, item.z) * 4, timestamp)
+    with open(path, 'wb') as f:
+        f.write(header)
+
+
+@pytest.fixture
+def world(tmp_path, monkeypatch):
+    cache = {}
+    server = Server(str(tmp_path))
+    monkeypatch.setattr(epb, 'PlServer', server)
+    monkeypatch.setattr(epb, 'get_world_dir', lambda: str(tmp_path / 'world'))
+    monkeypatch.setattr(epb, 'get_incremental_cache', lambda: cache)
+    write_timestamp(str(tmp_path / 'world'), LEVER, 1000)
+    write_timestamp(str(tmp_path / 'world'), DOOR, 1000)
+    return server, cache
+
+
+def test_skips_checkpoints_confirmed_after_last_save(world):
+    server, cache = world
+    tracker = epb.IncrementalTracker(Getter(server))
+    assert tracker.filter([LEVER, DOOR]) == [LEVER, DOOR]
+    tracker.record(LEVER, True)
+    tracker.record(DOOR, False)
+    assert cache['base.lever']['ts'] == 1000 and 'base.door' not in cache
+
+    tracker = epb.IncrementalTracker(Getter(server))
+    assert tracker.filter([LEVER, DOOR]) == [DOOR]
+    assert tracker.getter.commands == ['/save-all flush']
+
+
+def test_rechecks_after_chunk_saved_or_config_changed(world, tmp_path):
+    server, cache = world
+    tracker = epb.IncrementalTracker(Getter(server))
+    tracker.filter([LEVER])
+    tracker.record(LEVER, True)
+
+    write_timestamp(str(tmp_path / 'world'), LEVER, 2000)
+    assert epb.IncrementalTracker(Getter(server)).filter([LEVER]) == [LEVER]
+
+    write_timestamp(str(tmp_path / 'world'), LEVER, 1000)
+    moved = epb.CheckPoint('base.lever', {'x': 1, 'y': 65, 'z': -2, 'block': 'minecraft:lever', 'data': {'powered': 'false'}})
+    assert epb.IncrementalTracker(Getter(server)).filter([moved]) == [moved]
+
+    # 与确认时间在同一秒内保存的区块不能跳过
+    cache['base.lever']['verified_at'] = 1000.5
+    assert epb.IncrementalTracker(Getter(server)).filter([LEVER]) == [LEVER]
+
+
+def test_no_skip_without_save_or_region(world, tmp_path):
+    server, cache = world
+    tracker = epb.IncrementalTracker(Getter(server))
+    tracker.filter([LEVER])
+    tracker.record(LEVER, True)
+
+    getter = Getter(server, saved=False)
+    assert epb.IncrementalTracker(getter).filter([LEVER]) == [LEVER]
+    assert len(server.logger.warnings) == 1
+
+    os.remove(region.get_region_file(str(tmp_path / 'world'), LEVER.world, LEVER.x, LEVER.z))
+    tracker = epb.IncrementalTracker(Getter(server))
+    assert tracker.filter([LEVER]) == [LEVER]
+    # 区块不存在时不记录确认结果，并清除旧记录
+    tracker.record(LEVER, True)
+    assert 'base.lever' not in cache
+
+
+def test_save_writes_only_when_changed(world, tmp_path):
+    server, cache = world
+    tracker = epb.IncrementalTracker(Getter(server))
+    tracker.save()
+    assert not os.path.exists(tmp_path / epb.INCREMENTAL_CACHE_FILE)
+    tracker.filter([LEVER])
+    tracker.record(LEVER, True)
+    tracker.save()
+    with open(tmp_path / epb.INCREMENTAL_CACHE_FILE, encoding='utf8') as f:
+        assert json.load(f) == cache
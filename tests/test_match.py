@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip('mcdreforged')
+
+import extra_prime_backup as epb  # noqa: E402
+
+
+def rule(block: str, data: dict, config: dict) -> epb.MatchRule:
+    return epb.MatchRule(epb.intern_block(block), epb.intern_state(data), config)
+
+
+def test_predicates_without_rule():
+    state = epb.intern_state({'powered': 'false', 'facing': 'north'})
+    assert epb.build_predicates('minecraft:lever', state, None) == ('minecraft:lever[facing=north,powered=false]',)
+
+
+def test_predicates_expand_allowed_values():
+    match = rule('minecraft:piston', {'extended': 'false', 'facing': 'north'},
+                 {'ignore': ['facing'], 'allow': {'extended': ['false', 'true']}})
+    assert epb.build_predicates('minecraft:piston', (), match) == (
+        'minecraft:piston[extended=false]', 'minecraft:piston[extended=true]')
+
+
+def test_alternative_blocks_only_without_properties():
+    # 额外允许的方块可能没有主方块的属性，带属性时无法用谓词表达
+    with_props = rule('minecraft:oak_door', {'open': 'false'}, {'blocks': ['minecraft:iron_door']})
+    assert epb.build_predicates('minecraft:oak_door', (), with_props) is None
+    without_props = rule('minecraft:oak_door', {'open': 'false'}, {'blocks': ['minecraft:iron_door'], 'properties': []})
+    assert epb.build_predicates('minecraft:oak_door', (), without_props) == ('minecraft:iron_door', 'minecraft:oak_door')
+
+
+def test_predicates_fall_back_when_rule_is_not_expressible():
+    # 要求属性不存在无法用谓词表达
+    absent = rule('minecraft:lever', {'powered': 'false'}, {'properties': ['powered', 'waterlogged']})
+    assert epb.build_predicates('minecraft:lever', (), absent) is None
+    many = rule('minecraft:note_block', {}, {'allow': {'note': [str(i) for i in range(epb.MAX_PREDICATES + 1)]}})
+    assert epb.build_predicates('minecraft:note_block', (), many) is None
+
+
+def test_json_booleans_match_server_values():
+    # 手动编辑配置时容易把属性写成 JSON 布尔值
+    assert epb.intern_state({'powered': False, 'facing': 'north'}) is epb.intern_state({'facing': 'north', 'powered': 'false'})
+    item = epb.CheckPoint('lever', {'x': 0, 'y': 0, 'z': 0, 'block': 'minecraft:lever', 'data': {'powered': False}})
+    assert item.matches(epb.intern_block('minecraft:lever'), epb.intern_state({'powered': 'false'}))
+    assert item.predicates == ('minecraft:lever[powered=false]',)
+
+
+def test_rule_compares_data_properties_by_default():
+    match = rule('minecraft:repeater', {'delay': '2', 'facing': 'east'}, {})
+    assert match.state_matches(epb.intern_state({'delay': '2', 'facing': 'east', 'locked': 'false'}))
+    assert not match.state_matches(epb.intern_state({'delay': '3', 'facing': 'east'}))
+    assert not match.state_matches(epb.intern_state({'facing': 'east'}))
+
+
+def test_rule_ignore_properties_and_allow():
+    match = rule('minecraft:repeater', {'delay': '2', 'facing': 'east', 'powered': 'false'},
+                 {'ignore': ['powered'], 'properties': ['delay', 'powered'], 'allow': {'delay': [2, '3']}})
+    assert sorted(match.allowed) == ['delay']
+    assert match.state_matches(epb.intern_state({'delay': '3', 'facing': 'west', 'powered': 'true'}))
+    assert match.state_matches(epb.intern_state({'delay': '2'}))
+    assert not match.state_matches(epb.intern_state({'delay': '4'}))
+
+
+def test_rule_blocks_and_absent_property():
+    match = rule('minecraft:oak_door', {}, {'blocks': ['minecraft:iron_door'], 'properties': ['powered']})
+    assert match.block_matches(epb.intern_block('minecraft:iron_door'))
+    assert not match.block_matches(epb.intern_block('minecraft:spruce_door'))
+    # data 中没有的属性要求实际方块也没有
+    assert match.state_matches(epb.intern_state({'open': 'true'}))
+    assert not match.state_matches(epb.intern_state({'powered': 'false'}))
+
+
+def test_rule_caches_verdict_per_state():
+    match = rule('minecraft:lever', {'powered': 'false'}, {})
+    state = epb.intern_state({'powered': 'true'})
+    assert not match.state_matches(state)
+    assert match._cache == {state: False}
+    assert match.state_matches(epb.intern_state({'powered': 'false'}))
+    assert len(match._cache) == 2
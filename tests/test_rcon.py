@@ -0,0 +1,179 @@
+import socketserver
+import struct
+import threading
+
+import pytest
+
+from rcon import RconClient, RconPool, RconError, PACKET_COMMAND, PACKET_LOGIN, PACKET_RESPONSE
+
+PASSWORD = 'secret'
+# 服务端单个响应包的最大长度
+CHUNK = 4096
+
+
+def recv_exact(sock, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return b''
+        data += chunk
+    return data
+
+
+def read_packet(sock):
+    header = recv_exact(sock, 4)
+    if not header:
+        return None
+    length, = struct.unpack('<i', header)
+    data = recv_exact(sock, length)
+    if not data:
+        return None
+    packet_id, packet_type = struct.unpack_from('<ii', data)
+    return packet_id, packet_type, data[8:-2].decode('utf8')
+
+
+def write_packet(sock, packet_id: int, packet_type: int, body: str):
+    data = struct.pack('<ii', packet_id, packet_type) + body.encode('utf8') + b'\x00\x00'
+    sock.sendall(struct.pack('<i', len(data)) + data)
+
+
+class FakeRconHandler(socketserver.BaseRequestHandler):
+    """按 Minecraft 的方式响应：长响应拆成多个包，未知类型的请求回复 Unknown request"""
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        authed = False
+        while True:
+            packet = read_packet(self.request)
+            if packet is None:
+                return
+            packet_id, packet_type, body = packet
+            if packet_type == PACKET_LOGIN:
+                authed = body == server.password
+                write_packet(self.request, packet_id if authed else -1, PACKET_COMMAND, '')
+            elif not authed:
+                return
+            elif packet_type == PACKET_COMMAND:
+                if body == 'disconnect':
+                    return
+                text = server.responses.get(body, '')
+                for i in range(0, max(1, len(text)), CHUNK):
+                    write_packet(self.request, packet_id, PACKET_RESPONSE, text[i:i + CHUNK])
+            else:
+                write_packet(self.request, packet_id, PACKET_RESPONSE, f'Unknown request {packet_type:x}')
+
+
+class FakeRconServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeRconHandler)
+        self.password = PASSWORD
+        self.responses = {}
+        self.connections = 0
+        self.lock = threading.Lock()
+
+
+@pytest.fixture
+def server():
+    server = FakeRconServer()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server, password=PASSWORD) -> RconClient:
+    host, port = server.server_address
+    return RconClient(host, port, password, timeout=2)
+
+
+def test_login_failure(server):
+    client = make_client(server, 'wrong')
+    with pytest.raises(RconError):
+        client.connect()
+    assert client._sock is None
+
+
+def test_single_packet_response(server):
+    server.responses['info block 1 2 3'] = 'Block info for minecraft:lever, powered=false'
+    client = make_client(server)
+    try:
+        assert client.command('info block 1 2 3') == 'Block info for minecraft:lever, powered=false'
+        assert client.command('unknown') == ''
+    finally:
+        client.close()
+
+
+def test_multi_packet_response(server):
+    text = ''.join(chr(ord('a') + i % 26) for i in range(CHUNK * 2 + 100))
+    server.responses['data get block 1 2 3'] = text
+    client = make_client(server)
+    try:
+        assert client.command('data get block 1 2 3') == text
+    finally:
+        client.close()
+
+
+def test_end_marker_separates_responses(server):
+    # 响应长度恰好是单个包上限的整数倍时，只能依靠结束标记判断响应已接收完毕
+    server.responses['a'] = 'x' * CHUNK
+    server.responses['b'] = 'second'
+    client = make_client(server)
+    try:
+        assert client.command('a') == 'x' * CHUNK
+        assert client.command('b') == 'second'
+    finally:
+        client.close()
+
+
+def test_connection_closed(server):
+    client = make_client(server)
+    with pytest.raises(RconError):
+        client.command('disconnect')
+    client.close()
+
+
+def test_pool_reuses_connections(server):
+    server.responses['list'] = 'There are 0 of a max of 20 players online: '
+    host, port = server.server_address
+    pool = RconPool(host, port, PASSWORD, size=2, timeout=2)
+    try:
+        for _ in range(5):
+            assert pool.query('list').startswith('There are 0')
+        assert server.connections == 1
+    finally:
+        pool.close()
+
+
+def test_pool_drops_broken_connection(server):
+    server.responses['list'] = 'ok'
+    host, port = server.server_address
+    pool = RconPool(host, port, PASSWORD, size=1, timeout=2)
+    try:
+        with pytest.raises(RconError):
+            pool.query('disconnect')
+        assert pool.query('list') == 'ok'
+        assert server.connections == 2
+    finally:
+        pool.close()
+
+
+def test_pool_hands_over_connections(server):
+    server.responses['list'] = 'ok'
+    host, port = server.server_address
+    old = RconPool(host, port, PASSWORD, size=2, timeout=2)
+    assert old.query('list') == 'ok'
+    new = RconPool(host, port, PASSWORD, size=2, timeout=2)
+    try:
+        new.adopt_connections(old.export_connections())
+        old.close()
+        assert new.query('list') == 'ok'
+        assert server.connections == 1
+    finally:
+        new.close()
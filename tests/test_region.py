@@ -0,0 +1,141 @@
+import struct
+import zlib
+
+import pytest
+
+import region
+
+
+class LongArray(list):
+    pass
+
+
+def nbt_payload(value) -> bytes:
+    if isinstance(value, dict):
+        body = b''.join(bytes([nbt_tag(v)]) + nbt_string(k) + nbt_payload(v) for k, v in value.items())
+        return body + b'\x00'
+    if isinstance(value, LongArray):
+        return struct.pack('>i', len(value)) + b''.join(struct.pack('>q', v) for v in value)
+    if isinstance(value, list):
+        tag = nbt_tag(value[0]) if value else 0
+        return struct.pack('>bi', tag, len(value)) + b''.join(nbt_payload(v) for v in value)
+    if isinstance(value, str):
+        return nbt_string(value)
+    return struct.pack('>i', value)
+
+
+def nbt_tag(value) -> int:
+    if isinstance(value, dict):
+        return 10
+    if isinstance(value, LongArray):
+        return 12
+    if isinstance(value, list):
+        return 9
+    if isinstance(value, str):
+        return 8
+    return 3
+
+
+def nbt_string(value: str) -> bytes:
+    data = value.encode('utf8')
+    return struct.pack('>H', len(data)) + data
+
+
+def nbt_file(root: dict) -> bytes:
+    return b'\x0a' + nbt_string('') + nbt_payload(root)
+
+
+def signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def pack(indices: list, bits: int, spanning: bool) -> LongArray:
+    """按区块格式打包调色板下标，spanning 为 1.16 以前跨 long 存储的格式"""
+    if spanning:
+        total = 0
+        for i, value in enumerate(indices):
+            total |= value << (i * bits)
+        count = (len(indices) * bits + 63) // 64
+        return LongArray(signed((total >> (64 * i)) & 0xFFFFFFFFFFFFFFFF) for i in range(count))
+    per_long = 64 // bits
+    longs = []
+    for start in range(0, len(indices), per_long):
+        value = 0
+        for slot, index in enumerate(indices[start:start + per_long]):
+            value |= index << (slot * bits)
+        longs.append(signed(value))
+    return LongArray(longs)
+
+
+def palette(size: int) -> list:
+    return [{'Name': 'minecraft:air'}] + [
+        {'Name': 'minecraft:repeater', 'Properties': {'delay': str(i), 'powered': 'false'}} for i in range(1, size)]
+
+
+def section_index(x: int, y: int, z: int) -> int:
+    return ((y & 15) << 8) | ((z & 15) << 4) | (x & 15)
+
+
+POSITIONS = [(0, 64, 0), (15, 79, 15), (3, 70, 9), (-1, 64, -1), (7, 66, 12)]
+
+
+def new_chunk(entries: list, bits: int) -> dict:
+    indices = [i % len(entries) for i in range(4096)]
+    return {'DataVersion': 3465, 'sections': [
+        {'Y': 4, 'block_states': {'palette': entries, 'data': pack(indices, bits, False)}}],
+        'block_entities': [{'id': 'minecraft:chest', 'x': 3, 'y': 70, 'z': 9, 'Items': []}]}
+
+
+@pytest.mark.parametrize('size, bits', [(2, 4), (17, 5), (40, 6)])
+def test_new_format_packed_states(size, bits):
+    entries = palette(size)
+    chunk = new_chunk(entries, bits)
+    for x, y, z in POSITIONS:
+        entry = entries[section_index(x, y, z) % size]
+        assert region.get_block_from_chunk(chunk, x, y, z) == (entry['Name'], entry.get('Properties', {}))
+
+
+def test_old_format_spanning_states():
+    # 1.16 以前 5 位的下标会跨越两个 long
+    entries = palette(20)
+    indices = [(i * 7) % 20 for i in range(4096)]
+    chunk = {'DataVersion': 2230, 'Level': {'Sections': [
+        {'Y': 4, 'Palette': entries, 'BlockStates': pack(indices, 5, True)}]}}
+    for x, y, z in POSITIONS:
+        entry = entries[indices[section_index(x, y, z)]]
+        assert region.get_block_from_chunk(chunk, x, y, z) == (entry['Name'], entry.get('Properties', {}))
+
+
+def test_single_entry_palette_and_missing_section():
+    chunk = {'DataVersion': 3465, 'sections': [{'Y': 4, 'block_states': {'palette': [{'Name': 'minecraft:stone'}]}}]}
+    assert region.get_block_from_chunk(chunk, 1, 70, 1) == ('minecraft:stone', {})
+    assert region.get_block_from_chunk(chunk, 1, 200, 1) is None
+
+
+def build_region(chunk: dict, x: int, z: int, timestamp: int) -> bytes:
+    data = zlib.compress(nbt_file(chunk))
+    payload = struct.pack('>iB', len(data) + 1, 2) + data
+    sectors = (len(payload) + region.SECTOR_SIZE - 1) // region.SECTOR_SIZE
+    header = bytearray(2 * region.SECTOR_SIZE)
+    index = region.get_chunk_index(x, z)
+    struct.pack_into('>I', header, index * 4, (2 << 8) | sectors)
+    struct.pack_into('>I', header, region.SECTOR_SIZE + index * 4, timestamp)
+    return bytes(header) + payload.ljust(sectors * region.SECTOR_SIZE, b'\x00')
+
+
+def test_read_from_region_file(tmp_path):
+    entries = palette(17)
+    data = build_region(new_chunk(entries, 5), 3, 9, 1700000000)
+    region_dir = tmp_path / 'DIM-1' / 'region'
+    region_dir.mkdir(parents=True)
+    (region_dir / 'r.0.0.mca').write_bytes(data)
+
+    entry = entries[section_index(3, 70, 9) % 17]
+    assert region.read_block(str(tmp_path), 'the_nether', 3, 70, 9) == (entry['Name'], entry.get('Properties', {}))
+    assert region.read_block_entity(str(tmp_path), 'the_nether', 3, 70, 9)['id'] == 'minecraft:chest'
+    assert region.read_block_entity(str(tmp_path), 'the_nether', 4, 70, 9) == {}
+    # 同一区域文件中不存在的区块与不存在的区域文件
+    assert region.read_block(str(tmp_path), 'the_nether', 40, 70, 9) is None
+    assert region.read_block(str(tmp_path), 'overworld', 3, 70, 9) is None
+    assert region.read_chunk_timestamp(data[:2 * region.SECTOR_SIZE], 3, 9) == 1700000000
+    assert region.read_chunk_timestamp(data[:2 * region.SECTOR_SIZE], 40, 9) == 0
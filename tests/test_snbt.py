@@ -0,0 +1,86 @@
+import pytest
+
+import snbt
+from snbt import MISSING, SnbtError, extract, parse_path, resolve
+
+CHEST = ('{x: 1, y: 64, z: -3, Items: [{Slot: 0b, id: "minecraft:stone", count: 64}, '
+         '{Slot: 5b, id: "minecraft:written_book", count: 1, components: {"minecraft:written_book_content": '
+         '{pages: [{raw: \'{"text":"a ] } \\\\" quote"}\'}], title: {raw: "t"}}}}], '
+         'CustomName: \'{"text":"Sorter [1]"}\', Lock: "", id: "minecraft:chest", keepPacked: 0b}')
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('Items', ('Items',)),
+    ('Items[0].id', ('Items', 0, 'id')),
+    ('Items[-1]', ('Items', -1)),
+    ('a.b.c', ('a', 'b', 'c')),
+    ('"minecraft:custom_data".flag', ('minecraft:custom_data', 'flag')),
+    ('components."minecraft:container"[2]', ('components', 'minecraft:container', 2)),
+])
+def test_parse_path(path, expected):
+    assert parse_path(path) == expected
+
+
+@pytest.mark.parametrize('path', ['', 'a.', '.a', 'a..b', 'a[x]', 'a[0', '"a', 'a[0]b'])
+def test_parse_path_invalid(path):
+    with pytest.raises(SnbtError):
+        parse_path(path)
+
+
+def test_extract_scalars():
+    result = extract(CHEST, [('x',), ('z',), ('id',), ('Lock',), ('keepPacked',)])
+    assert result == {('x',): 1, ('z',): -3, ('id',): 'minecraft:chest', ('Lock',): '', ('keepPacked',): 0}
+
+
+def test_extract_skips_strings_with_brackets():
+    # 跳过的子树中字符串里的括号与转义引号不影响后续字段
+    result = extract(CHEST, [('CustomName',), ('Items', 1, 'count')])
+    assert result == {('CustomName',): '{"text":"Sorter [1]"}', ('Items', 1, 'count'): 1}
+
+
+def test_extract_list_elements():
+    result = extract(CHEST, [('Items', 0, 'id'), ('Items', -1, 'Slot'), ('Items', 5, 'id')])
+    assert result == {('Items', 0, 'id'): 'minecraft:stone', ('Items', -1, 'Slot'): 5}
+
+
+def test_extract_whole_subtree_and_nested_path():
+    result = extract(CHEST, [('Items', 0), ('Items', 0, 'count')])
+    assert result[('Items', 0)] == {'Slot': 0, 'id': 'minecraft:stone', 'count': 64}
+    assert result[('Items', 0, 'count')] == 64
+
+
+def test_extract_missing_path():
+    assert extract(CHEST, [('Nope',), ('Items', 0, 'tag')]) == {}
+    assert extract(CHEST, []) == {}
+
+
+@pytest.mark.parametrize('text, value', [
+    ('{v: 3b}', 3), ('{v: -2s}', -2), ('{v: 10L}', 10), ('{v: 1.5f}', 1.5), ('{v: 2.0d}', 2.0),
+    ('{v: 1e3}', 1000.0), ('{v: true}', True), ('{v: false}', False), ('{v: "a\\\\nb"}', 'a\\nb'),
+    ("{v: 'it\\'s'}", "it's"), ('{v: [I; 1, -2, 3]}', [1, -2, 3]), ('{v: [B;]}', []), ('{v: []}', []),
+])
+def test_extract_value_types(text, value):
+    assert extract(text, [('v',)]) == {('v',): value}
+
+
+def test_extract_negative_index_in_typed_array():
+    assert extract('{v: [L; 1L, 2L, 3L]}', [('v', -1)]) == {('v', -1): 3}
+
+
+def test_extract_stops_after_all_paths_found():
+    # 所有路径都已找到后不再扫描，之后的内容即使不完整也不会报错
+    assert extract('{a: 1, b: {c: [', [('a',)]) == {('a',): 1}
+
+
+@pytest.mark.parametrize('text', ['{a: {b: 1', '{a: "unterminated', '{a: [1, 2'])
+def test_extract_truncated_input(text):
+    with pytest.raises(SnbtError):
+        extract(text, [('z',)])
+
+
+def test_resolve():
+    value = {'Items': [{'id': 'a'}, {'id': 'b'}]}
+    assert resolve(value, ('Items', -1, 'id')) == 'b'
+    assert resolve(value, ('Items', 2)) is MISSING
+    assert resolve(value, ('Items', 'id')) is MISSING
+    assert resolve(value, ('Other',)) is snbt.MISSING
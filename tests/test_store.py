@@ -0,0 +1,97 @@
+import pytest
+
+from store import CheckpointStore, thaw_tree
+
+
+def checkpoint(x, block='minecraft:lever', **extra):
+    return {'type': 'checkpoint', 'x': x, 'y': 64, 'z': -x, 'world': 'overworld', 'block': block,
+            'data': {'powered': 'false'}, **extra}
+
+
+def group(children, description=''):
+    return {'type': 'group', 'description': description, 'children': children}
+
+
+@pytest.fixture
+def tree():
+    return {
+        'door': checkpoint(1, match={'ignore': ['facing']}),
+        'farm': group({
+            'a': checkpoint(2),
+            'b': checkpoint(3, nbt={'Items': []}),
+            'sub': group({'c': checkpoint(4)}, 'nested'),
+        }, 'farms'),
+        'farm2': group({'d': checkpoint(5)}),
+    }
+
+
+@pytest.fixture
+def store(tmp_path, tree):
+    store = CheckpointStore(str(tmp_path / 'checkpoints.db'))
+    assert store.apply({}, tree) == 8
+    return store
+
+
+def test_round_trip(store, tree):
+    loaded = store.load_tree()
+    assert loaded == tree
+    assert list(loaded) == ['door', 'farm', 'farm2']
+    assert list(loaded['farm']['children']) == ['a', 'b', 'sub']
+
+
+def test_get_and_count(store, tree):
+    assert store.get('farm.sub.c') == tree['farm']['children']['sub']['children']['c']
+    assert store.get('farm')['children'] == {}
+    assert store.get('missing') is None
+    assert store.count_checkpoints() == 5
+    # farm2 不属于 farm
+    assert store.count_checkpoints('farm') == 3
+    assert store.count_checkpoints('farm.sub') == 1
+    assert store.count_checkpoints('door') == 1
+
+
+def test_apply_unchanged_writes_nothing(store, tree):
+    assert store.apply(tree, thaw_tree(tree)) == 0
+
+
+def test_apply_writes_only_changed_rows(store, tree):
+    new = thaw_tree(tree)
+    new['farm']['children']['a'] = checkpoint(2, block='minecraft:piston')
+    assert store.apply(tree, new) == 1
+    assert store.load_tree() == new
+
+
+def test_apply_group_description(store, tree):
+    new = thaw_tree(tree)
+    new['farm']['description'] = 'renamed'
+    assert store.apply(tree, new) == 1
+    assert store.get('farm')['description'] == 'renamed'
+
+
+def test_apply_insert_appends(store, tree):
+    new = thaw_tree(tree)
+    new['farm']['children']['e'] = checkpoint(6)
+    new['first'] = checkpoint(7)
+    assert store.apply(tree, new) == 2
+    loaded = store.load_tree()
+    assert list(loaded['farm']['children']) == ['a', 'b', 'sub', 'e']
+    assert list(loaded) == ['door', 'farm', 'farm2', 'first']
+
+
+def test_apply_delete_group_removes_descendants(store, tree):
+    new = thaw_tree(tree)
+    del new['farm']
+    # farm、a、b、sub、c
+    assert store.apply(tree, new) == 5
+    assert store.count_checkpoints() == 2
+    assert store.get('farm.sub.c') is None
+    assert store.load_tree() == new
+
+
+def test_apply_type_change(store, tree):
+    new = thaw_tree(tree)
+    new['door'] = group({'x': checkpoint(8)})
+    new['farm2'] = checkpoint(9)
+    store.apply(tree, new)
+    assert store.load_tree() == new
+    assert store.get('farm2.d') is None